@@ -0,0 +1,74 @@
+"""Queries per authenticated page: stock auth stack vs. fast mode.
+
+Run from the project root: ``python benchmarks/bench_auth_queries.py``.
+It builds a throwaway test database, so the real one is not touched.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.contrib.auth import get_user_model  # noqa: E402
+from django.core.cache import cache  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test import Client, override_settings  # noqa: E402
+from django.test.utils import (CaptureQueriesContext,  # noqa: E402
+                               setup_test_environment)
+
+PAGES = ('/new/', '/follow/', '/notifications/')
+
+# Fast mode needs a shared cache; in this single process LocMem is one.
+FAST = {
+    'SHARED_CACHE': True,
+    'SESSION_ENGINE': 'django.contrib.sessions.backends.cached_db',
+    }
+
+STOCK = {
+    'SESSION_ENGINE': 'django.contrib.sessions.backends.db',
+    'MIDDLEWARE': [
+        'django.contrib.auth.middleware.AuthenticationMiddleware'
+        if name == 'users.middleware.CachedAuthenticationMiddleware'
+        else name
+        for name in settings.MIDDLEWARE
+        ],
+    }
+
+
+def queries_per_page(user):
+    client = Client()
+    client.force_login(user)
+    counts = {}
+    for page in PAGES:
+        client.get(page)  # Warm caches.
+        with CaptureQueriesContext(connection) as queries:
+            client.get(page)
+        counts[page] = len(queries)
+    return counts
+
+
+def main():
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        user = get_user_model().objects.create_user('bench', password='1')
+        cache.clear()
+        with override_settings(**STOCK):
+            stock = queries_per_page(user)
+        cache.clear()
+        with override_settings(**FAST):
+            fast = queries_per_page(user)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+    print(f'{"page":<20}{"stock":>8}{"fast":>8}')
+    for page in PAGES:
+        print(f'{page:<20}{stock[page]:>8}{fast[page]:>8}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""Boot time of a fresh WSGI worker.
+
+Run from the project root: ``python benchmarks/bench_cold_start.py``.
+Every run imports ``yatube.wsgi`` in a new interpreter with the warm-up
+off, so only imports and app loading are measured; a boot is about
+0.5s on a laptop. ``manage.py importprofile`` shows where it goes.
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RUNS = 5
+
+SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+import yatube.wsgi
+print(json.dumps({
+    'seconds': time.perf_counter() - started,
+    'pillow': 'PIL' in sys.modules,
+    }))
+"""
+
+
+def boot():
+    env = dict(
+        os.environ,
+        DJANGO_SETTINGS_MODULE='yatube.settings',
+        YATUBE_WARM_UP='0',
+        )
+    output = subprocess.run(
+        [sys.executable, '-c', SCRIPT],
+        cwd=ROOT,
+        env=env,
+        stdout=subprocess.PIPE,
+        check=True,
+        ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def main():
+    results = [boot() for _ in range(RUNS)]
+    seconds = [result['seconds'] for result in results]
+    print(f'{"median":<12}{statistics.median(seconds) * 1000:8.1f} ms')
+    print(f'{"min":<12}{min(seconds) * 1000:8.1f} ms')
+    print(f'{"max":<12}{max(seconds) * 1000:8.1f} ms')
+    pillow = 'loaded' if results[0]['pillow'] else 'not loaded'
+    print(f'{"Pillow":<12}{pillow}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""Microbenchmark for the rate limiter allow path.
+
+Run from the project root: ``python benchmarks/bench_ratelimit.py``.
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.contrib.auth.models import AnonymousUser  # noqa: E402
+from django.test import RequestFactory  # noqa: E402
+
+from posts.ratelimit import TokenBucket, is_allowed  # noqa: E402
+
+NUMBER = 200000
+
+
+def report(name, seconds, number):
+    print(f'{name:<32} {seconds / number * 1e6:8.3f} us/call')
+
+
+def main():
+    bucket = TokenBucket(capacity=10 ** 9, fill_rate=10 ** 6)
+    state = (bucket.capacity, 0.0)
+    seconds = timeit.timeit(
+        lambda: bucket.consume(state, 1.0),
+        number=NUMBER,
+        )
+    report('TokenBucket.consume', seconds, NUMBER)
+
+    # A huge rate keeps every call on the allow path.
+    settings.RATELIMIT_RATES = {'new_post': f'{10 ** 9}/s'}
+    request = RequestFactory().post('/new/')
+    request.user = AnonymousUser()
+    number = NUMBER // 10
+    seconds = timeit.timeit(
+        lambda: is_allowed('new_post', request),
+        number=number,
+        )
+    report('is_allowed (configured cache)', seconds, number)
+
+
+if __name__ == '__main__':
+    main()
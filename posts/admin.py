@@ -1,6 +1,47 @@
 from django.contrib import admin
 
+from . import search
+from .deletion import soft_delete_posts
 from .models import Group, Post, Follow, Comment
+from .paginator import EstimatedCountPaginator
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Base admin for tables that may hold millions of rows.
+
+    Counts are estimated instead of scanned, the extra "total" count is
+    disabled and search only uses indexes: a number finds the object by
+    primary key, anything else is matched exactly against the indexed
+    fields listed in ``indexed_search_fields`` and, with ``fts_search``,
+    word by word against the full-text index of the table (search.py).
+    There is no ``date_hierarchy``, its links need a scan of all dates.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    indexed_search_fields = ()
+    fts_search = False
+
+    def get_search_results(self, request, queryset, search_term):
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        if search_term.isdigit():
+            return queryset.filter(pk=int(search_term)), False
+        query = None
+        lookups = [
+            queryset.filter(**{field: search_term})
+            for field in self.indexed_search_fields
+            ]
+        if self.fts_search and search.available():
+            table = queryset.model._meta.db_table
+            lookups.append(queryset.filter(
+                pk__in=search.matching_ids(table, search_term),
+                ))
+        for lookup in lookups:
+            query = lookup if query is None else query | lookup
+        if query is None:
+            return queryset.none(), False
+        return query, False
 
 
 class GroupAdmin(admin.ModelAdmin):
@@ -9,23 +50,50 @@ class GroupAdmin(admin.ModelAdmin):
     list_display = ('pk', 'slug', 'title', 'description')
 
 
-class PostAdmin(admin.ModelAdmin):
+class PostAdmin(LargeTableAdmin):
     """Admin model for Post class objects."""
-    list_display = ('pk', 'text', 'pub_date', 'author')
+    list_display = ('pk', 'text', 'pub_date', 'author', 'is_deleted')
+    list_select_related = ('author',)
+    raw_id_fields = ('author', 'group')
     search_fields = ('text',)
-    list_filter = ('pub_date',)
+    indexed_search_fields = ('author__username', 'group__slug')
+    fts_search = True
+    list_filter = ('pub_date', 'is_deleted')
     empty_value_display = '-пусто-'
 
+    def get_queryset(self, request):
+        # Soft-deleted posts stay visible here until the reaper runs.
+        queryset = Post.all_objects.get_queryset()
+        ordering = self.get_ordering(request)
+        if ordering:
+            queryset = queryset.order_by(*ordering)
+        return queryset
 
-class FollowAdmin(admin.ModelAdmin):
-    """Admin model for Post class objects."""
+    def delete_model(self, request, obj):
+        soft_delete_posts(Post.all_objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset):
+        soft_delete_posts(queryset)
+
+
+class FollowAdmin(LargeTableAdmin):
+    """Admin model for Follow class objects."""
     list_display = ('pk', 'user', 'author')
+    list_select_related = ('user', 'author')
+    raw_id_fields = ('user', 'author')
+    search_fields = ('user__username',)
+    indexed_search_fields = ('user__username', 'author__username')
     empty_value_display = '-пусто-'
 
 
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(LargeTableAdmin):
     """Admin model for Comment class objects."""
     list_display = ('pk', 'post', 'author', 'text')
+    list_select_related = ('post__author', 'post__group', 'author')
+    raw_id_fields = ('post', 'author')
+    search_fields = ('text',)
+    indexed_search_fields = ('author__username',)
+    fts_search = True
     empty_value_display = '-пусто-'
 
 
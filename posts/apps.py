@@ -1,5 +1,13 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class PostsConfig(AppConfig):
     name = 'posts'
+
+    def ready(self):
+        from yatube import flatpages  # noqa: F401
+
+        from . import feed, search, signals  # noqa: F401
+
+        post_migrate.connect(search.install, sender=self)
@@ -0,0 +1,48 @@
+"""Author header shown on the profile and post pages.
+
+The counters are read in one query with three scalar subqueries and
+cached per author under the ``user:<id>`` tag, which posts/signals.py
+bumps whenever a post of the author or a follow involving them changes.
+"""
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+
+from yatube.cache import get_or_compute
+
+from .models import Follow, Post
+
+HEADER_CACHE_TIMEOUT = 60 * 60
+
+
+def count_of(queryset, field):
+    """Scalar subquery counting the rows of ``queryset`` per outer user."""
+    return Subquery(
+        queryset.filter(**{field: OuterRef('pk')}).order_by().values(
+            field,
+            ).annotate(total=Count('pk')).values('total'),
+        output_field=IntegerField(),
+        )
+
+
+def load_header(author):
+    counts = type(author).objects.filter(pk=author.pk).annotate(
+        posts_count=count_of(Post.objects.all(), 'author'),
+        followers_count=count_of(Follow.objects.all(), 'author'),
+        following_count=count_of(Follow.objects.all(), 'user'),
+        ).values('posts_count', 'followers_count', 'following_count').get()
+    return {
+        'full_name': author.get_full_name(),
+        'username': author.get_username(),
+        'posts': counts['posts_count'] or 0,
+        'followers': counts['followers_count'] or 0,
+        'following': counts['following_count'] or 0,
+        }
+
+
+def author_header(author):
+    """Return the cached name and counters of ``author``."""
+    return get_or_compute(
+        f'author_header:{author.pk}',
+        lambda: load_header(author),
+        HEADER_CACHE_TIMEOUT,
+        tags=[f'user:{author.pk}'],
+        )
@@ -0,0 +1,181 @@
+"""Soft deletion of posts and users and the background reaper.
+
+Deleting a post or a user only flips flags, so the request never waits
+for a cascade. The reaper (``manage.py reap_deleted``) later removes the
+dependent rows in small transactions and deletes image files and their
+thumbnails at a bounded rate.
+"""
+import time
+
+from django.core.exceptions import SuspiciousOperation
+from django.db import transaction
+from users.models import DeletionRequest
+from yatube.cache import invalidate_on_commit
+
+from .models import (Comment, FeedEntry, Follow, Notification,
+                     NotificationEvent, Post, PostRevision)
+from .signals import post_tags
+from .storage import release_image
+
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_FILES_PER_SECOND = 20
+
+
+def soft_delete_posts(queryset):
+    """Hide the posts of ``queryset`` from every feed."""
+    # ``update`` sends no signals, so invalidate the feeds here.
+    posts = list(queryset.only('pk', 'author_id', 'group_id'))
+    tags = set()
+    for post in posts:
+        tags.update(post_tags(post))
+    post_ids = [post.pk for post in posts]
+    deleted = queryset.model.all_objects.filter(pk__in=post_ids).update(
+        is_deleted=True,
+        )
+    FeedEntry.objects.filter(pk__in=post_ids).delete()
+    if tags:
+        invalidate_on_commit(*tags)
+    return deleted
+
+
+def soft_delete_user(user):
+    """Deactivate ``user``, hide their posts and comments, queue reaping.
+
+    Comments of users waiting for the reaper are left out by
+    ``detail.load_comments``.
+    """
+    with transaction.atomic():
+        user.is_active = False
+        user.save(update_fields=['is_active'])
+        soft_delete_posts(Post.all_objects.filter(author=user))
+        DeletionRequest.objects.get_or_create(user=user)
+        commented = Comment.objects.filter(author=user).values_list(
+            'post_id',
+            flat=True,
+            ).distinct()
+        tags = [f'comments:{post_id}' for post_id in commented]
+        if tags:
+            invalidate_on_commit(*tags)
+
+
+class Throttle:
+    """Sleep so that ``tick`` is called at most ``rate`` times a second."""
+
+    def __init__(self, rate, sleep=time.sleep, clock=time.monotonic):
+        self.interval = 1 / rate if rate else 0
+        self.sleep = sleep
+        self.clock = clock
+        self.next_tick = 0
+
+    def tick(self):
+        now = self.clock()
+        if now < self.next_tick:
+            self.sleep(self.next_tick - now)
+            now = self.next_tick
+        self.next_tick = now + self.interval
+
+
+def delete_in_batches(queryset, batch_size):
+    """Delete ``queryset`` one short transaction per ``batch_size`` rows."""
+    total = 0
+    model = queryset.model
+    while True:
+        with transaction.atomic():
+            pks = list(queryset.values_list('pk', flat=True)[:batch_size])
+            if not pks:
+                return total
+            model._base_manager.filter(pk__in=pks).delete()
+        total += len(pks)
+
+
+def delete_events_in_batches(events, batch_size):
+    """Delete notification events, their per-recipient rows first."""
+    delete_in_batches(
+        Notification.objects.filter(event__in=events),
+        batch_size,
+        )
+    delete_in_batches(events, batch_size)
+
+
+class Reaper:
+    """Remove soft-deleted posts and users with bounded lock time."""
+
+    def __init__(
+            self,
+            batch_size=DEFAULT_BATCH_SIZE,
+            files_per_second=DEFAULT_FILES_PER_SECOND,
+            throttle=None):
+        self.batch_size = batch_size
+        self.throttle = throttle or Throttle(files_per_second)
+        self.stats = {'posts': 0, 'comments': 0, 'files': 0, 'users': 0}
+
+    def delete_image(self, name):
+        """Release an image; unused blobs lose their file and thumbnails."""
+        self.throttle.tick()
+        try:
+            removed = release_image(name)
+        except (OSError, SuspiciousOperation):
+            return
+        if removed:
+            self.stats['files'] += 1
+
+    def reap_posts(self):
+        deleted = Post.all_objects.filter(is_deleted=True)
+        while True:
+            batch = list(deleted.values_list('pk', 'image')[:self.batch_size])
+            if not batch:
+                return
+            pks = [pk for pk, _ in batch]
+            self.stats['comments'] += delete_in_batches(
+                Comment.objects.filter(post_id__in=pks),
+                self.batch_size,
+                )
+            delete_in_batches(
+                PostRevision.objects.filter(post_id__in=pks),
+                self.batch_size,
+                )
+            delete_events_in_batches(
+                NotificationEvent.objects.filter(post_id__in=pks),
+                self.batch_size,
+                )
+            with transaction.atomic():
+                Post.all_objects.filter(pk__in=pks).delete()
+            self.stats['posts'] += len(pks)
+            for _, image in batch:
+                if image:
+                    self.delete_image(image)
+
+    def reap_users(self):
+        # Every table referencing the user is emptied in batches first,
+        # so the final delete cascades to single rows only.
+        for request in DeletionRequest.objects.select_related('user'):
+            user = request.user
+            delete_in_batches(
+                Notification.objects.filter(recipient=user),
+                self.batch_size,
+                )
+            delete_events_in_batches(
+                NotificationEvent.objects.filter(actor=user),
+                self.batch_size,
+                )
+            self.stats['comments'] += delete_in_batches(
+                Comment.objects.filter(author=user),
+                self.batch_size,
+                )
+            delete_in_batches(
+                Follow.objects.filter(user=user),
+                self.batch_size,
+                )
+            delete_in_batches(
+                Follow.objects.filter(author=user),
+                self.batch_size,
+                )
+            with transaction.atomic():
+                user.delete()
+            self.stats['users'] += 1
+
+    def run(self):
+        """Reap everything pending and return the counters."""
+        self.reap_posts()
+        self.reap_users()
+        return self.stats
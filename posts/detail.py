@@ -0,0 +1,92 @@
+"""Read model of the post page.
+
+The page is assembled from three parts, each cached under its own tag so
+a change only rebuilds what it touched:
+
+* the post with its author and group - ``post:<id>``, bumped by edits
+  and by renames of the author or the group;
+* the comments with their authors - ``comments:<id>``, bumped by new
+  comments and by renames of the commenters;
+* the author header - ``user:<author id>``, see authors.py.
+
+View counters change all the time and are cached apart from the post
+for ``VIEW_FLUSH_INTERVAL`` seconds, about as long as they wait in the
+view buffer anyway. Missing posts are cached for ``MISSING_CACHE_TIMEOUT``
+only, so probing random ids cannot fill the cache for an hour.
+
+A cold page costs four queries, a warm one none.
+"""
+from django.conf import settings
+
+from yatube.cache import get_or_compute
+
+from .authors import author_header
+from .models import Comment, Post
+from .viewcounts import DEFAULT_FLUSH_INTERVAL
+
+DETAIL_CACHE_TIMEOUT = 60 * 60
+MISSING_CACHE_TIMEOUT = 60
+
+
+def load_post(post_id):
+    return Post.objects.select_related('author', 'group').filter(
+        pk=post_id,
+        ).first()
+
+
+def load_views(post_id):
+    return Post.all_objects.filter(pk=post_id).values_list(
+        'views',
+        'unique_views',
+        ).first() or (0, 0)
+
+
+def comments_queryset(post_id):
+    """Comments of the post, without authors waiting for the reaper."""
+    return Comment.objects.filter(
+        post=post_id,
+        author__deletion_request__isnull=True,
+        ).select_related('author').order_by('pk')
+
+
+def load_comments(post_id):
+    # An evaluated queryset pickles with its rows, so the cached copy is
+    # a QuerySet that needs no query.
+    comments = comments_queryset(post_id)
+    len(comments)
+    return comments
+
+
+def detail_timeout(post):
+    return DETAIL_CACHE_TIMEOUT if post is not None else MISSING_CACHE_TIMEOUT
+
+
+def post_detail(username, post_id):
+    """Return ``(post, header, comments)``, or ``None`` for a missing post.
+
+    ``comments`` is the cached, already evaluated queryset of comments.
+    """
+    # Missing posts are cached too, creating the post bumps the tag.
+    post = get_or_compute(
+        f'detail:post:{post_id}',
+        lambda: load_post(post_id),
+        detail_timeout,
+        tags=[f'post:{post_id}'],
+        )
+    if post is not None and post.author.username != username:
+        # The author may have been renamed since the post was cached.
+        post = load_post(post_id)
+    if post is None or post.author.username != username:
+        return None
+    post.views, post.unique_views = get_or_compute(
+        f'detail:views:{post_id}',
+        lambda: load_views(post_id),
+        getattr(settings, 'VIEW_FLUSH_INTERVAL', DEFAULT_FLUSH_INTERVAL),
+        )
+    comments = get_or_compute(
+        f'detail:comments:{post_id}',
+        lambda: load_comments(post_id),
+        DETAIL_CACHE_TIMEOUT,
+        tags=[f'comments:{post_id}'],
+        )
+    return post, author_header(post.author), comments
@@ -0,0 +1,171 @@
+"""Denormalized feed read model.
+
+``FeedEntry`` keeps one row per visible post with the author username,
+the group slug and title, a text excerpt, the ``<picture>`` context and
+the counters. The feeds page through this table alone along an index
+that ends with the feed order, without joins.
+
+Entries are written in the same transaction as the change by the
+receivers below. Rendition URLs are filled in by the ``process_post_image``
+task once the renditions exist (until then the feed template renders
+them from ``image_name``), and view counts by the view buffer flush.
+``manage.py rebuild_feed`` rebuilds the whole table, one short
+transaction per batch of posts, so the feeds stay readable meanwhile.
+"""
+import json
+import logging
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count, F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Comment, FeedEntry, Group, Post
+from .renditions import picture_context
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+EXCERPT_LENGTH = 1000
+DEFAULT_BATCH_SIZE = 500
+
+
+def make_excerpt(text):
+    """Return ``(excerpt, truncated)``, cutting at a word boundary."""
+    if len(text) <= EXCERPT_LENGTH:
+        return text, False
+    return text[:EXCERPT_LENGTH].rsplit(None, 1)[0] + '…', True
+
+
+def render_picture(image):
+    """``picture_context`` of ``image`` as JSON; renditions get generated."""
+    if not image:
+        return ''
+    try:
+        return json.dumps(picture_context(image))
+    except Exception:
+        logger.exception('Could not render renditions for %s', image)
+        return ''
+
+
+def fill_entry(entry, post):
+    entry.pub_date = post.pub_date
+    entry.author_id = post.author_id
+    entry.author_username = post.author.username
+    entry.group_id = post.group_id
+    entry.group_slug = post.group.slug if post.group else ''
+    entry.group_title = post.group.title if post.group else ''
+    entry.excerpt, entry.truncated = make_excerpt(post.text)
+    entry.views = post.views
+    if entry.image_name != (post.image.name or ''):
+        # The new image has no renditions yet, see refresh_picture.
+        entry.image_name = post.image.name or ''
+        entry.picture = ''
+    return entry
+
+
+def sync_post(post):
+    """Create, update or drop the entry of ``post``."""
+    if post.is_deleted:
+        FeedEntry.objects.filter(pk=post.pk).delete()
+        return
+    entry = FeedEntry.objects.filter(pk=post.pk).first()
+    if entry is None:
+        entry = FeedEntry(post_id=post.pk)
+    fill_entry(entry, post).save()
+
+
+def refresh_picture(post):
+    """Store the rendition URLs of the current image of ``post``."""
+    FeedEntry.objects.filter(
+        pk=post.pk,
+        image_name=post.image.name or '',
+        ).update(picture=render_picture(post.image))
+
+
+def rebuild(batch_size=DEFAULT_BATCH_SIZE, pictures=True):
+    """Rebuild every entry from the posts; return the number of entries.
+
+    Each batch replaces the entries of its range of post ids in its own
+    transaction and keeps the stored pictures of unchanged images. With
+    ``pictures`` the rendition URLs are refreshed after the batch is
+    committed, since generating renditions may take a while.
+    """
+    posts = Post.objects.select_related('author', 'group').annotate(
+        comment_count=Count('comments'),
+        ).order_by('pk')
+    total = last = 0
+    while True:
+        batch = list(posts.filter(pk__gt=last)[:batch_size])
+        if not batch:
+            break
+        with transaction.atomic():
+            stale = FeedEntry.objects.filter(
+                pk__gt=last,
+                pk__lte=batch[-1].pk,
+                )
+            stored = {
+                pk: (image_name, picture)
+                for pk, image_name, picture in stale.values_list(
+                    'pk',
+                    'image_name',
+                    'picture',
+                    )
+                }
+            entries = []
+            for post in batch:
+                entry = FeedEntry(post_id=post.pk)
+                entry.image_name, entry.picture = stored.get(post.pk, ('', ''))
+                fill_entry(entry, post)
+                entry.comments = post.comment_count
+                entries.append(entry)
+            stale.delete()
+            FeedEntry.objects.bulk_create(entries)
+        if pictures:
+            for post in batch:
+                if post.image:
+                    refresh_picture(post)
+        total += len(entries)
+        last = batch[-1].pk
+    FeedEntry.objects.filter(pk__gt=last).delete()
+    return total
+
+
+@receiver(post_save, sender=Post)
+def sync_saved_post(sender, instance, **kwargs):
+    sync_post(instance)
+
+
+@receiver(post_save, sender=Comment)
+def count_comment(sender, instance, created, **kwargs):
+    if created:
+        FeedEntry.objects.filter(pk=instance.post_id).update(
+            comments=F('comments') + 1,
+            )
+
+
+@receiver(post_delete, sender=Comment)
+def uncount_comment(sender, instance, **kwargs):
+    FeedEntry.objects.filter(pk=instance.post_id, comments__gt=0).update(
+        comments=F('comments') - 1,
+        )
+
+
+@receiver(post_save, sender=Group)
+def rename_group(sender, instance, **kwargs):
+    FeedEntry.objects.filter(group_id=instance.pk).update(
+        group_slug=instance.slug,
+        group_title=instance.title,
+        )
+
+
+@receiver(post_save, sender=User)
+def rename_author(sender, instance, update_fields=None, **kwargs):
+    # Logins only save last_login; skip the update for them.
+    if update_fields is not None and 'username' not in update_fields:
+        return
+    FeedEntry.objects.filter(author_id=instance.pk).exclude(
+        author_username=instance.username,
+        ).update(author_username=instance.username)
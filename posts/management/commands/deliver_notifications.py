@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts.notifications import DEFAULT_BATCH_SIZE, deliver_pending
+
+
+class Command(BaseCommand):
+    help = 'Fan out pending post and comment events to their recipients.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help='Events read and recipients written per batch.',
+            )
+        parser.add_argument(
+            '--loop',
+            type=float,
+            default=0,
+            metavar='SECONDS',
+            help='Keep running, sleeping SECONDS between passes.',
+            )
+
+    def handle(self, *args, **options):
+        while True:
+            delivered = deliver_pending(options['batch_size'])
+            self.stdout.write(f'Delivered {delivered} notifications.')
+            if not options['loop']:
+                return
+            time.sleep(options['loop'])
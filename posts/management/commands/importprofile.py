@@ -0,0 +1,64 @@
+import json
+
+from django.core.management.base import BaseCommand
+from yatube.importtime import DEFAULT_TARGET, by_owner, profile_imports
+
+
+class Command(BaseCommand):
+    help = 'Report the import time of a cold worker per app and module.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--module',
+            default=DEFAULT_TARGET,
+            help='Module imported in a fresh interpreter.',
+            )
+        parser.add_argument(
+            '--top',
+            type=int,
+            default=15,
+            help='Slowest single modules listed after the per app totals.',
+            )
+        parser.add_argument(
+            '--json',
+            action='store_true',
+            help='Print the report as JSON.',
+            )
+
+    def handle(self, *args, **options):
+        entries = profile_imports(options['module'])
+        owners = by_owner(entries)
+        slowest = sorted(entries, key=lambda entry: entry.self_us)
+        slowest = slowest[::-1][:options['top']]
+        total = sum(entry.self_us for entry in entries)
+        if options['json']:
+            self.stdout.write(json.dumps(
+                {
+                    'module': options['module'],
+                    'total_ms': total / 1000,
+                    'owners': [
+                        {'owner': name, 'ms': self_us / 1000,
+                         'modules': modules}
+                        for name, self_us, modules in owners
+                        ],
+                    'slowest': [
+                        {'module': entry.module, 'ms': entry.self_us / 1000}
+                        for entry in slowest
+                        ],
+                    },
+                indent=2,
+                ))
+            return
+        self.stdout.write(
+            f'import {options["module"]}: {total / 1000:.1f} ms, '
+            f'{len(entries)} modules',
+            )
+        for name, self_us, modules in owners:
+            self.stdout.write(
+                f'{self_us / 1000:9.1f} ms {modules:5d}  {name}',
+                )
+        self.stdout.write('Slowest modules (self time):')
+        for entry in slowest:
+            self.stdout.write(
+                f'{entry.self_us / 1000:9.1f} ms  {entry.module}',
+                )
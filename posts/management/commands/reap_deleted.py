@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts.deletion import (DEFAULT_BATCH_SIZE, DEFAULT_FILES_PER_SECOND,
+                            Reaper)
+
+
+class Command(BaseCommand):
+    help = 'Remove soft-deleted posts and users in small batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help='Rows deleted per transaction.',
+            )
+        parser.add_argument(
+            '--files-per-second',
+            type=float,
+            default=DEFAULT_FILES_PER_SECOND,
+            help='Upper bound on image files removed per second.',
+            )
+        parser.add_argument(
+            '--loop',
+            type=float,
+            default=0,
+            metavar='SECONDS',
+            help='Keep running, sleeping SECONDS between passes.',
+            )
+
+    def handle(self, *args, **options):
+        while True:
+            stats = Reaper(
+                batch_size=options['batch_size'],
+                files_per_second=options['files_per_second'],
+                ).run()
+            self.stdout.write(
+                'Reaped {posts} posts, {comments} comments, '
+                '{files} files, {users} users.'.format(**stats)
+                )
+            if not options['loop']:
+                return
+            time.sleep(options['loop'])
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from posts.feed import DEFAULT_BATCH_SIZE, rebuild
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the denormalized feed entries from the posts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help='Posts read per batch.',
+            )
+        parser.add_argument(
+            '--no-pictures',
+            action='store_false',
+            dest='pictures',
+            help='Skip rendition URLs; process_post_image fills them later.',
+            )
+
+    def handle(self, *args, **options):
+        total = rebuild(options['batch_size'], options['pictures'])
+        self.stdout.write(f'Rebuilt {total} feed entries.')
@@ -0,0 +1,34 @@
+import json
+
+from django.core.management.base import BaseCommand
+from yatube.taskqueue import get_queue, run_workers
+
+
+class Command(BaseCommand):
+    help = 'Run background task workers and the periodic task scheduler.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes',
+            type=int,
+            default=2,
+            help='Worker processes, i.e. tasks running at the same time.',
+            )
+        parser.add_argument(
+            '--burst',
+            action='store_true',
+            help='Exit once the queue is empty.',
+            )
+        parser.add_argument(
+            '--stats',
+            action='store_true',
+            help='Print queue sizes and per task metrics, then exit.',
+            )
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            self.stdout.write(json.dumps(get_queue().stats(), indent=2))
+            return
+        processed = run_workers(options['processes'], options['burst'])
+        if processed is not None:
+            self.stdout.write(f'Processed {processed} tasks.')
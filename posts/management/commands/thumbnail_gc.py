@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from posts.thumbnails import collect_dead_sources, collect_orphan_files
+
+
+class Command(BaseCommand):
+    help = (
+        'Remove thumbnails and key-value entries of deleted posts or '
+        'images, then thumbnail files the key-value store does not know.'
+        )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-age',
+            type=int,
+            default=3600,
+            help='Keep orphan files younger than this many seconds.',
+            )
+
+    def handle(self, *args, **options):
+        thumbnails = collect_dead_sources()
+        files = collect_orphan_files(options['min_age'])
+        self.stdout.write(
+            f'Removed {thumbnails} thumbnails of dead images '
+            f'and {files} orphan files.'
+            )
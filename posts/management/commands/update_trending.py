@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts.trending import DEFAULT_BATCH_SIZE, update_trending
+
+
+class Command(BaseCommand):
+    help = 'Fold new events into post scores and write top post snapshots.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help='Events read per batch.',
+            )
+        parser.add_argument(
+            '--top',
+            type=int,
+            default=None,
+            help='Posts kept per snapshot, TRENDING_TOP_K by default.',
+            )
+        parser.add_argument(
+            '--loop',
+            type=float,
+            default=0,
+            metavar='SECONDS',
+            help='Keep running, sleeping SECONDS between passes.',
+            )
+
+    def handle(self, *args, **options):
+        while True:
+            collected = update_trending(options['batch_size'], options['top'])
+            self.stdout.write(f'Folded in {collected} events.')
+            if not options['loop']:
+                return
+            time.sleep(options['loop'])
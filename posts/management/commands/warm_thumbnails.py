@@ -0,0 +1,76 @@
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from posts.thumbnails import posts_to_warm, warm_image
+
+
+class Command(BaseCommand):
+    help = 'Generate missing post image renditions in parallel.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--newest',
+            type=int,
+            default=1000,
+            help='Number of newest posts with images to warm.',
+            )
+        parser.add_argument(
+            '--group',
+            help='Only warm posts of the group with this slug.',
+            )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count(),
+            help='Size of the process pool.',
+            )
+        parser.add_argument(
+            '--state-file',
+            help='Remember progress here and resume from it on restart.',
+            )
+
+    def read_state(self, path, newest):
+        """Return ``(before, left)`` saved by an interrupted run."""
+        if not path or not os.path.exists(path):
+            return None, newest
+        with open(path) as state:
+            state = json.load(state)
+        return state['before'], state['left']
+
+    def write_state(self, path, before, left):
+        if not path:
+            return
+        with open(path + '.tmp', 'w') as state:
+            json.dump({'before': before, 'left': left}, state)
+        os.replace(path + '.tmp', path)
+
+    def handle(self, *args, **options):
+        state_file = options['state_file']
+        before, left = self.read_state(state_file, options['newest'])
+        posts = list(posts_to_warm(
+            left,
+            group=options['group'],
+            before=before,
+            ))
+        total = len(posts)
+        # Forked workers must not share the parent's database connections.
+        connections.close_all()
+        failed = 0
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            results = pool.map(warm_image, [image for _, image in posts])
+            for done, ((pk, _), (name, error)) in enumerate(
+                    zip(posts, results), start=1):
+                if error:
+                    failed += 1
+                    self.stderr.write(f'{name}: {error}')
+                # Results arrive in order, so every older post is pending.
+                self.write_state(state_file, pk, total - done)
+                self.stdout.write(f'\r{done}/{total}', ending='')
+        self.stdout.write('')
+        self.stdout.write(f'Warmed {total - failed} images, {failed} failed.')
+        if state_file and os.path.exists(state_file):
+            os.remove(state_file)
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.core.wsgi import get_wsgi_application
+from yatube.warmup import STEPS, warm_up
+
+
+class Command(BaseCommand):
+    help = 'Run the worker warm-up steps and print their timings.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--step',
+            action='append',
+            dest='steps',
+            choices=[name for name, _ in STEPS],
+            help='Run only this step; may be repeated.',
+            )
+
+    def handle(self, *args, **options):
+        application = get_wsgi_application()
+        for name, seconds, result in warm_up(application, options['steps']):
+            self.stdout.write(
+                f'{name:10} {seconds * 1000:8.1f} ms  {result or "failed"}',
+                )
@@ -0,0 +1,17 @@
+# Generated by Django 2.2.6 on 2026-10-19 10:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0015_post_image_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['is_deleted', 'id'], name='posts_post_alive_id_idx'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 2.2.6 on 2026-10-19 10:26
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0017_notifications'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AggregatorCursor',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=64, unique=True, verbose_name='Имя')),
+                ('position', models.BigIntegerField(default=0, verbose_name='Последний обработанный id')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TrendingSnapshot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(max_length=64, unique=True, verbose_name='Область')),
+                ('post_ids', models.TextField(blank=True, verbose_name='Посты по убыванию рейтинга')),
+                ('created', models.DateTimeField(auto_now=True, verbose_name='Дата расчета')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PostScore',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='score', serialize=False, to='posts.Post', verbose_name='Пост')),
+                ('log_score', models.FloatField(db_index=True, verbose_name='Логарифм рейтинга')),
+                ('group', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='posts.Group', verbose_name='Группа')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='postscore',
+            index=models.Index(fields=['group', 'log_score'], name='posts_score_group_idx'),
+        ),
+    ]
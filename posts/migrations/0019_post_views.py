@@ -0,0 +1,31 @@
+# Generated by Django 2.2.6 on 2026-10-19 10:27
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0018_trending'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostViewSketch',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='view_sketch', serialize=False, to='posts.Post', verbose_name='Пост')),
+                ('registers', models.BinaryField(verbose_name='Регистры')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='unique_views',
+            field=models.PositiveIntegerField(default=0, verbose_name='Уникальные просмотры'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='views',
+            field=models.PositiveIntegerField(default=0, verbose_name='Просмотры'),
+        ),
+    ]
@@ -0,0 +1,101 @@
+# Generated by Django 2.2.6 on 2026-10-19 10:38
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+EXCERPT_LENGTH = 1000
+BATCH_SIZE = 500
+
+
+def make_excerpt(text):
+    # A copy of posts.feed.make_excerpt as of this migration.
+    if len(text) <= EXCERPT_LENGTH:
+        return text, False
+    return text[:EXCERPT_LENGTH].rsplit(None, 1)[0] + '…', True
+
+
+def build_entries(apps, schema_editor):
+    """Entries for existing posts, one batch at a time.
+
+    Pictures are left empty: the feed renders the renditions of
+    ``image_name`` until ``manage.py rebuild_feed`` stores them.
+    """
+    Post = apps.get_model('posts', 'Post')
+    FeedEntry = apps.get_model('posts', 'FeedEntry')
+    posts = Post.objects.filter(is_deleted=False).select_related(
+        'author',
+        'group',
+        ).annotate(
+            comment_count=models.Count('comments'),
+            ).order_by('pk')
+    last = 0
+    while True:
+        batch = list(posts.filter(pk__gt=last)[:BATCH_SIZE])
+        if not batch:
+            break
+        entries = []
+        for post in batch:
+            excerpt, truncated = make_excerpt(post.text)
+            entries.append(FeedEntry(
+                post_id=post.pk,
+                pub_date=post.pub_date,
+                author_id=post.author_id,
+                author_username=post.author.username,
+                group_id=post.group_id,
+                group_slug=post.group.slug if post.group else '',
+                group_title=post.group.title if post.group else '',
+                excerpt=excerpt,
+                truncated=truncated,
+                image_name=post.image.name or '',
+                views=post.views,
+                comments=post.comment_count,
+                ))
+        FeedEntry.objects.bulk_create(entries)
+        last = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0019_post_views'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedEntry',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='feed_entry', serialize=False, to='posts.Post', verbose_name='Пост')),
+                ('pub_date', models.DateTimeField(verbose_name='Дата публикации')),
+                ('author_username', models.CharField(max_length=150, verbose_name='Имя автора')),
+                ('group_slug', models.CharField(blank=True, max_length=100, verbose_name='Адрес группы')),
+                ('group_title', models.CharField(blank=True, max_length=200, verbose_name='Название группы')),
+                ('excerpt', models.TextField(verbose_name='Начало текста')),
+                ('truncated', models.BooleanField(default=False, verbose_name='Текст сокращен')),
+                ('image_name', models.CharField(blank=True, max_length=100, verbose_name='Картинка')),
+                ('picture', models.TextField(blank=True, verbose_name='Версии картинки (JSON)')),
+                ('views', models.PositiveIntegerField(default=0, verbose_name='Просмотры')),
+                ('comments', models.PositiveIntegerField(default=0, verbose_name='Комментарии')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+                ('group', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='posts.Group', verbose_name='Группа')),
+            ],
+            options={
+                'ordering': ('-pub_date', '-post_id'),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='feedentry',
+            index=models.Index(fields=['-pub_date', '-post'], name='posts_feed_index_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='feedentry',
+            index=models.Index(fields=['group', '-pub_date', '-post'], name='posts_feed_group_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='feedentry',
+            index=models.Index(fields=['author', '-pub_date', '-post'], name='posts_feed_author_idx'),
+        ),
+        migrations.RunPython(build_entries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 2.2.6 on 2026-10-19 10:59
+
+from django.db import migrations, models
+
+
+def drop_duplicates(apps, schema_editor):
+    """Keep the first notification of every (recipient, event) pair."""
+    Notification = apps.get_model('posts', 'Notification')
+    first = Notification.objects.values('recipient', 'event').annotate(
+        first=models.Min('pk'),
+        ).values('first')
+    Notification.objects.exclude(pk__in=first).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0020_feedentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificationevent',
+            name='claimed_until',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Занято до'),
+        ),
+        migrations.RunPython(drop_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='notification',
+            constraint=models.UniqueConstraint(fields=('recipient', 'event'), name='posts_notif_once'),
+        ),
+    ]
@@ -1,6 +1,10 @@
+import json
+
 from django.contrib.auth import get_user_model
 from django.db import models
 
+from .storage import post_image_storage
+
 User = get_user_model()
 
 
@@ -25,21 +29,42 @@ class Group(models.Model):
         return self.title
 
 
+class PostManager(models.Manager):
+    """Manager that hides soft-deleted posts."""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(is_deleted=False)
+
+
 class Post(models.Model):
     """Class for Post data.
 
     Stores post text, date of publication, author
     and belonging to a group (optional attribute).
+    Deleted posts are only flagged with ``is_deleted`` and hidden by
+    ``objects``; the rows are removed later by the reaper.
     """
     class Meta:
         """Stores meta parameters for ordering objects by date"""
 
         ordering = ('-pub_date',)  # Ordering by publication date.
+        # Lets "posts newer than id" queries skip reading table rows.
+        indexes = (
+            models.Index(
+                fields=('is_deleted', 'id'),
+                name='posts_post_alive_id_idx',
+                ),
+            )
+
+    objects = PostManager()
+    all_objects = models.Manager()
+
     text = models.TextField(
         verbose_name="Текст",
         )
     pub_date = models.DateTimeField(
         auto_now_add=True,
+        db_index=True,
         verbose_name="Дата публикации",
         )
     author = models.ForeignKey(
@@ -59,10 +84,26 @@ class Post(models.Model):
 
     image = models.ImageField(
         upload_to='posts/',
+        storage=post_image_storage,
+        db_index=True,
         blank=True,
         null=True,
         verbose_name="Заглавная картинка"
         )
+    is_deleted = models.BooleanField(
+        default=False,
+        db_index=True,
+        verbose_name="Удален",
+        )
+    # Written in batches by viewcounts.py, may lag a few seconds behind.
+    views = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Просмотры",
+        )
+    unique_views = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Уникальные просмотры",
+        )
 
     def __str__(self):
         self.short_text = self.text[:15]
@@ -93,6 +134,7 @@ class Comment(models.Model):
         )
     created = models.DateTimeField(
         auto_now_add=True,
+        db_index=True,
         verbose_name="Дата публикации комментария",
         )
 
@@ -122,3 +164,354 @@ class Follow(models.Model):
 
     def __str__(self):
         return f'user:{self.user} author:{self.author}'
+
+
+class PostRevision(models.Model):
+    """Class for post edit history.
+
+    Stores either a full zlib-compressed snapshot of the post text or
+    a compressed delta against the previous revision, see revisions.py.
+    """
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='revisions',
+        verbose_name='Пост',
+        )
+    number = models.PositiveIntegerField(
+        verbose_name='Номер ревизии',
+        )
+    is_snapshot = models.BooleanField(
+        default=False,
+        verbose_name='Полная копия',
+        )
+    data = models.BinaryField(
+        verbose_name='Данные ревизии',
+        )
+    created = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Дата ревизии',
+        )
+
+    class Meta:
+        """Stores unique revision numbers per post"""
+        unique_together = ('post', 'number')
+        ordering = ('post', 'number')
+
+    def __str__(self):
+        return f'post:{self.post_id} revision:{self.number}'
+
+
+class Blob(models.Model):
+    """Class for content-addressed image blobs.
+
+    Stores the storage key derived from the content hash and the number
+    of uploads that reference it, see storage.py.
+    """
+    key = models.CharField(
+        max_length=255,
+        unique=True,
+        verbose_name='Ключ',
+        )
+    size = models.PositiveIntegerField(
+        verbose_name='Размер',
+        )
+    refcount = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Число ссылок',
+        )
+
+    def __str__(self):
+        return f'{self.key} x{self.refcount}'
+
+
+class NotificationEvent(models.Model):
+    """Class for write events waiting to be fanned out to recipients."""
+    NEW_POST = 'post'
+    NEW_COMMENT = 'comment'
+    KINDS = (
+        (NEW_POST, 'Новая запись'),
+        (NEW_COMMENT, 'Новый комментарий'),
+        )
+    kind = models.CharField(
+        max_length=16,
+        choices=KINDS,
+        verbose_name='Тип события',
+        )
+    actor = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор события',
+        )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Пост',
+        )
+    created = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Дата события',
+        )
+    delivered = models.BooleanField(
+        default=False,
+        db_index=True,
+        verbose_name='Доставлено',
+        )
+    claimed_until = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Занято до',
+        )
+
+    def __str__(self):
+        return f'{self.kind} actor:{self.actor_id} post:{self.post_id}'
+
+
+class Notification(models.Model):
+    """Class for delivered notifications.
+
+    Stores only the recipient, a reference to the shared event and
+    the read flag.
+    """
+    recipient = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='notifications',
+        verbose_name='Получатель',
+        )
+    event = models.ForeignKey(
+        NotificationEvent,
+        on_delete=models.CASCADE,
+        related_name='notifications',
+        verbose_name='Событие',
+        )
+    is_read = models.BooleanField(
+        default=False,
+        verbose_name='Прочитано',
+        )
+
+    class Meta:
+        """Stores newest first order and the recipient inbox index"""
+        ordering = ('-id',)
+        indexes = (
+            models.Index(
+                fields=('recipient', 'is_read'),
+                name='posts_notif_inbox_idx',
+                ),
+            )
+        constraints = (
+            models.UniqueConstraint(
+                fields=('recipient', 'event'),
+                name='posts_notif_once',
+                ),
+            )
+
+
+class UnreadCounter(models.Model):
+    """Class for the denormalized number of unread notifications."""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='unread_counter',
+        verbose_name='Пользователь',
+        )
+    unread = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Непрочитанные',
+        )
+
+
+class PostScore(models.Model):
+    """Class for time-decayed popularity scores of posts.
+
+    Stores the natural logarithm of the forward-decayed score, so new
+    events are only ever added and old scores never need rewriting,
+    see trending.py.
+    """
+    post = models.OneToOneField(
+        Post,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='score',
+        verbose_name='Пост',
+        )
+    group = models.ForeignKey(
+        Group,
+        on_delete=models.CASCADE,
+        blank=True,
+        null=True,
+        related_name='+',
+        verbose_name='Группа',
+        )
+    log_score = models.FloatField(
+        db_index=True,
+        verbose_name='Логарифм рейтинга',
+        )
+
+    class Meta:
+        """Stores the per group ranking index"""
+        indexes = (
+            models.Index(
+                fields=('group', 'log_score'),
+                name='posts_score_group_idx',
+                ),
+            )
+
+
+class TrendingSnapshot(models.Model):
+    """Class for precomputed top posts site-wide or of one group."""
+    scope = models.CharField(
+        max_length=64,
+        unique=True,
+        verbose_name='Область',
+        )
+    post_ids = models.TextField(
+        blank=True,
+        verbose_name='Посты по убыванию рейтинга',
+        )
+    created = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата расчета',
+        )
+
+    def __str__(self):
+        return self.scope
+
+
+class AggregatorCursor(models.Model):
+    """Class for positions of background workers in event tables."""
+    name = models.CharField(
+        max_length=64,
+        unique=True,
+        verbose_name='Имя',
+        )
+    position = models.BigIntegerField(
+        default=0,
+        verbose_name='Последний обработанный id',
+        )
+
+    def __str__(self):
+        return f'{self.name}:{self.position}'
+
+
+class PostViewSketch(models.Model):
+    """Class for HyperLogLog registers of the viewers of a post."""
+    post = models.OneToOneField(
+        Post,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='view_sketch',
+        verbose_name='Пост',
+        )
+    registers = models.BinaryField(
+        verbose_name='Регистры',
+        )
+
+
+class FeedEntry(models.Model):
+    """Class for the denormalized feed read model, see feed.py.
+
+    One row per visible post with everything a feed item shows, so feed
+    pages are read from this table alone.
+    """
+    post = models.OneToOneField(
+        Post,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='feed_entry',
+        verbose_name='Пост',
+        )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата публикации',
+        )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор',
+        )
+    author_username = models.CharField(
+        max_length=150,
+        verbose_name='Имя автора',
+        )
+    group = models.ForeignKey(
+        Group,
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        related_name='+',
+        verbose_name='Группа',
+        )
+    group_slug = models.CharField(
+        max_length=100,
+        blank=True,
+        verbose_name='Адрес группы',
+        )
+    group_title = models.CharField(
+        max_length=200,
+        blank=True,
+        verbose_name='Название группы',
+        )
+    excerpt = models.TextField(
+        verbose_name='Начало текста',
+        )
+    truncated = models.BooleanField(
+        default=False,
+        verbose_name='Текст сокращен',
+        )
+    image_name = models.CharField(
+        max_length=100,
+        blank=True,
+        verbose_name='Картинка',
+        )
+    picture = models.TextField(
+        blank=True,
+        verbose_name='Версии картинки (JSON)',
+        )
+    views = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Просмотры',
+        )
+    comments = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Комментарии',
+        )
+
+    class Meta:
+        """Stores one index per feed, each ending with the feed order"""
+        ordering = ('-pub_date', '-post_id')
+        indexes = (
+            models.Index(
+                fields=('-pub_date', '-post'),
+                name='posts_feed_index_idx',
+                ),
+            models.Index(
+                fields=('group', '-pub_date', '-post'),
+                name='posts_feed_group_idx',
+                ),
+            models.Index(
+                fields=('author', '-pub_date', '-post'),
+                name='posts_feed_author_idx',
+                ),
+            )
+
+    @property
+    def id(self):
+        return self.post_id
+
+    @property
+    def text(self):
+        return self.excerpt
+
+    @property
+    def image(self):
+        """The post image, for pages rendered before ``picture`` is set."""
+        field = Post._meta.get_field('image')
+        return field.attr_class(self, field, self.image_name or None)
+
+    @property
+    def picture_context(self):
+        return json.loads(self.picture) if self.picture else {}
@@ -0,0 +1,168 @@
+"""Notifications about new posts and comments.
+
+Write views only insert one ``NotificationEvent``. The worker
+(``manage.py deliver_notifications``) fans pending events out to their
+recipients in batches: followers of the author for a new post, the post
+author for a new comment. ``UnreadCounter`` keeps the number of unread
+notifications per user, so the badge costs one primary key lookup.
+
+A worker claims an event for ``CLAIM_TIMEOUT`` before fanning it out,
+so two workers never deliver the same event at once, and a recipient
+gets at most one notification per event, so an event whose worker died
+half way is delivered again without duplicates.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import (Follow, Notification, NotificationEvent, Post,
+                     UnreadCounter)
+
+DEFAULT_BATCH_SIZE = 500
+CLAIM_TIMEOUT = timedelta(minutes=5)
+
+
+def notify_new_post(post):
+    return NotificationEvent.objects.create(
+        kind=NotificationEvent.NEW_POST,
+        actor_id=post.author_id,
+        post=post,
+        )
+
+
+def notify_new_comment(comment):
+    return NotificationEvent.objects.create(
+        kind=NotificationEvent.NEW_COMMENT,
+        actor_id=comment.author_id,
+        post_id=comment.post_id,
+        )
+
+
+def recipient_batches(event, batch_size):
+    """Yield lists of recipient ids for ``event``, ``batch_size`` at a time."""
+    if event.kind == NotificationEvent.NEW_COMMENT:
+        author_id = Post.all_objects.filter(pk=event.post_id).values_list(
+            'author_id',
+            flat=True,
+            ).first()
+        if author_id is not None and author_id != event.actor_id:
+            yield [author_id]
+        return
+    followers = Follow.objects.filter(author_id=event.actor_id).order_by('pk')
+    last = 0
+    while True:
+        batch = list(
+            followers.filter(pk__gt=last).values_list('pk', 'user_id')[
+                :batch_size
+                ]
+            )
+        if not batch:
+            return
+        yield [user_id for _, user_id in batch]
+        last = batch[-1][0]
+
+
+def deliver(event, recipients):
+    """Store notifications of ``event`` and bump the unread counters.
+
+    Recipients that already have the notification are skipped; return
+    the number of new notifications.
+    """
+    with transaction.atomic():
+        notified = set(Notification.objects.filter(
+            event=event,
+            recipient_id__in=recipients,
+            ).values_list('recipient_id', flat=True))
+        recipients = [
+            user_id for user_id in recipients if user_id not in notified
+            ]
+        if not recipients:
+            return 0
+        Notification.objects.bulk_create(
+            (Notification(recipient_id=user_id, event=event)
+             for user_id in recipients),
+            ignore_conflicts=True,
+            )
+        UnreadCounter.objects.bulk_create(
+            (UnreadCounter(user_id=user_id) for user_id in recipients),
+            ignore_conflicts=True,
+            )
+        UnreadCounter.objects.filter(user_id__in=recipients).update(
+            unread=F('unread') + 1,
+            )
+    return len(recipients)
+
+
+def claim(event):
+    """Claim ``event`` for this worker; False when another one holds it."""
+    now = timezone.now()
+    return bool(
+        NotificationEvent.objects.filter(
+            Q(claimed_until__isnull=True) | Q(claimed_until__lt=now),
+            pk=event.pk,
+            delivered=False,
+            ).update(claimed_until=now + CLAIM_TIMEOUT)
+        )
+
+
+def deliver_pending(batch_size=DEFAULT_BATCH_SIZE):
+    """Fan out every pending event; return the number of notifications."""
+    delivered = 0
+    last = 0
+    while True:
+        events = list(
+            NotificationEvent.objects.filter(
+                Q(claimed_until__isnull=True)
+                | Q(claimed_until__lt=timezone.now()),
+                delivered=False,
+                pk__gt=last,
+                ).order_by('pk')[:batch_size]
+            )
+        if not events:
+            return delivered
+        last = events[-1].pk
+        for event in events:
+            if not claim(event):
+                continue
+            for recipients in recipient_batches(event, batch_size):
+                delivered += deliver(event, recipients)
+                # Long fan-outs keep their claim.
+                NotificationEvent.objects.filter(pk=event.pk).update(
+                    claimed_until=timezone.now() + CLAIM_TIMEOUT,
+                    )
+            NotificationEvent.objects.filter(pk=event.pk).update(
+                delivered=True,
+                claimed_until=None,
+                )
+
+
+def unread_count(user):
+    """Return the unread notifications of ``user`` in one query."""
+    return UnreadCounter.objects.filter(user=user).values_list(
+        'unread',
+        flat=True,
+        ).first() or 0
+
+
+def mark_all_read(user):
+    with transaction.atomic():
+        Notification.objects.filter(recipient=user, is_read=False).update(
+            is_read=True,
+            )
+        UnreadCounter.objects.filter(user=user).update(unread=0)
+
+
+def reconcile_unread_counters():
+    """Recount every ``UnreadCounter`` from the notifications themselves."""
+    unread = Notification.objects.filter(
+        recipient=OuterRef('user'),
+        is_read=False,
+        ).order_by().values('recipient').annotate(
+        total=Count('pk'),
+        ).values('total')
+    return UnreadCounter.objects.update(
+        unread=Coalesce(Subquery(unread), 0),
+        )
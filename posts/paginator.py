@@ -0,0 +1,48 @@
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator that avoids ``COUNT(*)`` over whole tables.
+
+    For an unfiltered queryset the row count is estimated from database
+    statistics (``pg_class.reltuples`` on PostgreSQL, the largest rowid on
+    SQLite), which is an index or catalog lookup instead of a full scan.
+    Filtered querysets are usually small and are counted exactly.
+    """
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is None or query.where:
+            return super().count
+        estimate = self.estimate(self.object_list)
+        if estimate is None:
+            return super().count
+        return estimate
+
+    @staticmethod
+    def estimate(queryset):
+        """Return the estimated row count of the table, or ``None``."""
+        connection = connections[queryset.db]
+        table = queryset.model._meta.db_table
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute(
+                    'SELECT reltuples FROM pg_class WHERE relname = %s',
+                    [table],
+                    )
+                row = cursor.fetchone()
+                if row is None or row[0] <= 0:
+                    return None
+                return int(row[0])
+            if connection.vendor == 'sqlite':
+                # max(rowid) is read from the right edge of the b-tree.
+                cursor.execute(
+                    'SELECT max(rowid) FROM %s' % connection.ops.quote_name(
+                        table,
+                        ),
+                    )
+                return cursor.fetchone()[0] or 0
+        return None
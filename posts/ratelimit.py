@@ -0,0 +1,191 @@
+"""Token bucket rate limiting for write views.
+
+Each key (user or client IP) owns exactly one bucket stored in the
+configured cache as a ``(tokens, last_seen)`` pair, so memory per key is
+constant. Buckets expire from the cache once they would have refilled
+completely, which evicts idle keys without any bookkeeping.
+
+The buckets of a request are read and written under short per-bucket
+locks taken with ``cache.add``, so parallel requests cannot overspend,
+and a token is only taken when every bucket of the request allows it.
+A request that finds a bucket locked does not wait for it: it is let
+through uncharged, so contention never costs polling or a false 429.
+"""
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+LOCK_TIMEOUT = 2
+
+# Override single scopes with settings.RATELIMIT_RATES.
+DEFAULT_RATES = {
+    'new_post': '20/m',
+    'add_comment': '30/m',
+    'profile_follow': '60/m',
+    'signup': '10/m',
+    'feed_updates': '20/m',
+    }
+
+
+def parse_rate(rate):
+    """Convert ``'<count>/<s|m|h|d>'`` to ``(capacity, tokens_per_second)``."""
+    count, period = rate.split('/')
+    count = int(count)
+    return count, count / PERIODS[period[0]]
+
+
+class TokenBucket:
+    """Pure token bucket arithmetic, free of any storage concerns."""
+    __slots__ = ('capacity', 'fill_rate')
+
+    def __init__(self, capacity, fill_rate):
+        self.capacity = capacity
+        self.fill_rate = fill_rate
+
+    @property
+    def ttl(self):
+        """Seconds after which an untouched bucket is full again."""
+        return int(self.capacity / self.fill_rate) + 1
+
+    def consume(self, state, now):
+        """Take one token from ``state``.
+
+        Return ``(allowed, new_state)``; ``state`` is ``None`` for a key
+        that has not been seen yet (or has been evicted).
+        """
+        if state is None:
+            return True, (self.capacity - 1, now)
+        tokens, last = state
+        tokens = min(self.capacity, tokens + (now - last) * self.fill_rate)
+        if tokens < 1:
+            return False, (tokens, now)
+        return True, (tokens - 1, now)
+
+
+def client_ip(request):
+    """Return the client address.
+
+    ``REMOTE_ADDR`` unless ``TRUSTED_PROXY_HOPS`` proxies append to
+    X-Forwarded-For; then the address the outermost trusted proxy saw.
+    Entries left of it are sent by the client and can be anything.
+    """
+    hops = getattr(settings, 'TRUSTED_PROXY_HOPS', 0)
+    forwarded = request.META.get('HTTP_X_FORWARDED_FOR')
+    if hops and forwarded:
+        addresses = [address.strip() for address in forwarded.split(',')]
+        if len(addresses) >= hops:
+            return addresses[-hops]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def request_keys(request):
+    """Return bucket identities for the request: always IP, plus the user."""
+    keys = [f'ip:{client_ip(request)}']
+    if request.user.is_authenticated:
+        keys.append(f'user:{request.user.pk}')
+    return keys
+
+
+def get_bucket(scope):
+    rates = getattr(settings, 'RATELIMIT_RATES', {})
+    return TokenBucket(*parse_rate(rates.get(scope, DEFAULT_RATES[scope])))
+
+
+def lock_buckets(keys):
+    """Lock ``keys``; return the lock keys, or ``None`` when busy."""
+    locks = []
+    for key in keys:
+        lock = f'{key}:lock'
+        if not cache.add(lock, 1, LOCK_TIMEOUT):
+            cache.delete_many(locks)
+            return None
+        locks.append(lock)
+    return locks
+
+
+def is_allowed(scope, request, now=None):
+    """Charge one token from every bucket of the request in ``scope``.
+
+    Nothing is charged when any of the buckets is empty.
+    """
+    bucket = get_bucket(scope)
+    keys = [f'ratelimit:{scope}:{ident}' for ident in request_keys(request)]
+    locks = lock_buckets(keys)
+    if locks is None:
+        # A parallel request is charging the same bucket. Letting this
+        # one through uncharged overspends by at most one token per
+        # concurrent request, which beats rejecting honest clients.
+        return True
+    try:
+        now = time.time() if now is None else now
+        states = cache.get_many(keys)
+        results = [bucket.consume(states.get(key), now) for key in keys]
+        if not all(allowed for allowed, _ in results):
+            return False
+        cache.set_many(
+            {key: state for key, (_, state) in zip(keys, results)},
+            bucket.ttl,
+            )
+        return True
+    finally:
+        cache.delete_many(locks)
+
+
+def too_many_requests():
+    return HttpResponse(
+        'Слишком много запросов, попробуйте позже.',
+        status=429,
+        )
+
+
+def open_slot(scope, request, limit, timeout):
+    """Count one more open request in ``scope``; ``None`` when over limit.
+
+    Return the keys to pass to ``close_slot``. Counters expire after
+    ``timeout`` seconds, so a crashed worker cannot leak slots forever.
+    """
+    keys = [f'slots:{scope}:{ident}' for ident in request_keys(request)]
+    opened = []
+    for key in keys:
+        cache.add(key, 0, timeout)
+        try:
+            count = cache.incr(key)
+        except ValueError:  # Expired between add and incr.
+            count = 1
+            cache.set(key, count, timeout)
+        opened.append(key)
+        if count > limit:
+            close_slot(opened)
+            return None
+    return opened
+
+
+def close_slot(keys):
+    for key in keys:
+        try:
+            cache.decr(key)
+        except ValueError:
+            pass
+
+
+def ratelimit(scope, methods=('POST',)):
+    """Reject requests over the ``scope`` rate with status 429.
+
+    Only requests whose method is in ``methods`` are charged, so rendering
+    a form is never throttled.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if (
+                    getattr(settings, 'RATELIMIT_ENABLED', True)
+                    and request.method in methods
+                    and not is_allowed(scope, request)):
+                return too_many_requests()
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
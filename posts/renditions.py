@@ -0,0 +1,131 @@
+"""Responsive renditions of post images.
+
+Every post image gets one rendition per width in ``RENDITION_WIDTHS`` and
+per format in ``POST_IMAGE_RENDITION_FORMATS`` (formats Pillow cannot
+encode are skipped). All renditions keep the 960x339 feed crop. They are
+produced through sorl-thumbnail, so they live in its storage and
+key-value store and are only generated once per image.
+"""
+import logging
+
+from django.conf import settings
+from sorl.thumbnail import get_thumbnail
+from sorl.thumbnail.base import EXTENSIONS, ThumbnailBackend
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.helpers import serialize, tokey
+from yatube.cache import get_or_compute
+
+logger = logging.getLogger(__name__)
+
+RENDITION_WIDTHS = (320, 640, 960)
+RENDITIONS_CACHE_TIMEOUT = 60 * 60 * 24
+# Generating all renditions of a large upload can take a few seconds.
+RENDITIONS_WAIT = 10
+RENDITION_RATIO = 339 / 960
+DEFAULT_FORMATS = ('AVIF', 'WEBP', 'JPEG')
+FALLBACK_FORMAT = 'JPEG'
+
+MIME_TYPES = {
+    'AVIF': 'image/avif',
+    'WEBP': 'image/webp',
+    'JPEG': 'image/jpeg',
+    }
+
+# sorl-thumbnail does not know the AVIF extension yet.
+RENDITION_EXTENSIONS = dict(EXTENSIONS, AVIF='avif')
+
+
+class RenditionBackend(ThumbnailBackend):
+    """Thumbnail backend that can also name AVIF files."""
+
+    def _get_thumbnail_filename(self, source, geometry_string, options):
+        key = tokey(source.key, geometry_string, serialize(options))
+        path = '%s/%s/%s' % (key[:2], key[2:4], key)
+        return '%s%s.%s' % (
+            thumbnail_settings.THUMBNAIL_PREFIX,
+            path,
+            RENDITION_EXTENSIONS[options['format']],
+            )
+
+
+def rendition_formats():
+    """Return the configured formats that Pillow is able to encode."""
+    # Pillow is imported on first use, not on every worker boot.
+    from PIL import features
+
+    formats = getattr(
+        settings,
+        'POST_IMAGE_RENDITION_FORMATS',
+        DEFAULT_FORMATS,
+        )
+    supported = features.get_supported_modules()
+    return [
+        fmt for fmt in formats
+        if fmt == FALLBACK_FORMAT or fmt.lower() in supported
+        ]
+
+
+def geometry(width):
+    return f'{width}x{round(width * RENDITION_RATIO)}'
+
+
+def get_rendition(image, width, fmt):
+    return get_thumbnail(
+        image,
+        geometry(width),
+        crop='center',
+        upscale=True,
+        format=fmt,
+        )
+
+
+def get_renditions(image):
+    """Return ``[(format, [(width, url), ...]), ...]`` for ``image``.
+
+    The fallback format always comes last, as ``<picture>`` expects.
+    """
+    formats = [fmt for fmt in rendition_formats() if fmt != FALLBACK_FORMAT]
+    formats.append(FALLBACK_FORMAT)
+    return [
+        (fmt, [
+            (width, get_rendition(image, width, fmt).url)
+            for width in RENDITION_WIDTHS
+            ])
+        for fmt in formats
+        ]
+
+
+def cached_renditions(image):
+    """``get_renditions`` generated by one request while others wait."""
+    return get_or_compute(
+        f'renditions:{tokey(image.name)}',
+        lambda: get_renditions(image),
+        RENDITIONS_CACHE_TIMEOUT,
+        wait=RENDITIONS_WAIT,
+        )
+
+
+def picture_context(image):
+    """Template context of ``includes/post_picture.html`` for ``image``."""
+    renditions = cached_renditions(image)
+    sources = [
+        {
+            'type': MIME_TYPES[fmt],
+            'srcset': ', '.join(f'{url} {width}w' for width, url in urls),
+            }
+        for fmt, urls in renditions
+        ]
+    fallback = sources.pop()
+    return {
+        'sources': sources,
+        'srcset': fallback['srcset'],
+        'src': renditions[-1][1][-1][1],
+        }
+
+
+def generate_renditions(image):
+    """Create every rendition of ``image``; errors are logged, not raised."""
+    try:
+        get_renditions(image)
+    except Exception:
+        logger.exception('Could not generate renditions for %s', image)
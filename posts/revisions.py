@@ -0,0 +1,156 @@
+"""Post edit history stored as compressed deltas.
+
+Revision 1 of a post is its text before the first edit. Every following
+revision stores only a delta against the previous one, and every
+``POST_REVISION_SNAPSHOT_INTERVAL``-th revision is a full snapshot, so
+rebuilding any revision applies at most ``interval - 1`` deltas.
+
+A delta is a list of operations: ``[start, end]`` copies a slice of the
+previous text, a string inserts new text. It is stored as zlib-compressed
+JSON. Texts are compared word by word, which keeps the diff fast inside
+the edit transaction; longer texts than ``POST_REVISION_MAX_DELTA_LENGTH``
+are stored as snapshots without diffing.
+"""
+import json
+import re
+import zlib
+from difflib import SequenceMatcher
+from itertools import accumulate
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from .models import Post, PostRevision
+
+DEFAULT_SNAPSHOT_INTERVAL = 10
+DEFAULT_MAX_DELTA_LENGTH = 100000
+# Two concurrent edits may pick the same revision number.
+NUMBERING_ATTEMPTS = 3
+
+WORDS = re.compile(r'\S+\s*|\s+')
+
+
+def snapshot_interval():
+    return getattr(
+        settings,
+        'POST_REVISION_SNAPSHOT_INTERVAL',
+        DEFAULT_SNAPSHOT_INTERVAL,
+        )
+
+
+def max_delta_length():
+    return getattr(
+        settings,
+        'POST_REVISION_MAX_DELTA_LENGTH',
+        DEFAULT_MAX_DELTA_LENGTH,
+        )
+
+
+def make_delta(old, new):
+    """Return operations turning ``old`` into ``new``."""
+    old_words = WORDS.findall(old)
+    new_words = WORDS.findall(new)
+    # Character offsets of the word boundaries.
+    old_offsets = [0, *accumulate(map(len, old_words))]
+    new_offsets = [0, *accumulate(map(len, new_words))]
+    ops = []
+    matcher = SequenceMatcher(None, old_words, new_words)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            ops.append([old_offsets[i1], old_offsets[i2]])
+        elif j2 > j1:
+            ops.append(new[new_offsets[j1]:new_offsets[j2]])
+    return ops
+
+
+def apply_delta(old, ops):
+    return ''.join(
+        op if isinstance(op, str) else old[op[0]:op[1]]
+        for op in ops
+        )
+
+
+def pack(value):
+    return zlib.compress(json.dumps(value).encode())
+
+
+def unpack(data):
+    return json.loads(zlib.decompress(bytes(data)).decode())
+
+
+def record_revision(post, previous_text):
+    """Store the new ``post.text`` as the next revision of ``post``.
+
+    ``previous_text`` is the text that was in the database before the
+    edit. Call it inside the transaction that saves the post.
+    """
+    if previous_text == post.text:
+        return None
+    for attempt in range(NUMBERING_ATTEMPTS):
+        try:
+            with transaction.atomic():
+                return append_revision(post, previous_text)
+        except IntegrityError:
+            if attempt == NUMBERING_ATTEMPTS - 1:
+                raise
+
+
+def append_revision(post, previous_text):
+    # Serializes the numbering on databases with row locks.
+    list(Post.all_objects.select_for_update().filter(pk=post.pk).values_list(
+        'pk',
+        ))
+    last = post.revisions.order_by('-number').only('number').first()
+    if last is None:
+        PostRevision.objects.create(
+            post=post,
+            number=1,
+            is_snapshot=True,
+            data=pack(previous_text),
+            )
+        number = 2
+    else:
+        number = last.number + 1
+    too_long = len(previous_text) + len(post.text) > max_delta_length()
+    if too_long or (number - 1) % snapshot_interval() == 0:
+        return PostRevision.objects.create(
+            post=post,
+            number=number,
+            is_snapshot=True,
+            data=pack(post.text),
+            )
+    return PostRevision.objects.create(
+        post=post,
+        number=number,
+        data=pack(make_delta(previous_text, post.text)),
+        )
+
+
+def get_revision(post, number):
+    """Return the text of revision ``number`` of ``post``.
+
+    Looks up the nearest snapshot at or before ``number``, then reads it
+    and the deltas after it in a second query.
+    """
+    snapshot = post.revisions.filter(
+        number__lte=number,
+        is_snapshot=True,
+        ).order_by('-number').values_list('number', flat=True).first()
+    if snapshot is None:
+        raise PostRevision.DoesNotExist(
+            f'Post {post.pk} has no revision {number}.'
+            )
+    chain = list(
+        post.revisions.filter(
+            number__gte=snapshot,
+            number__lte=number,
+            ).order_by('number').values_list('number', 'data')
+        )
+    if chain[-1][0] != number:
+        raise PostRevision.DoesNotExist(
+            f'Post {post.pk} has no revision {number}.'
+            )
+    text = unpack(chain[0][1])
+    for _, data in chain[1:]:
+        text = apply_delta(text, unpack(data))
+    return text
@@ -0,0 +1,88 @@
+"""Full-text indexes for admin search on SQLite.
+
+Every table in ``FTS_TABLES`` gets an external content FTS5 table
+``<table>_fts`` over one text column, kept current by triggers. Django
+rebuilds a SQLite table (and drops its triggers) when a later migration
+alters it, so ``install`` runs after every ``migrate`` and rebuilds the
+index when a trigger had to be recreated.
+"""
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+FTS_TABLES = {
+    'posts_post': 'text',
+    'posts_comment': 'text',
+    }
+
+
+def fts_table(table):
+    return f'{table}_fts'
+
+
+def available():
+    return connection.vendor == 'sqlite'
+
+
+def trigger_statements(table, column):
+    fts = fts_table(table)
+    insert = (
+        f'INSERT INTO {fts}(rowid, {column}) VALUES (new.id, new.{column});'
+        )
+    delete = (
+        f"INSERT INTO {fts}({fts}, rowid, {column}) "
+        f"VALUES ('delete', old.id, old.{column});"
+        )
+    return {
+        f'{fts}_ai': f'AFTER INSERT ON {table} BEGIN {insert} END',
+        f'{fts}_ad': f'AFTER DELETE ON {table} BEGIN {delete} END',
+        f'{fts}_au': (
+            f'AFTER UPDATE OF {column} ON {table} BEGIN {delete} {insert} END'
+            ),
+        }
+
+
+def install(**kwargs):
+    """Create missing FTS tables and triggers; rebuild what was stale."""
+    if not available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='trigger'")
+        existing = {name for name, in cursor.fetchall()}
+        for table, column in FTS_TABLES.items():
+            fts = fts_table(table)
+            cursor.execute(
+                f'CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5('
+                f"{column}, content='{table}', content_rowid='id')",
+                )
+            triggers = trigger_statements(table, column)
+            for name, body in triggers.items():
+                if name not in existing:
+                    cursor.execute(f'CREATE TRIGGER {name} {body}')
+            if not existing.issuperset(triggers):
+                cursor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+def match_query(term):
+    """FTS5 query matching rows that contain every word of ``term``.
+
+    Words are quoted, so user input is never parsed as FTS syntax, and
+    match as prefixes.
+    """
+    words = term.split()
+    return ' '.join('"%s"*' % word.replace('"', '""') for word in words)
+
+
+class Subquery(RawSQL):
+    # RawSQL adds parentheses and ``IN ((SELECT ...))`` would compare
+    # with the first row only; the ``__in`` lookup adds its own.
+    def as_sql(self, compiler, connection):
+        return self.sql, self.params
+
+
+def matching_ids(table, term):
+    """Subquery of the ids of ``table`` rows whose text matches ``term``."""
+    fts = fts_table(table)
+    return Subquery(
+        f'SELECT rowid FROM {fts} WHERE {fts} MATCH %s',
+        (match_query(term),),
+        )
@@ -0,0 +1,131 @@
+"""Map model changes to the cache tags they make stale.
+
+Tags in use:
+
+* ``post:<id>`` - the post with its author and group, so renaming
+  either also bumps the tags of their posts;
+* ``comments:<post id>`` - the comments of a post with their authors;
+* ``feed:index`` - the main feed;
+* ``feed:group:<group id>`` - the feed of one group;
+* ``user:<user id>`` - the author header: name and counters;
+* ``follow:<user id>`` - the follow feed and followed authors of a user;
+* ``groups`` - the list of all groups, also shown on the main feed.
+
+Tags are invalidated on the change and again on commit, so a page
+rendered from the old rows before the commit is not served afterwards.
+"""
+from django.contrib.auth import get_user_model
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+from yatube.cache import invalidate_on_commit
+
+from .models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+def post_tags(post, counts=True):
+    """Tags of ``post``; ``counts`` when the author's post count changed."""
+    tags = {'feed:index', f'post:{post.pk}'}
+    if counts:
+        tags.add(f'user:{post.author_id}')
+    for group_id in (post.group_id, getattr(post, '_old_group_id', None)):
+        if group_id is not None:
+            tags.add(f'feed:group:{group_id}')
+    return tags
+
+
+@receiver(pre_save, sender=Post)
+def remember_old_group(sender, instance, update_fields=None, **kwargs):
+    """Keep the group a post is moved out of, its feed changes too."""
+    if instance._state.adding:
+        return
+    if update_fields is not None and 'group' not in update_fields:
+        return
+    if instance.pk is not None:
+        instance._old_group_id = Post.all_objects.filter(
+            pk=instance.pk,
+            ).values_list('group_id', flat=True).first()
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post(sender, instance, **kwargs):
+    # An edit keeps the author's counters, a creation or deletion does not.
+    invalidate_on_commit(
+        *post_tags(instance, counts=kwargs.get('created', True)),
+        )
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_comment(sender, instance, **kwargs):
+    invalidate_on_commit(f'comments:{instance.post_id}')
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_follow(sender, instance, **kwargs):
+    invalidate_on_commit(
+        f'follow:{instance.user_id}',
+        f'user:{instance.user_id}',
+        f'user:{instance.author_id}',
+        )
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_group(sender, instance, **kwargs):
+    invalidate_on_commit('groups', 'feed:index', f'feed:group:{instance.pk}')
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def invalidate_group_posts(sender, instance, created=False, **kwargs):
+    """Cached posts show the group's title and slug.
+
+    Deletion is handled before the fact, while the posts still point at
+    the group.
+    """
+    if created:
+        return
+    post_ids = Post.all_objects.filter(group=instance).values_list(
+        'pk',
+        flat=True,
+        )
+    tags = [f'post:{post_id}' for post_id in post_ids]
+    if tags:
+        invalidate_on_commit(*tags)
+
+
+@receiver(pre_save, sender=User)
+def remember_old_username(sender, instance, update_fields=None, **kwargs):
+    """Keep the old username, a rename changes cached posts and comments."""
+    if instance._state.adding:
+        return
+    # Logins only save last_login.
+    if update_fields is not None and 'username' not in update_fields:
+        return
+    instance._old_username = User.objects.filter(
+        pk=instance.pk,
+        ).values_list('username', flat=True).first()
+
+
+@receiver(post_save, sender=User)
+def invalidate_renamed_user(sender, instance, **kwargs):
+    old_username = instance.__dict__.pop('_old_username', None)
+    if old_username is None or old_username == instance.username:
+        return
+    post_ids = Post.all_objects.filter(author=instance).values_list(
+        'pk',
+        flat=True,
+        )
+    commented = Comment.objects.filter(author=instance).values_list(
+        'post_id',
+        flat=True,
+        ).distinct()
+    tags = [f'post:{post_id}' for post_id in post_ids]
+    tags += [f'comments:{post_id}' for post_id in commented]
+    if tags:
+        invalidate_on_commit(*tags)
@@ -0,0 +1,217 @@
+"""Content-addressed, deduplicated storage for post images.
+
+Uploaded files are named after the SHA-256 of their content, so the
+same image posted many times is stored, and thumbnailed, once. Every
+committed save of a blob increments its ``Blob.refcount`` and ``delete``
+only removes the file when the last reference is released. Names never change
+for a given content, which makes the resulting URLs safe to cache forever.
+
+The bytes themselves live in a pluggable backend storage, configured with
+``POST_IMAGE_BACKEND`` (a dotted path to a Django storage class) and
+``POST_IMAGE_BACKEND_OPTIONS``. ``FileSystemStorage`` is the local
+directory implementation; ``InMemoryObjectStorage`` stands in for an
+object store in tests and development.
+"""
+import hashlib
+import os
+import threading
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import Storage
+from django.core.signals import setting_changed
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils.deconstruct import deconstructible
+from django.utils.module_loading import import_string
+from sorl.thumbnail import delete as delete_thumbnails
+from sorl.thumbnail.images import ImageFile
+
+BLOB_PREFIX = 'blobs'
+
+
+def content_hash(content):
+    """Return the SHA-256 hex digest of a Django ``File``."""
+    digest = hashlib.sha256()
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    for chunk in content.chunks():
+        digest.update(chunk)
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    return digest.hexdigest()
+
+
+def blob_name(digest, name):
+    """Return the storage key for content ``digest`` uploaded as ``name``."""
+    ext = os.path.splitext(name)[1].lower()
+    return f'{BLOB_PREFIX}/{digest[:2]}/{digest[2:4]}/{digest}{ext}'
+
+
+@deconstructible
+class InMemoryObjectStorage(Storage):
+    """Object store stand-in keeping blobs in a process-wide dict."""
+    objects = {}
+    lock = threading.Lock()
+
+    def __init__(self, base_url=None):
+        self.base_url = base_url or settings.MEDIA_URL
+
+    def _open(self, name, mode='rb'):
+        return ContentFile(self.objects[name], name=name)
+
+    def _save(self, name, content):
+        data = b''.join(content.chunks())
+        with self.lock:
+            self.objects[name] = data
+        return name
+
+    def exists(self, name):
+        return name in self.objects
+
+    def delete(self, name):
+        with self.lock:
+            self.objects.pop(name, None)
+
+    def size(self, name):
+        return len(self.objects[name])
+
+    def url(self, name):
+        return self.base_url + name
+
+
+_backend = None
+
+
+def get_backend():
+    """Return the configured backend storage instance."""
+    global _backend
+    if _backend is None:
+        backend_class = import_string(getattr(
+            settings,
+            'POST_IMAGE_BACKEND',
+            'django.core.files.storage.FileSystemStorage',
+            ))
+        _backend = backend_class(
+            **getattr(settings, 'POST_IMAGE_BACKEND_OPTIONS', {})
+            )
+    return _backend
+
+
+def reset_backend(*, setting, **kwargs):
+    global _backend
+    if setting.startswith('POST_IMAGE_BACKEND') or setting == 'MEDIA_ROOT':
+        _backend = None
+
+
+setting_changed.connect(reset_backend)
+
+
+@deconstructible
+class ContentAddressedStorage(Storage):
+    """Deduplicating storage with reference counted blobs.
+
+    Names that were stored before this storage existed (no ``Blob`` row)
+    are passed straight to the backend.
+    """
+
+    @property
+    def backend(self):
+        return get_backend()
+
+    def get_available_name(self, name, max_length=None):
+        # The final name is derived from the content in _save().
+        return name
+
+    def _open(self, name, mode='rb'):
+        return self.backend.open(name, mode)
+
+    def _save(self, name, content):
+        key = blob_name(content_hash(content), name)
+        if not self.backend.exists(key):
+            self.store(key, content)
+        # The reference is counted once the upload commits, so a rolled
+        # back upload leaves no reference behind.
+        transaction.on_commit(lambda: self.add_reference(key, content))
+        return key
+
+    def store(self, key, content):
+        saved = self.backend.save(key, content)
+        if saved != key:
+            # Another worker stored the same content concurrently.
+            self.backend.delete(saved)
+
+    def add_reference(self, key, content):
+        """Count one more reference to ``key``, restoring a released blob.
+
+        The update locks the row, so a concurrent ``release`` either sees
+        the new reference or has removed the row and the file already.
+        """
+        from .models import Blob
+        with transaction.atomic():
+            if Blob.objects.filter(key=key).update(
+                    refcount=F('refcount') + 1):
+                return
+            if not self.backend.exists(key):
+                self.store(key, content)
+            try:
+                with transaction.atomic():
+                    Blob.objects.create(
+                        key=key,
+                        size=content.size,
+                        refcount=1,
+                        )
+            except IntegrityError:
+                Blob.objects.filter(key=key).update(
+                    refcount=F('refcount') + 1,
+                    )
+
+    def release(self, name):
+        """Drop one reference to ``name``; return the references left."""
+        from .models import Blob
+        with transaction.atomic():
+            blob = Blob.objects.select_for_update().filter(key=name).first()
+            if blob is not None and blob.refcount > 1:
+                Blob.objects.filter(pk=blob.pk).update(
+                    refcount=F('refcount') - 1,
+                    )
+                return blob.refcount - 1
+            if blob is not None:
+                blob.delete()
+            # Still under the row lock, see add_reference.
+            self.backend.delete(name)
+        return 0
+
+    def delete(self, name):
+        self.release(name)
+
+    def exists(self, name):
+        return self.backend.exists(name)
+
+    def size(self, name):
+        return self.backend.size(name)
+
+    def url(self, name):
+        return self.backend.url(name)
+
+    def path(self, name):
+        return self.backend.path(name)
+
+
+def is_blob(name):
+    """Tell whether ``name`` was stored by ``ContentAddressedStorage``."""
+    return name.startswith(BLOB_PREFIX + '/')
+
+
+def release_image(name):
+    """Release a post image and drop its thumbnails once it is unused.
+
+    Return ``True`` when the blob itself was removed.
+    """
+    if post_image_storage.release(name):
+        return False
+    delete_thumbnails(ImageFile(name, post_image_storage), delete_file=False)
+    return True
+
+
+post_image_storage = ContentAddressedStorage()
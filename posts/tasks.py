@@ -0,0 +1,41 @@
+"""Background tasks of the posts app, see yatube/taskqueue.py."""
+from yatube.cache import invalidate
+from yatube.taskqueue import task
+
+from .deletion import Reaper
+from .feed import refresh_picture
+from .models import Post
+from .notifications import deliver_pending, reconcile_unread_counters
+from .renditions import generate_renditions
+from .signals import post_tags
+from .trending import update_trending
+
+
+@task(concurrency=2)
+def process_post_image(post_id):
+    """Generate renditions of a new post image and show them in feeds."""
+    post = Post.all_objects.filter(pk=post_id).first()
+    if post is not None and post.image:
+        generate_renditions(post.image)
+        refresh_picture(post)
+        invalidate(*post_tags(post, counts=False))
+
+
+@task(every=10, retries=0, concurrency=1)
+def deliver_notifications():
+    deliver_pending()
+
+
+@task(every=60, retries=0, concurrency=1)
+def refresh_trending():
+    update_trending()
+
+
+@task(every=5 * 60, retries=0, concurrency=1)
+def reap_deleted():
+    Reaper().run()
+
+
+@task(every=60 * 60, retries=0, concurrency=1)
+def reconcile_counters():
+    reconcile_unread_counters()
@@ -0,0 +1,23 @@
+import logging
+
+from django import template
+
+from posts.renditions import picture_context
+
+logger = logging.getLogger(__name__)
+
+register = template.Library()
+
+
+@register.inclusion_tag('includes/post_picture.html')
+def post_picture(image):
+    """Render ``<picture>`` with responsive renditions of a post image."""
+    if not image:
+        return {}
+    try:
+        return picture_context(image)
+    except Exception:
+        # Same policy as sorl's {% thumbnail %}: a broken image must not
+        # break the page.
+        logger.exception('Could not render renditions for %s', image)
+        return {}
@@ -1,10 +1,66 @@
-from django.contrib.auth.models import User
+import gzip
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import BytesIO
+from unittest import mock
+
+from django.contrib.auth.models import AnonymousUser, User
+from django.contrib.flatpages.models import FlatPage
+from django.contrib.sites.models import Site
 from django.core.cache import cache
-from django.test import Client, TestCase
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import DatabaseError, connection, transaction
+from django.db.models.query import QuerySet
+from django.http import HttpResponse
+from django.test import (Client, RequestFactory, TestCase,
+                         TransactionTestCase, override_settings)
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from PIL import Image
+from sorl.thumbnail import default
+from sorl.thumbnail.images import ImageFile
+from yatube.cache import (CoalescingCacheMiddleware, acquire, get_or_compute,
+                          invalidate, invalidate_on_commit, release,
+                          should_refresh, tag_versions, versioned_key)
+from yatube.context_processors import SharedContext, shared
+from yatube.flatpages import flatpage_cache
+from yatube.importtime import by_owner, parse
+from yatube.static import (HASHED_NAME, CompressedManifestStaticFilesStorage,
+                           StaticFilesApplication)
+from yatube.taskqueue import get_queue, run_workers, task
+from yatube.warmup import warm_up
 
-from .models import Follow, Group, Post
+from .deletion import Reaper, Throttle, soft_delete_posts, soft_delete_user
+from .feed import EXCERPT_LENGTH
+from .feed import rebuild as rebuild_feed
+from .models import (Blob, Comment, FeedEntry, Follow, Group, Notification,
+                     NotificationEvent, Post, PostRevision, PostScore,
+                     TrendingSnapshot)
+from .notifications import (deliver, deliver_pending, notify_new_post,
+                            unread_count)
+from .paginator import EstimatedCountPaginator
+from .ratelimit import (TokenBucket, client_ip, close_slot, is_allowed,
+                        open_slot)
+from .renditions import RENDITION_WIDTHS, get_renditions
+from .revisions import apply_delta, get_revision, make_delta
+from .signals import post_tags
+from .storage import post_image_storage, release_image
+from .thumbnails import collect_dead_sources, posts_to_warm, warm_image
+from .trending import (SITE_SCOPE, add_events, update_trending,
+                       write_snapshots)
+from .viewcounts import (REGISTERS, ViewBuffer, hll_add, hll_count,
+                         view_buffer, viewer_hash)
+from .views import FEED_OPEN_LIMIT
 
 
 class YatubeTest(TestCase):
@@ -302,3 +358,1415 @@ class YatubeTest(TestCase):
             302,
             msg='Unauthorized user can not add comment',
             )
+
+
+class RateLimitTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='sarah', password='12345')
+        self.client_authorized = Client()
+        self.client_authorized.force_login(self.user)
+
+    def test_bucket_refills(self):
+        """Check that an empty bucket refills with time."""
+        bucket = TokenBucket(capacity=2, fill_rate=1)
+        allowed, state = bucket.consume(None, now=0)
+        allowed, state = bucket.consume(state, now=0)
+        self.assertTrue(allowed)
+        allowed, state = bucket.consume(state, now=0)
+        self.assertFalse(allowed, msg='Bucket is empty.')
+        allowed, state = bucket.consume(state, now=1)
+        self.assertTrue(allowed, msg='Bucket refilled after one second.')
+
+    @override_settings(RATELIMIT_RATES={'new_post': '2/m'})
+    def test_new_post_throttled(self):
+        """Check that post creation over the limit returns 429."""
+        url = reverse('new_post')
+        for text in ('first', 'second'):
+            response = self.client_authorized.post(url, {'text': text})
+            self.assertEqual(response.status_code, 302)
+        response = self.client_authorized.post(url, {'text': 'third'})
+        self.assertEqual(response.status_code, 429)
+        self.assertFalse(Post.objects.filter(text='third').exists())
+        response = self.client_authorized.get(url)
+        self.assertEqual(
+            response.status_code,
+            200,
+            msg='Rendering the form is not throttled.',
+            )
+
+    def test_forwarded_for_needs_trusted_proxy(self):
+        request = RequestFactory().get(
+            '/',
+            REMOTE_ADDR='10.0.0.1',
+            HTTP_X_FORWARDED_FOR='1.2.3.4, 5.6.7.8',
+            )
+        self.assertEqual(client_ip(request), '10.0.0.1')
+        with override_settings(TRUSTED_PROXY_HOPS=1):
+            self.assertEqual(client_ip(request), '5.6.7.8')
+
+    @override_settings(RATELIMIT_RATES={'new_post': '1/m'})
+    def test_denied_request_charges_nothing(self):
+        """Check that an empty user bucket leaves the IP bucket alone."""
+        request = RequestFactory().post('/')
+        request.user = self.user
+        self.assertTrue(is_allowed('new_post', request, now=0))
+        cache.delete(f'ratelimit:new_post:ip:{client_ip(request)}')
+        self.assertFalse(is_allowed('new_post', request, now=1))
+        self.assertIsNone(
+            cache.get(f'ratelimit:new_post:ip:{client_ip(request)}'),
+            )
+
+    @override_settings(RATELIMIT_RATES={'new_post': '1/m'})
+    def test_contended_bucket_fails_open(self):
+        """Check that a locked bucket lets the request through uncharged."""
+        request = RequestFactory().post('/')
+        request.user = self.user
+        key = f'ratelimit:new_post:user:{self.user.pk}'
+        cache.add(f'{key}:lock', 1)
+        self.assertTrue(is_allowed('new_post', request, now=0))
+        self.assertIsNone(cache.get(key))
+        self.assertIsNone(
+            cache.get(f'ratelimit:new_post:ip:{client_ip(request)}:lock'),
+            )
+
+
+class SharedContextTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='sarah', password='12345')
+        self.author = User.objects.create(username='john', password='12345')
+        Follow.objects.create(user=self.user, author=self.author)
+        self.request = RequestFactory().get('/')
+        self.request.user = self.user
+
+    def test_follow_ids_memoized_per_request(self):
+        """Check that the follow set is fetched once per request."""
+        with self.assertNumQueries(1):
+            shared = SharedContext.for_request(self.request)
+            self.assertIn(self.author.pk, shared.follow_ids)
+            shared = SharedContext.for_request(self.request)
+            self.assertIn(self.author.pk, shared.follow_ids)
+
+    def test_lazy(self):
+        """Check that nothing is fetched until a template touches it."""
+        with self.assertNumQueries(0):
+            shared(self.request)
+
+    def test_group_list_rendered(self):
+        cache.clear()
+        Group.objects.create(title='cats', slug='cats')
+        response = Client().get(reverse('index'))
+        self.assertContains(response, reverse('group', args=['cats']))
+
+
+class AdminPerformanceTest(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(
+            username='admin',
+            email='admin@example.com',
+            password='12345',
+            )
+        self.client_admin = Client()
+        self.client_admin.force_login(self.admin)
+        for number in range(5):
+            post = Post.objects.create(
+                text=f'post {number}',
+                author=self.admin,
+                )
+            Comment.objects.create(post=post, author=self.admin, text='c')
+
+    def test_estimated_count(self):
+        """Check that an unfiltered queryset is estimated, not counted."""
+        paginator = EstimatedCountPaginator(Post.all_objects.all(), 2)
+        with self.assertNumQueries(1):
+            self.assertGreaterEqual(paginator.count, 5)
+        paginator = EstimatedCountPaginator(
+            Post.objects.filter(text='post 1'),
+            2,
+            )
+        self.assertEqual(paginator.count, 1)
+
+    def test_changelist_queries_do_not_grow(self):
+        """Check that displayed foreign keys are selected in one query."""
+        url = reverse('admin:posts_comment_changelist')
+        self.client_admin.get(url)
+        with CaptureQueriesContext(connection) as before:
+            self.client_admin.get(url)
+        for number in range(5):
+            Comment.objects.create(
+                post=Post.objects.first(),
+                author=self.admin,
+                text='c',
+                )
+        with CaptureQueriesContext(connection) as after:
+            self.client_admin.get(url)
+        self.assertEqual(len(before), len(after))
+
+    def test_search_by_author(self):
+        """Check that admin search matches the indexed author username."""
+        response = self.client_admin.get(
+            reverse('admin:posts_post_changelist'),
+            {'q': 'admin'},
+            )
+        self.assertEqual(response.context['cl'].result_count, 5)
+
+    def test_full_text_search(self):
+        """Check that text search uses the index and follows edits."""
+        post = Post.objects.get(text='post 3')
+        post.text = 'a rather unusual sentence'
+        post.save()
+        url = reverse('admin:posts_post_changelist')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client_admin.get(url, {'q': 'unusu sent'})
+        self.assertEqual(list(response.context['cl'].result_list), [post])
+        self.assertFalse(
+            [query for query in queries if 'LIKE' in query['sql']],
+            )
+        response = self.client_admin.get(url, {'q': 'post'})
+        self.assertEqual(response.context['cl'].result_count, 4)
+        response = self.client_admin.get(
+            reverse('admin:posts_comment_changelist'),
+            {'q': '"c'},
+            )
+        self.assertEqual(response.context['cl'].result_count, 5)
+
+
+class PostRevisionTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='sarah', password='12345')
+        self.post = Post.objects.create(text='first version', author=self.user)
+        self.client_authorized = Client()
+        self.client_authorized.force_login(self.user)
+
+    def edit(self, text):
+        self.client_authorized.post(
+            reverse('post_edit', args=[self.user.username, self.post.id]),
+            {'text': text},
+            )
+
+    @override_settings(POST_REVISION_SNAPSHOT_INTERVAL=3)
+    def test_every_revision_restored(self):
+        """Check that each edit is recorded and can be rebuilt."""
+        texts = ['first version']
+        for number in range(7):
+            edit = f'first version, edit {number}'
+            texts.append(' '.join([edit] * (number + 1)))
+            self.edit(texts[-1])
+        revisions = PostRevision.objects.filter(post=self.post)
+        self.assertEqual(revisions.count(), len(texts))
+        self.assertEqual(
+            list(revisions.filter(is_snapshot=True).values_list(
+                'number',
+                flat=True,
+                )),
+            [1, 4, 7],
+            )
+        for number, text in enumerate(texts, start=1):
+            with self.assertNumQueries(2):
+                self.assertEqual(get_revision(self.post, number), text)
+
+    def test_unchanged_text_not_recorded(self):
+        """Check that saving the same text adds no revision."""
+        self.edit('first version')
+        self.assertFalse(PostRevision.objects.exists())
+
+    def test_delta_is_compact(self):
+        """Check that a small edit of a long post stores a small delta."""
+        long_text = 'lorem ipsum dolor sit amet ' * 400
+        self.edit(long_text)
+        self.edit(long_text + 'one more sentence')
+        delta = PostRevision.objects.get(post=self.post, number=3)
+        self.assertLess(len(delta.data), 100)
+
+    def test_word_delta_restores_text(self):
+        old = 'alpha  beta\ngamma delta\n\nepsilon '
+        new = 'alpha beta\ngamma DELTA zeta\n\nepsilon'
+        self.assertEqual(apply_delta(old, make_delta(old, new)), new)
+
+    @override_settings(POST_REVISION_MAX_DELTA_LENGTH=100)
+    def test_long_text_stored_as_snapshot(self):
+        self.edit('word ' * 30)
+        self.edit('word ' * 31)
+        self.assertTrue(
+            PostRevision.objects.get(post=self.post, number=3).is_snapshot,
+            )
+        self.assertEqual(get_revision(self.post, 3), ('word ' * 31).strip())
+
+
+class SoftDeleteTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='sarah', password='12345')
+        self.user_2 = User.objects.create(username='john', password='12345')
+        self.post = Post.objects.create(text='soft deleted', author=self.user)
+        Comment.objects.create(post=self.post, author=self.user_2, text='c')
+        Follow.objects.create(user=self.user_2, author=self.user)
+
+    def test_post_hidden_and_reaped(self):
+        """Check that a deleted post disappears at once and is reaped later."""
+        soft_delete_posts(Post.objects.filter(pk=self.post.pk))
+        response = Client().get(reverse('index'))
+        self.assertNotContains(response, 'soft deleted')
+        self.assertEqual(Comment.objects.count(), 1)
+        stats = Reaper(batch_size=1, throttle=Throttle(0)).run()
+        self.assertEqual(stats['posts'], 1)
+        self.assertEqual(stats['comments'], 1)
+        self.assertFalse(Post.all_objects.exists())
+        self.assertFalse(Comment.objects.exists())
+
+    def test_user_reaped(self):
+        """Check that a deleted user is deactivated and removed later."""
+        soft_delete_user(self.user)
+        self.assertFalse(Post.objects.exists())
+        self.assertFalse(User.objects.get(pk=self.user.pk).is_active)
+        Reaper(throttle=Throttle(0)).run()
+        self.assertFalse(User.objects.filter(pk=self.user.pk).exists())
+        self.assertFalse(Follow.objects.exists())
+        self.assertTrue(User.objects.filter(pk=self.user_2.pk).exists())
+
+    def test_user_rows_reaped_in_batches(self):
+        """Check comments are hidden at once and every row reaped later."""
+        post = Post.objects.create(text='other post', author=self.user_2)
+        Comment.objects.create(post=post, author=self.user, text='bye')
+        Follow.objects.create(user=self.user, author=self.user_2)
+        notify_new_post(Post.all_objects.get(pk=self.post.pk))
+        deliver_pending()
+        detail = reverse('post', args=['john', post.pk])
+        self.assertContains(Client().get(detail), 'bye')
+        soft_delete_user(self.user)
+        self.assertNotContains(Client().get(detail), 'bye')
+        Reaper(batch_size=1, throttle=Throttle(0)).run()
+        self.assertFalse(Notification.objects.exists())
+        self.assertFalse(NotificationEvent.objects.exists())
+        self.assertFalse(Comment.objects.filter(author=self.user).exists())
+
+    def test_throttle(self):
+        """Check that the file throttle keeps to the requested rate."""
+        sleeps = []
+        throttle = Throttle(10, sleep=sleeps.append, clock=lambda: 0)
+        for _ in range(3):
+            throttle.tick()
+        self.assertEqual(len(sleeps), 2)
+
+
+@override_settings(POST_IMAGE_BACKEND='posts.storage.InMemoryObjectStorage')
+class ContentAddressedStorageTest(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='sarah', password='12345')
+        self.client_authorized = Client()
+        self.client_authorized.force_login(self.user)
+        buffer = BytesIO()
+        Image.new('RGB', (20, 20), (255, 0, 0)).save(buffer, 'GIF')
+        self.image_data = buffer.getvalue()
+
+    def upload(self, text, filename):
+        self.client_authorized.post(
+            reverse('new_post'),
+            {
+                'text': text,
+                'image': SimpleUploadedFile(
+                    filename,
+                    self.image_data,
+                    content_type='image/gif',
+                    ),
+                },
+            )
+        return Post.objects.get(text=text)
+
+    def test_same_image_stored_once(self):
+        """Check that reposting an image reuses one reference counted blob."""
+        first = self.upload('first', 'one.gif')
+        second = self.upload('second', 'two.gif')
+        self.assertEqual(first.image.name, second.image.name)
+        blob = Blob.objects.get()
+        self.assertEqual(blob.key, first.image.name)
+        self.assertEqual(blob.refcount, 2)
+
+        self.assertFalse(release_image(first.image.name))
+        self.assertTrue(post_image_storage.exists(second.image.name))
+        self.assertTrue(release_image(second.image.name))
+        self.assertFalse(post_image_storage.exists(second.image.name))
+        self.assertFalse(Blob.objects.exists())
+
+    def test_rolled_back_upload_not_counted(self):
+        with self.assertRaises(ValueError), transaction.atomic():
+            post_image_storage.save('one.gif', ContentFile(self.image_data))
+            raise ValueError
+        self.assertFalse(Blob.objects.exists())
+
+    def test_upload_racing_last_release(self):
+        """Check that a blob released before the upload commits is kept."""
+        key = post_image_storage.save('one.gif', ContentFile(self.image_data))
+        with transaction.atomic():
+            post_image_storage.save('two.gif', ContentFile(self.image_data))
+            self.assertTrue(release_image(key))
+        self.assertTrue(post_image_storage.exists(key))
+        self.assertEqual(Blob.objects.get().refcount, 1)
+
+
+@override_settings(POST_IMAGE_BACKEND='posts.storage.InMemoryObjectStorage')
+class RenditionTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='sarah', password='12345')
+        self.client_authorized = Client()
+        self.client_authorized.force_login(self.user)
+        buffer = BytesIO()
+        Image.new('RGB', (1200, 800), (255, 0, 0)).save(buffer, 'PNG')
+        self.client_authorized.post(
+            reverse('new_post'),
+            {
+                'text': 'with image',
+                'image': SimpleUploadedFile(
+                    'image.png',
+                    buffer.getvalue(),
+                    content_type='image/png',
+                    ),
+                },
+            )
+        self.post = Post.objects.get(text='with image')
+
+    def test_renditions_generated(self):
+        """Check that every width and format is generated on upload."""
+        renditions = get_renditions(self.post.image)
+        self.assertEqual(renditions[-1][0], 'JPEG')
+        for fmt, urls in renditions:
+            self.assertEqual(
+                [width for width, _ in urls],
+                list(RENDITION_WIDTHS),
+                )
+
+    def test_srcset_rendered(self):
+        """Check that the feed renders a srcset instead of a single crop."""
+        response = self.client_authorized.get(reverse('index'))
+        self.assertContains(response, '<picture>')
+        self.assertContains(response, '320w')
+        self.assertContains(response, '960w')
+
+
+    def test_srcset_rendered_before_picture_stored(self):
+        """Check that the feed renders renditions of a fresh upload."""
+        FeedEntry.objects.filter(pk=self.post.pk).update(picture='')
+        response = self.client_authorized.get(reverse('index'))
+        self.assertContains(response, '<picture>')
+        self.assertContains(response, '960w')
+
+@override_settings(POST_IMAGE_BACKEND='posts.storage.InMemoryObjectStorage')
+class ThumbnailMaintenanceTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='sarah', password='12345')
+        buffer = BytesIO()
+        Image.new('RGB', (400, 300), (0, 0, 255)).save(buffer, 'PNG')
+        self.post = Post.objects.create(
+            text='with image',
+            author=self.user,
+            image=SimpleUploadedFile('image.png', buffer.getvalue()),
+            )
+
+    def test_warm_image(self):
+        """Check that warming creates thumbnails known to the kv store."""
+        self.assertEqual(
+            list(posts_to_warm(10)),
+            [(self.post.pk, self.post.image.name)],
+            )
+        name, error = warm_image(self.post.image.name)
+        self.assertIsNone(error)
+        thumbnails = default.kvstore._get(
+            ImageFile(name, post_image_storage).key,
+            identity='thumbnails',
+            )
+        self.assertTrue(thumbnails)
+
+    def test_dead_source_collected(self):
+        """Check that thumbnails of a deleted post's image are removed."""
+        warm_image(self.post.image.name)
+        self.assertEqual(collect_dead_sources(), 0)
+        soft_delete_posts(Post.objects.filter(pk=self.post.pk))
+        self.assertGreater(collect_dead_sources(), 0)
+        self.assertIsNone(default.kvstore.get(
+            ImageFile(self.post.image.name, post_image_storage),
+            ))
+
+
+class StaticPipelineTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.name = 'app.0123456789ab.css'
+        with open(os.path.join(self.root, self.name), 'w') as css:
+            css.write('body {}')
+        with open(os.path.join(self.root, self.name + '.gz'), 'wb') as css:
+            css.write(gzip.compress(b'body {}'))
+        self.app = StaticFilesApplication(
+            lambda environ, start_response: [b'django'],
+            mounts=[('/static/', self.root, HASHED_NAME)],
+            )
+
+    def request(self, path, **environ):
+        response = {}
+
+        def start_response(status, headers):
+            response['status'] = status
+            response['headers'] = dict(headers)
+
+        environ.update({'PATH_INFO': path, 'REQUEST_METHOD': 'GET'})
+        response['body'] = b''.join(self.app(environ, start_response))
+        return response
+
+    def test_hashed_file_immutable_and_precompressed(self):
+        """Check cache headers and the precompressed variant."""
+        response = self.request(
+            '/static/' + self.name,
+            HTTP_ACCEPT_ENCODING='gzip, deflate',
+            )
+        self.assertEqual(response['status'], '200 OK')
+        self.assertIn('immutable', response['headers']['Cache-Control'])
+        self.assertEqual(response['headers']['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response['body']), b'body {}')
+        response = self.request(
+            '/static/' + self.name,
+            HTTP_IF_NONE_MATCH=response['headers']['ETag'],
+            HTTP_ACCEPT_ENCODING='gzip',
+            )
+        self.assertEqual(response['status'], '304 Not Modified')
+
+    def test_refused_encoding_not_served(self):
+        for header in ('gzip;q=0', 'br, *;q=0', 'identity'):
+            response = self.request(
+                '/static/' + self.name,
+                HTTP_ACCEPT_ENCODING=header,
+                )
+            self.assertNotIn('Content-Encoding', response['headers'])
+        response = self.request(
+            '/static/' + self.name,
+            HTTP_ACCEPT_ENCODING='br;q=0, GZIP;q=0.5',
+            )
+        self.assertEqual(response['headers']['Content-Encoding'], 'gzip')
+
+    def test_missing_manifest_entry_raises(self):
+        storage = CompressedManifestStaticFilesStorage(location=self.root)
+        with self.assertRaises(ValueError):
+            storage.url('missing.css')
+        with override_settings(DEBUG=True):
+            self.assertEqual(storage.url('missing.css'), '/static/missing.css')
+
+    def test_other_paths_passed_through(self):
+        """Check that missing files and traversal reach Django."""
+        for path in ('/', '/static/missing.css', '/static/../etc/passwd'):
+            self.assertEqual(self.request(path)['body'], b'django')
+
+    def test_assets_once_per_page(self):
+        """Check that the post page includes bootstrap only once."""
+        user = User.objects.create(username='sarah', password='12345')
+        post = Post.objects.create(text='text', author=user)
+        client = Client()
+        client.force_login(user)
+        response = client.get(reverse('post', args=[user.username, post.id]))
+        self.assertEqual(
+            response.content.decode().count('bootstrap.min.css'),
+            1,
+            )
+
+
+class FeedUpdatesTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='sarah', password='12345')
+        self.group = Group.objects.create(title='cats', slug='cats')
+        self.old = Post.objects.create(text='old post', author=self.user)
+        self.new = Post.objects.create(
+            text='new post',
+            author=self.user,
+            group=self.group,
+            )
+        self.client = Client()
+
+    def test_count(self):
+        """Check that only posts newer than ``after`` are counted."""
+        response = self.client.get(
+            reverse('feed_updates'),
+            {'after': self.old.pk, 'count': 1},
+            )
+        data = response.json()
+        self.assertEqual(data['count'], 1)
+        self.assertEqual(data['newest'], self.new.pk)
+        self.assertNotIn('html', data)
+
+    def test_fragments(self):
+        """Check that new posts are returned as rendered post items."""
+        response = self.client.get(
+            reverse('feed_updates'),
+            {'after': self.old.pk, 'feed': 'group:cats'},
+            )
+        self.assertIn('new post', response.json()['html'])
+        self.assertNotIn('old post', response.json()['html'])
+        self.assertTemplateUsed(response, 'includes/feed_entry.html')
+
+    def test_open_requests_capped(self):
+        """Check that a client cannot hold more than a few long polls."""
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        slots = [
+            open_slot('feed', request, FEED_OPEN_LIMIT, 60)
+            for _ in range(FEED_OPEN_LIMIT)
+            ]
+        response = self.client.get(
+            reverse('feed_updates'),
+            {'after': self.new.pk, 'wait': 1},
+            )
+        self.assertEqual(response.status_code, 429)
+        for slot in slots:
+            close_slot(slot)
+
+    def test_nothing_new(self):
+        """Check the answer when the client is up to date."""
+        response = self.client.get(
+            reverse('feed_updates'),
+            {'after': self.new.pk},
+            )
+        self.assertEqual(response.json()['count'], 0)
+        self.assertEqual(response.json()['newest'], self.new.pk)
+
+    def test_follow_feed_requires_login(self):
+        response = self.client.get(reverse('feed_updates'), {'feed': 'follow'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_stream_pushes_new_posts(self):
+        """Check that the event stream reports posts after Last-Event-ID."""
+        response = self.client.get(
+            reverse('feed_stream'),
+            HTTP_LAST_EVENT_ID=str(self.old.pk),
+            )
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = iter(response.streaming_content)
+        next(events)
+        self.assertIn(f'id: {self.new.pk}'.encode(), next(events))
+        response.close()
+
+    def test_unread_stream_frees_slot(self):
+        """Check that a stream closed before its first event frees a slot."""
+        for _ in range(FEED_OPEN_LIMIT + 1):
+            response = self.client.get(reverse('feed_stream'))
+            self.assertEqual(response.status_code, 200)
+            response.close()
+
+
+class NotificationTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create(username='sarah', password='12345')
+        self.followers = [
+            User.objects.create(username=f'follower{number}', password='1')
+            for number in range(3)
+            ]
+        for follower in self.followers:
+            Follow.objects.create(user=follower, author=self.author)
+        self.client_author = Client()
+        self.client_author.force_login(self.author)
+        self.client_follower = Client()
+        self.client_follower.force_login(self.followers[0])
+
+    def test_new_post_fanned_out_to_followers(self):
+        """Check that followers are notified by the worker, not the view."""
+        self.client_author.post(reverse('new_post'), {'text': 'hello'})
+        self.assertFalse(Notification.objects.exists())
+        self.assertEqual(deliver_pending(batch_size=2), 3)
+        for follower in self.followers:
+            self.assertEqual(unread_count(follower), 1)
+        self.assertEqual(deliver_pending(), 0)
+
+    def test_redelivery_skips_notified(self):
+        """Check claimed events are skipped and redelivery adds no dupes."""
+        post = Post.objects.create(text='post', author=self.author)
+        event = notify_new_post(post)
+        deliver(event, [self.followers[0].pk])
+        NotificationEvent.objects.filter(pk=event.pk).update(
+            claimed_until=timezone.now() + timedelta(minutes=1),
+            )
+        self.assertEqual(deliver_pending(), 0)
+        NotificationEvent.objects.filter(pk=event.pk).update(
+            claimed_until=timezone.now() - timedelta(minutes=1),
+            )
+        self.assertEqual(deliver_pending(), 2)
+        for follower in self.followers:
+            self.assertEqual(unread_count(follower), 1)
+            self.assertEqual(follower.notifications.count(), 1)
+
+    def test_comment_notifies_author(self):
+        """Check that the post author learns about a new comment."""
+        post = Post.objects.create(text='post', author=self.author)
+        self.client_follower.post(
+            reverse('add_comment', args=[self.author.username, post.id]),
+            {'text': 'nice'},
+            )
+        deliver_pending()
+        self.assertEqual(unread_count(self.author), 1)
+        self.assertEqual(unread_count(self.followers[0]), 0)
+
+    def test_page_and_badge(self):
+        """Check the badge and that viewing the page marks all as read."""
+        self.client_author.post(reverse('new_post'), {'text': 'hello'})
+        deliver_pending()
+        cache.clear()
+        response = self.client_follower.get(reverse('index'))
+        self.assertContains(response, "badge-primary'>1<")
+        response = self.client_follower.get(reverse('notifications'))
+        self.assertContains(response, '@sarah')
+        self.assertEqual(unread_count(self.followers[0]), 0)
+        self.assertFalse(
+            Notification.objects.filter(
+                recipient=self.followers[0],
+                is_read=False,
+                ).exists()
+            )
+
+
+class FlatPageCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.page = FlatPage.objects.create(
+            url='/about-us/',
+            title='About',
+            content='first version',
+            )
+        self.page.sites.add(Site.objects.get_current())
+        self.client = Client()
+        self.url = reverse('about')
+
+    def test_served_from_memory(self):
+        """Check that a warm anonymous hit runs no queries."""
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertContains(response, 'first version')
+        self.assertEqual(len(queries), 0)
+        response = self.client.get(
+            self.url,
+            HTTP_IF_NONE_MATCH=response['ETag'],
+            )
+        self.assertEqual(response.status_code, 304)
+
+    def test_invalidated_on_save(self):
+        """Check that editing a flatpage replaces the cached copy."""
+        etag = self.client.get(self.url)['ETag']
+        self.page.content = 'second version'
+        self.page.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'second version')
+        self.assertNotEqual(response['ETag'], etag)
+
+    @override_settings(SHARED_CACHE=True, FLATPAGES_CHECK_INTERVAL=60)
+    def test_version_checked_at_intervals(self):
+        """Check that another worker's edit is seen at the next check."""
+        self.client.get(self.url)
+        FlatPage.objects.filter(pk=self.page.pk).update(content='edited')
+        invalidate('flatpages')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertContains(response, 'first version')
+        self.assertEqual(len(queries), 0)
+        flatpage_cache.next_check = 0
+        self.assertContains(self.client.get(self.url), 'edited')
+
+    @override_settings(SHARED_CACHE=False, FLATPAGES_CHECK_INTERVAL=0)
+    def test_no_polling_without_shared_cache(self):
+        """Check that a private cache does not reload on every check."""
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.url)
+        self.assertEqual(len(queries), 0)
+
+
+class TrendingTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='sarah', password='12345')
+        self.group = Group.objects.create(title='cats', slug='cats')
+        self.quiet = Post.objects.create(text='quiet post', author=self.user)
+        self.hot = Post.objects.create(
+            text='hot post',
+            author=self.user,
+            group=self.group,
+            )
+        for number in range(3):
+            Comment.objects.create(
+                post=self.hot,
+                author=self.user,
+                text=f'comment {number}',
+                )
+        Comment.objects.create(post=self.quiet, author=self.user, text='one')
+
+    def test_ranked_snapshots(self):
+        """Check site-wide and group rankings and the popular pages."""
+        self.assertEqual(update_trending(), 4)
+        self.assertEqual(update_trending(), 0)
+        response = self.client.get(reverse('popular'))
+        self.assertEqual(
+            list(response.context['page']),
+            [self.hot, self.quiet],
+            )
+        response = self.client.get(reverse('group_popular', args=['cats']))
+        self.assertEqual(list(response.context['page']), [self.hot])
+
+    def test_newer_events_weigh_more(self):
+        """Check that one fresh event beats several old ones."""
+        now, day = time.time(), 24 * 60 * 60
+        add_events([(self.hot.pk, 'view', now - day, 5)])
+        add_events([(self.quiet.pk, 'view', now, 1)])
+        self.assertEqual(
+            write_snapshots()[SITE_SCOPE],
+            [self.quiet.pk, self.hot.pk],
+            )
+        write_snapshots(now=now + 10 * day)
+        self.assertFalse(PostScore.objects.exists())
+
+    def test_snapshot_queries_independent_of_groups(self):
+        """Check that more groups do not mean more snapshot queries."""
+        update_trending()
+        with CaptureQueriesContext(connection) as few:
+            write_snapshots()
+        for number in range(5):
+            Group.objects.create(title=f'group {number}', slug=f'g{number}')
+        write_snapshots()
+        with CaptureQueriesContext(connection) as many:
+            rankings = write_snapshots()
+        self.assertEqual(len(many), len(few))
+        self.assertEqual(rankings[f'group:{self.group.pk}'], [self.hot.pk])
+        self.assertEqual(TrendingSnapshot.objects.count(), 7)
+
+
+class ViewCountTest(TestCase):
+    def setUp(self):
+        view_buffer.take()
+        self.user = User.objects.create(username='sarah', password='12345')
+        self.post = Post.objects.create(text='text', author=self.user)
+        self.url = reverse('post', args=[self.user.username, self.post.id])
+
+    def test_views_buffered_then_flushed(self):
+        """Check that views are written in one batch, not per request."""
+        readers = [
+            User.objects.create(username=f'reader{number}', password='1')
+            for number in range(3)
+            ]
+        for reader in readers:
+            client = Client()
+            client.force_login(reader)
+            client.get(self.url)
+            client.get(self.url)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.views, 0)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(view_buffer.flush(), 1)
+        updates = [
+            query for query in queries
+            if query['sql'].startswith('UPDATE "posts_post"')
+            and '"views" = (' in query['sql']
+            ]
+        self.assertEqual(len(updates), 1)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.views, 6)
+        self.assertEqual(self.post.feed_entry.views, 6)
+        self.assertEqual(self.post.unique_views, 3)
+
+    @override_settings(VIEW_FLUSH_SIZE=2)
+    def test_flush_when_full(self):
+        self.client.get(self.url)
+        self.client.get(self.url)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.views, 2)
+        self.assertEqual(self.post.unique_views, 1)
+
+    @override_settings(VIEW_FLUSH_SIZE=2)
+    def test_failed_flush_kept_for_next(self):
+        """Check that a failed flush breaks no page and loses no views."""
+        self.client.get(self.url)
+        with mock.patch.object(
+                ViewBuffer,
+                'write',
+                side_effect=DatabaseError('locked'),
+                ), self.assertLogs('posts.viewcounts', 'ERROR'):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(view_buffer.counts[self.post.pk], 2)
+        self.assertEqual(view_buffer.flush(), 1)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.views, 2)
+
+    def test_unique_estimate(self):
+        """Check the HyperLogLog estimate on many distinct viewers."""
+        registers = bytearray(REGISTERS)
+        for number in range(20000):
+            hll_add(registers, viewer_hash(f'viewer{number}'))
+        self.assertAlmostEqual(hll_count(registers), 20000, delta=2000)
+
+
+class StampedeTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+
+    def compute(self):
+        self.calls += 1
+        time.sleep(0.2)
+        return self.calls
+
+    def test_single_flight(self):
+        """Check that concurrent misses compute the value once."""
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(
+                get_or_compute('answer', self.compute, 60),
+                ))
+            for _ in range(5)
+            ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(results, [1] * 5)
+
+    def test_stale_while_revalidate(self):
+        """Check that a stale value is served while someone refreshes it."""
+        cache.set('answer', ('old', time.time() - 1, 0.1), 60)
+        acquire('answer')
+        self.assertEqual(get_or_compute('answer', self.compute, 60), 'old')
+        self.assertEqual(self.calls, 0)
+        release('answer')
+        self.assertEqual(get_or_compute('answer', self.compute, 60), 1)
+
+    def test_single_flight_after_tag_bump(self):
+        """Check that a page with no learned headers is rendered once."""
+        middleware = CoalescingCacheMiddleware(
+            cache_timeout=60,
+            wait=2,
+            tags=('feed:index',),
+            )
+        invalidate('feed:index')
+        first = RequestFactory().get('/page/')
+        self.assertIsNone(middleware.process_request(first))
+        second = RequestFactory().get('/page/')
+        timer = threading.Timer(
+            0.2,
+            middleware.process_response,
+            (first, HttpResponse('rendered once')),
+            )
+        timer.start()
+        response = middleware.process_request(second)
+        timer.join()
+        self.assertEqual(response.content, b'rendered once')
+
+    def test_other_variant_stops_waiting(self):
+        """Check that a different Vary variant claims its own page."""
+        middleware = CoalescingCacheMiddleware(
+            cache_timeout=60,
+            wait=2,
+            tags=('feed:index',),
+            )
+        invalidate('feed:index')
+        first = RequestFactory().get('/page/', HTTP_COOKIE='theme=dark')
+        self.assertIsNone(middleware.process_request(first))
+        second = RequestFactory().get('/page/', HTTP_COOKIE='theme=light')
+        response = HttpResponse('dark page')
+        response['Vary'] = 'Cookie'
+        timer = threading.Timer(
+            0.2,
+            middleware.process_response,
+            (first, response),
+            )
+        timer.start()
+        started = time.monotonic()
+        self.assertIsNone(middleware.process_request(second))
+        timer.join()
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertNotIn('.flight.', second._cache_lock)
+
+    def test_early_expiration(self):
+        """Check that only expensive, nearly stale entries refresh early."""
+        now = time.time()
+        self.assertFalse(should_refresh(now + 10, 0, now))
+        self.assertTrue(should_refresh(now, 0, now))
+        self.assertTrue(any(
+            should_refresh(now + 1, 5, now) for _ in range(100)
+            ))
+
+
+class InvalidationTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='sarah', password='12345')
+        self.group = Group.objects.create(title='cats', slug='cats')
+        self.client = Client()
+
+    def test_new_post_refreshes_feeds(self):
+        """Check that feeds drop their cached copies when a post is added."""
+        self.client.get(reverse('index'))
+        self.client.get(reverse('group', args=['cats']))
+        Post.objects.create(text='fresh post', author=self.user)
+        self.assertContains(self.client.get(reverse('index')), 'fresh post')
+        Post.objects.create(
+            text='cat post',
+            author=self.user,
+            group=self.group,
+            )
+        response = self.client.get(reverse('group', args=['cats']))
+        self.assertEqual(response.context['paginator'].count, 1)
+
+    def test_soft_delete_refreshes_index(self):
+        post = Post.objects.create(text='doomed post', author=self.user)
+        self.assertContains(self.client.get(reverse('index')), 'doomed post')
+        soft_delete_posts(Post.objects.filter(pk=post.pk))
+        self.assertNotContains(
+            self.client.get(reverse('index')),
+            'doomed post',
+            )
+
+    def test_tags(self):
+        """Check that only keys depending on a bumped tag change."""
+        key = versioned_key('page', ['post:1', 'feed:index'])
+        other = versioned_key('page', ['post:2'])
+        invalidate('post:1')
+        self.assertNotEqual(
+            versioned_key('page', ['post:1', 'feed:index']),
+            key,
+            )
+        self.assertEqual(versioned_key('page', ['post:2']), other)
+
+    def test_group_lookup_only_when_needed(self):
+        """Check that only saves that may move a post read its old group."""
+        post = Post(text='new post', author=self.user)
+        with CaptureQueriesContext(connection) as queries:
+            post.save()
+            post.text = 'edited'
+            post.save(update_fields=['text'])
+        self.assertFalse([
+            query for query in queries
+            if query['sql'].startswith('SELECT "posts_post"."group_id"')
+            ])
+        post.group = self.group
+        post.save(update_fields=['group'])
+        post.group = None
+        post.save()
+        self.assertIn(f'feed:group:{self.group.pk}', post_tags(post))
+
+
+class InvalidateOnCommitTest(TransactionTestCase):
+    def test_invalidated_again_on_commit(self):
+        """Check that entries cached before the commit go stale with it."""
+        with transaction.atomic():
+            invalidate_on_commit('feed:index')
+            version = tag_versions(['feed:index'])
+        self.assertNotEqual(tag_versions(['feed:index']), version)
+
+
+    def test_soft_delete_invalidated_on_commit(self):
+        user = User.objects.create(username='sarah', password='12345')
+        Post.objects.create(text='doomed post', author=user)
+        with transaction.atomic():
+            soft_delete_user(user)
+            versions = tag_versions(['feed:index', f'user:{user.pk}'])
+        for old, new in zip(
+                versions,
+                tag_versions(['feed:index', f'user:{user.pk}'])):
+            self.assertNotEqual(new, old)
+
+class ProfileQueriesTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create(username='sarah', password='12345')
+        self.reader = User.objects.create(username='reader', password='1')
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.group = Group.objects.create(title='cats', slug='cats')
+        self.url = reverse('profile', args=['sarah'])
+
+    def add_posts(self, number):
+        Post.objects.bulk_create(
+            Post(text=f'post {index}', author=self.author, group=self.group)
+            for index in range(number)
+            )
+        rebuild_feed(pictures=False)
+        invalidate(f'user:{self.author.pk}')
+
+    def queries(self, client):
+        client.get(self.url)
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(self.url)
+        return response, len(queries)
+
+    def test_query_count(self):
+        """Check that the profile costs the same for 3 and 30 posts."""
+        self.add_posts(3)
+        _, few = self.queries(Client())
+        self.add_posts(27)
+        response, many = self.queries(Client())
+        self.assertEqual(few, many)
+        self.assertLessEqual(many, 2)
+        self.assertEqual(response.context['paginator'].count, 30)
+        self.assertContains(response, 'Записей: 30')
+        self.assertContains(response, 'Подписчиков: 1')
+
+    def test_count_follows_feed_entries(self):
+        """Check that pages are counted from the rows they are cut from."""
+        self.add_posts(12)
+        FeedEntry.objects.filter(pk__in=list(
+            FeedEntry.objects.values_list('pk', flat=True)[:5],
+            )).delete()
+        invalidate(f'user:{self.author.pk}')
+        response = self.client.get(self.url, {'page': 2})
+        self.assertEqual(response.context['paginator'].count, 7)
+        self.assertEqual(response.context['paginator'].num_pages, 1)
+
+    def test_header_follow_state(self):
+        """Check the cached header after following and unfollowing."""
+        client = Client()
+        client.force_login(self.reader)
+        self.assertContains(client.get(self.url), 'Отписаться')
+        client.get(reverse('profile_unfollow', args=['sarah']))
+        response = client.get(self.url)
+        self.assertContains(response, 'Подписаться')
+        self.assertContains(response, 'Подписчиков: 0')
+
+
+class PostDetailTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create(username='sarah', password='12345')
+        self.reader = User.objects.create(username='reader', password='1')
+        self.group = Group.objects.create(title='cats', slug='cats')
+        self.post = Post.objects.create(
+            text='text',
+            author=self.author,
+            group=self.group,
+            )
+        for number in range(5):
+            Comment.objects.create(
+                post=self.post,
+                author=self.reader,
+                text=f'comment {number}',
+                )
+        self.url = reverse('post', args=['sarah', self.post.pk])
+
+    def queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        return response, [query['sql'] for query in queries]
+
+    def test_query_count(self):
+        """Check that a cold page needs 4 queries and a warm one none."""
+        response, cold = self.queries()
+        self.assertEqual(len(cold), 4)
+        response, warm = self.queries()
+        self.assertEqual(warm, [])
+        self.assertContains(response, 'comment 4')
+        self.assertEqual(len(response.context['сomments']), 5)
+        self.assertIs(type(response.context['сomments']), QuerySet)
+
+    def test_renames_refresh_page(self):
+        """Check that group and commenter renames reach the cached page."""
+        self.client.get(self.url)
+        self.group.title = 'kittens'
+        self.group.save()
+        self.reader.username = 'bob'
+        self.reader.save()
+        response = self.client.get(self.url)
+        self.assertContains(response, 'kittens')
+        self.assertContains(response, reverse('profile', args=['bob']))
+        self.group.delete()
+        self.assertNotContains(self.client.get(self.url), 'kittens')
+
+    def test_partial_refresh(self):
+        """Check that a comment reloads only the comments and vice versa."""
+        self.queries()
+        Comment.objects.create(post=self.post, author=self.reader, text='new')
+        response, queries = self.queries()
+        self.assertContains(response, 'new')
+        self.assertEqual(len(queries), 1)
+        self.assertIn('posts_comment', queries[0])
+        self.post.text = 'edited'
+        self.post.save()
+        response, queries = self.queries()
+        self.assertContains(response, 'edited')
+        self.assertEqual(len(queries), 1)
+        self.assertIn('posts_post', queries[0])
+
+    @override_settings(VIEW_FLUSH_INTERVAL=0)
+    def test_views_not_cached_with_post(self):
+        """Check that the page shows the counters flushed since caching."""
+        view_buffer.take()
+        self.client.get(self.url)
+        response = self.client.get(self.url)
+        self.assertEqual(response.context['post'].views, 1)
+
+    def test_wrong_author_or_deleted(self):
+        self.assertEqual(
+            self.client.get(
+                reverse('post', args=['reader', self.post.pk]),
+                ).status_code,
+            404,
+            )
+        self.client.get(self.url)
+        soft_delete_posts(Post.objects.filter(pk=self.post.pk))
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+
+@task(name='tests.touch', retry_delay=0)
+def touch(path, text):
+    with open(path, 'a') as output:
+        output.write(text)
+
+
+@task(name='tests.flaky', retries=1, retry_delay=0)
+def flaky():
+    raise ValueError('always broken')
+
+
+class TaskQueueTest(TransactionTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.output = os.path.join(self.root, 'output.txt')
+        settings = override_settings(
+            TASKS_SYNC=False,
+            TASK_QUEUE_PATH=os.path.join(self.root, 'tasks.sqlite3'),
+            )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def read_output(self):
+        with open(self.output) as output:
+            return output.read()
+
+    def test_queued_until_worker_runs(self):
+        touch.delay(self.output, 'a')
+        self.assertFalse(os.path.exists(self.output))
+        self.assertEqual(run_workers(burst=True), 1)
+        self.assertEqual(self.read_output(), 'a')
+        self.assertEqual(get_queue().stats()['queue'], {})
+
+    def test_retries_then_gives_up(self):
+        """Check the retry, the failed state and the metrics."""
+        flaky.delay()
+        with self.assertLogs('yatube.taskqueue', 'ERROR'):
+            self.assertEqual(run_workers(burst=True), 2)
+        stats = get_queue().stats()
+        self.assertEqual(stats['queue'], {'failed': 1})
+        self.assertEqual(stats['tasks']['tests.flaky']['retried'], 1)
+        self.assertEqual(stats['tasks']['tests.flaky']['failed'], 1)
+
+    def test_expired_lease_counted(self):
+        """Check that tasks of dead workers show up in the metrics."""
+        flaky.delay()
+        queue = get_queue()
+        queue.claim(lease=-1)
+        queue.claim(lease=-1)
+        self.assertIsNone(queue.claim())
+        stats = get_queue().stats()
+        self.assertEqual(stats['queue'], {'failed': 1})
+        self.assertEqual(stats['tasks']['tests.flaky']['retried'], 1)
+        self.assertEqual(stats['tasks']['tests.flaky']['failed'], 1)
+
+    def test_queued_on_commit(self):
+        """Check that a call made in a transaction waits for the commit."""
+        with transaction.atomic():
+            self.assertIsNone(touch.delay(self.output, 'a'))
+            self.assertEqual(get_queue().stats()['queue'], {})
+        self.assertEqual(get_queue().stats()['queue'], {'pending': 1})
+        with self.assertRaises(ValueError), transaction.atomic():
+            touch.delay(self.output, 'b')
+            raise ValueError
+        self.assertEqual(get_queue().stats()['queue'], {'pending': 1})
+
+    def test_concurrency_limit(self):
+        touch.delay(self.output, 'a')
+        touch.delay(self.output, 'b')
+        queue = get_queue()
+        self.assertIsNotNone(queue.claim({'tests.touch': 1}))
+        self.assertIsNone(queue.claim({'tests.touch': 1}))
+        self.assertIsNotNone(queue.claim())
+
+    def test_periodic_runs_do_not_pile_up(self):
+        """Check that a due task is skipped while a run is still queued."""
+        queue = get_queue()
+        flaky.every = 0
+        self.addCleanup(setattr, flaky, 'every', None)
+        self.assertEqual(queue.enqueue_periodic([flaky]), ['tests.flaky'])
+        self.assertEqual(queue.enqueue_periodic([flaky]), [])
+        queue.claim()
+        self.assertEqual(queue.enqueue_periodic([flaky]), [])
+        self.assertEqual(queue.stats()['queue'], {'running': 1})
+
+    def test_worker_processes(self):
+        for text in 'abcdef':
+            touch.delay(self.output, text)
+        run_workers(processes=2, burst=True)
+        self.assertEqual(sorted(self.read_output()), list('abcdef'))
+
+    def test_sync_mode(self):
+        with override_settings(TASKS_SYNC=True):
+            touch.delay(self.output, 'a')
+        self.assertEqual(self.read_output(), 'a')
+
+
+class FeedEntryTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create(username='sarah', password='12345')
+        self.group = Group.objects.create(title='cats', slug='cats')
+        self.post = Post.objects.create(
+            text='first',
+            author=self.author,
+            group=self.group,
+            )
+
+    def entry(self):
+        return FeedEntry.objects.get(pk=self.post.pk)
+
+    def test_entry_follows_changes(self):
+        """Check the entry after edits, renames, comments and deletion."""
+        entry = self.entry()
+        self.assertEqual(
+            (entry.author_username, entry.group_slug, entry.excerpt),
+            ('sarah', 'cats', 'first'),
+            )
+        self.post.text = 'word ' * EXCERPT_LENGTH
+        self.post.save()
+        self.assertTrue(self.entry().truncated)
+        self.assertLessEqual(len(self.entry().excerpt), EXCERPT_LENGTH + 1)
+        self.group.title = 'kittens'
+        self.group.save()
+        self.author.username = 'sara'
+        self.author.save()
+        comment = Comment.objects.create(
+            post=self.post,
+            author=self.author,
+            text='hi',
+            )
+        entry = self.entry()
+        self.assertEqual(
+            (entry.author_username, entry.group_title, entry.comments),
+            ('sara', 'kittens', 1),
+            )
+        comment.delete()
+        self.assertEqual(self.entry().comments, 0)
+        soft_delete_posts(Post.objects.filter(pk=self.post.pk))
+        self.assertFalse(FeedEntry.objects.exists())
+
+    def test_rebuild(self):
+        FeedEntry.objects.all().delete()
+        self.assertEqual(rebuild_feed(batch_size=1), 1)
+        self.assertEqual(self.entry().author_username, 'sarah')
+
+    def test_rebuild_in_place(self):
+        """Check that a rebuild keeps pictures and drops hidden posts."""
+        hidden = Post.objects.create(text='hidden', author=self.author)
+        last = Post.objects.create(text='last', author=self.author)
+        tail = Post.objects.create(text='tail', author=self.author)
+        FeedEntry.objects.filter(pk=self.post.pk).update(picture='{}')
+        Post.all_objects.filter(pk__in=[hidden.pk, tail.pk]).update(
+            is_deleted=True,
+            )
+        self.assertEqual(rebuild_feed(batch_size=1, pictures=False), 2)
+        self.assertEqual(
+            sorted(FeedEntry.objects.values_list('pk', 'picture')),
+            [(self.post.pk, '{}'), (last.pk, '')],
+            )
+
+    def test_feeds_read_without_joins(self):
+        for url in (
+                reverse('index'),
+                reverse('group', args=['cats']),
+                reverse('profile', args=['sarah']),
+                ):
+            with CaptureQueriesContext(connection) as queries:
+                response = Client().get(url)
+            self.assertContains(response, 'first')
+            feed_queries = [
+                query['sql'] for query in queries
+                if 'posts_feedentry' in query['sql']
+                ]
+            self.assertTrue(feed_queries)
+            for sql in feed_queries:
+                self.assertNotIn('JOIN', sql)
+
+
+COLD_START_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+import yatube.wsgi
+print(json.dumps({
+    'seconds': time.perf_counter() - started,
+    'modules': sorted(sys.modules),
+    }))
+"""
+
+
+class ColdStartTest(TestCase):
+    # Only catches gross regressions: a boot is about 0.5s on a laptop,
+    # and benchmarks/bench_cold_start.py measures it properly.
+    COLD_START_BUDGET = float(
+        os.environ.get('YATUBE_COLD_START_BUDGET', 10),
+        )
+
+    def test_wsgi_cold_start(self):
+        """Check the boot time and that Pillow is not loaded on boot."""
+        env = dict(
+            os.environ,
+            DJANGO_SETTINGS_MODULE='yatube.settings',
+            YATUBE_WARM_UP='0',
+            )
+        output = subprocess.run(
+            [sys.executable, '-c', COLD_START_SCRIPT],
+            env=env,
+            stdout=subprocess.PIPE,
+            check=True,
+            ).stdout
+        result = json.loads(output.splitlines()[-1])
+        modules = result['modules']
+        self.assertLess(result['seconds'], self.COLD_START_BUDGET)
+        self.assertNotIn('PIL', modules)
+        self.assertNotIn('sorl.thumbnail.engines.pil_engine', modules)
+
+    def test_report_by_owner(self):
+        output = (
+            'import time: self [us] | cumulative | imported package\n'
+            'import time:       100 |        100 |     json.decoder\n'
+            'import time:        50 |        150 |   json\n'
+            'import time:        30 |         30 |   posts.feed\n'
+            'import time:        20 |         20 |   django.contrib.auth.x\n'
+            )
+        entries = parse(output)
+        self.assertEqual(entries[0].module, 'json.decoder')
+        self.assertEqual(entries[0].depth, 2)
+        self.assertEqual(
+            by_owner(entries),
+            [('json', 150, 2), ('posts', 30, 1),
+             ('django.contrib.auth', 20, 1)],
+            )
+
+
+@override_settings(WARM_UP_HOST='testserver')
+class WarmUpTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        Group.objects.create(title='cats', slug='cats')
+        user = User.objects.create(username='sarah', password='12345')
+        Post.objects.create(text='warm post', author=user)
+
+    def test_warm_up(self):
+        """Check every step and that the primed pages need no queries."""
+        with self.assertLogs('yatube.warmup', 'INFO') as logs:
+            timings = warm_up(WSGIHandler())
+        self.assertEqual(len(logs.output), len(timings))
+        self.assertEqual(
+            [name for name, _, _ in timings],
+            ['templates', 'urls', 'database', 'pages', 'groups', 'flatpages'],
+            )
+        for name, _, result in timings:
+            self.assertIsNotNone(result, msg=name)
+        with self.assertNumQueries(0):
+            response = Client().get(reverse('index'))
+            groups = SharedContext(None).groups
+        self.assertContains(response, 'warm post')
+        self.assertEqual(groups, [('cats', 'cats')])
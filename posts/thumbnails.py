@@ -0,0 +1,143 @@
+"""Warm-up and garbage collection of post image thumbnails.
+
+Used by the ``warm_thumbnails`` and ``thumbnail_gc`` management commands.
+Both walk their input in fixed-size chunks, so memory use does not depend
+on the number of posts, key-value entries or thumbnail files.
+"""
+import os
+import time
+
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.images import ImageFile
+from sorl.thumbnail.kvstores.base import add_prefix, del_prefix
+from sorl.thumbnail.models import KVStore
+
+from .models import Post
+from .renditions import get_renditions
+from .storage import post_image_storage
+
+CHUNK_SIZE = 500
+
+
+def warm_image(name):
+    """Generate all renditions of the stored image ``name``.
+
+    Runs in pool workers, so it takes and returns plain values.
+    """
+    try:
+        get_renditions(ImageFile(name, post_image_storage))
+    except Exception as error:
+        return name, str(error)
+    return name, None
+
+
+def posts_to_warm(newest, group=None, before=None):
+    """Return ``(pk, image)`` of the newest posts with images, newest first.
+
+    ``before`` resumes an interrupted run after the last finished post.
+    """
+    posts = Post.objects.exclude(image='').exclude(image=None)
+    if group:
+        posts = posts.filter(group__slug=group)
+    if before:
+        posts = posts.filter(pk__lt=before)
+    return posts.order_by('-pk').values_list('pk', 'image')[:newest]
+
+
+def live_images(names):
+    """Return which of ``names`` are used by a post that is not deleted."""
+    return set(
+        Post.objects.filter(image__in=names).values_list('image', flat=True)
+        )
+
+
+def iter_kv_keys(identity):
+    """Yield raw key-value store keys of ``identity`` chunk by chunk."""
+    prefix = add_prefix('', identity)
+    last = prefix
+    while True:
+        keys = list(
+            KVStore.objects.filter(
+                key__startswith=prefix,
+                key__gt=last,
+                ).order_by('key').values_list('key', flat=True)[:CHUNK_SIZE]
+            )
+        if not keys:
+            return
+        yield keys
+        last = keys[-1]
+
+
+def delete_thumbnail_list(source_key):
+    """Delete every thumbnail recorded for ``source_key`` and the record."""
+    kvstore = default.kvstore
+    removed = 0
+    for key in kvstore._get(source_key, identity='thumbnails') or []:
+        thumbnail = kvstore._get(key)
+        if thumbnail:
+            kvstore.delete(thumbnail, delete_thumbnails=False)
+            thumbnail.delete()
+            removed += 1
+    kvstore._delete(source_key, identity='thumbnails')
+    return removed
+
+
+def collect_dead_sources():
+    """Drop thumbnails of images that no live post references.
+
+    Return the number of thumbnails removed.
+    """
+    kvstore = default.kvstore
+    removed = 0
+    for raw_keys in iter_kv_keys('thumbnails'):
+        sources = {}
+        for raw_key in raw_keys:
+            key = del_prefix(raw_key)
+            sources[key] = kvstore._get(key)
+        alive = live_images([
+            source.name for source in sources.values() if source
+            ])
+        for key, source in sources.items():
+            if source is not None and source.name in alive:
+                continue
+            removed += delete_thumbnail_list(key)
+            if source is not None:
+                kvstore._delete(key)
+    return removed
+
+
+def iter_files(path):
+    """Yield file paths below ``path`` without listing whole trees."""
+    try:
+        entries = os.scandir(path)
+    except FileNotFoundError:
+        return
+    with entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                yield from iter_files(entry.path)
+            else:
+                yield entry
+
+
+def collect_orphan_files(min_age):
+    """Delete thumbnail files unknown to the key-value store.
+
+    Files younger than ``min_age`` seconds are kept, they may belong to a
+    thumbnail that is being generated right now. Return the number of
+    files removed.
+    """
+    storage = default.storage
+    prefix = thumbnail_settings.THUMBNAIL_PREFIX
+    root = storage.path(prefix)
+    deadline = time.time() - min_age
+    removed = 0
+    for entry in iter_files(root):
+        if entry.stat().st_mtime > deadline:
+            continue
+        name = prefix + os.path.relpath(entry.path, root).replace(os.sep, '/')
+        if default.kvstore.get(ImageFile(name, storage)) is None:
+            os.remove(entry.path)
+            removed += 1
+    return removed
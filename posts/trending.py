@@ -0,0 +1,196 @@
+"""Trending posts.
+
+Every comment (and, through ``add_events``, any other engagement) adds
+``weight * 2 ** ((t - EPOCH) / half_life)`` to the score of its post.
+This is forward decay: instead of decaying every stored score as time
+goes on, newer events simply weigh exponentially more, and ranking by
+the stored score equals ranking by the decayed one. Scores are kept as
+logarithms in ``PostScore.log_score`` so they never overflow.
+
+The worker (``manage.py update_trending``) folds new events into the
+scores incrementally and writes the top posts site-wide and per group
+to ``TrendingSnapshot``; the popular pages only read a snapshot.
+"""
+import math
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import (AggregatorCursor, Comment, Group, Post, PostScore,
+                     TrendingSnapshot)
+
+EPOCH = 1577836800  # 2020-01-01, keeps the exponents small.
+DEFAULT_HALF_LIFE = 6 * 60 * 60
+DEFAULT_WEIGHTS = {'comment': 3.0, 'view': 1.0}
+DEFAULT_TOP_K = 50
+DEFAULT_BATCH_SIZE = 1000
+# Scores that decayed below this are dropped from PostScore.
+MIN_SCORE = 0.01
+SITE_SCOPE = 'site'
+
+
+def half_life():
+    return getattr(settings, 'TRENDING_HALF_LIFE', DEFAULT_HALF_LIFE)
+
+
+def weight(kind):
+    weights = getattr(settings, 'TRENDING_WEIGHTS', DEFAULT_WEIGHTS)
+    return weights[kind]
+
+
+def log_boost(timestamp):
+    """Logarithm of the forward decay factor at ``timestamp``."""
+    return (timestamp - EPOCH) * math.log(2) / half_life()
+
+
+def log_add(a, b):
+    """Return ``log(exp(a) + exp(b))`` without overflow."""
+    if a is None:
+        return b
+    high, low = max(a, b), min(a, b)
+    return high + math.log1p(math.exp(low - high))
+
+
+def group_scope(group_id):
+    return f'group:{group_id}'
+
+
+def add_events(events):
+    """Fold ``(post_id, kind, timestamp, count)`` events into the scores."""
+    increments = {}
+    for post_id, kind, timestamp, count in events:
+        increments[post_id] = log_add(
+            increments.get(post_id),
+            math.log(weight(kind) * count) + log_boost(timestamp),
+            )
+    if not increments:
+        return 0
+    groups = dict(
+        Post.all_objects.filter(pk__in=increments).values_list(
+            'pk',
+            'group_id',
+            )
+        )
+    with transaction.atomic():
+        scores = PostScore.objects.select_for_update().in_bulk(list(groups))
+        created = []
+        for post_id, group_id in groups.items():
+            score = scores.get(post_id)
+            if score is None:
+                created.append(PostScore(
+                    post_id=post_id,
+                    group_id=group_id,
+                    log_score=increments[post_id],
+                    ))
+            else:
+                score.group_id = group_id
+                score.log_score = log_add(
+                    score.log_score,
+                    increments[post_id],
+                    )
+        PostScore.objects.bulk_create(created)
+        PostScore.objects.bulk_update(
+            scores.values(),
+            ['group_id', 'log_score'],
+            )
+    return len(groups)
+
+
+def collect_comments(batch_size=DEFAULT_BATCH_SIZE):
+    """Feed comments written since the last pass into the scores."""
+    cursor, _ = AggregatorCursor.objects.get_or_create(name='comments')
+    collected = 0
+    while True:
+        batch = list(
+            Comment.objects.filter(pk__gt=cursor.position).order_by(
+                'pk',
+                ).values_list('pk', 'post_id', 'created')[:batch_size]
+            )
+        if not batch:
+            return collected
+        # Scores and cursor move together, so no comment counts twice.
+        with transaction.atomic():
+            add_events(
+                (post_id, 'comment', created.timestamp(), 1)
+                for _, post_id, created in batch
+                )
+            cursor.position = batch[-1][0]
+            cursor.save(update_fields=['position'])
+        collected += len(batch)
+
+
+def rankings(top_k):
+    """Return ``{scope: [post_id, ...]}`` site-wide and for every group."""
+    scores = PostScore.objects.filter(post__is_deleted=False)
+    result = {
+        SITE_SCOPE: list(
+            scores.order_by('-log_score').values_list(
+                'post_id',
+                flat=True,
+                )[:top_k]
+            ),
+        }
+    for group_id in Group.objects.values_list('pk', flat=True):
+        result[group_scope(group_id)] = []
+    ranked = scores.filter(group_id__isnull=False).order_by(
+        'group_id',
+        '-log_score',
+        ).values_list('group_id', 'post_id')
+    for group_id, post_id in ranked.iterator():
+        post_ids = result.setdefault(group_scope(group_id), [])
+        if len(post_ids) < top_k:
+            post_ids.append(post_id)
+    return result
+
+
+def write_snapshots(top_k=None, now=None):
+    """Store the top posts site-wide and per group; drop dead scores."""
+    top_k = top_k or getattr(settings, 'TRENDING_TOP_K', DEFAULT_TOP_K)
+    now = time.time() if now is None else now
+    PostScore.objects.filter(
+        log_score__lt=log_boost(now) + math.log(MIN_SCORE),
+        ).delete()
+    ranked = rankings(top_k)
+    created = timezone.now()
+    with transaction.atomic():
+        snapshots = TrendingSnapshot.objects.in_bulk(
+            list(ranked),
+            field_name='scope',
+            )
+        new = []
+        for scope, post_ids in ranked.items():
+            snapshot = snapshots.get(scope)
+            if snapshot is None:
+                snapshot = TrendingSnapshot(scope=scope)
+                new.append(snapshot)
+            snapshot.post_ids = ','.join(map(str, post_ids))
+            snapshot.created = created
+        TrendingSnapshot.objects.bulk_create(new)
+        TrendingSnapshot.objects.bulk_update(
+            snapshots.values(),
+            ['post_ids', 'created'],
+            )
+    return ranked
+
+
+def update_trending(batch_size=DEFAULT_BATCH_SIZE, top_k=None):
+    """One worker pass; return the number of events folded in."""
+    collected = collect_comments(batch_size)
+    write_snapshots(top_k)
+    return collected
+
+
+def trending_posts(group=None):
+    """Return the posts of the latest snapshot, best first."""
+    scope = SITE_SCOPE if group is None else group_scope(group.pk)
+    post_ids = TrendingSnapshot.objects.filter(scope=scope).values_list(
+        'post_ids',
+        flat=True,
+        ).first()
+    if not post_ids:
+        return []
+    post_ids = [int(post_id) for post_id in post_ids.split(',')]
+    posts = Post.objects.select_related('author', 'group').in_bulk(post_ids)
+    return [posts[post_id] for post_id in post_ids if post_id in posts]
@@ -6,7 +6,15 @@ urlpatterns = [
     path('', views.index, name='index'),
     path("follow/", views.follow_index, name="follow_index"),
     path('group/<slug:slug>/', views.group_post, name='group'),
+    path(
+        'group/<slug:slug>/popular/',
+        views.popular,
+        name='group_popular'),
+    path('popular/', views.popular, name='popular'),
     path('new/', views.new_post, name='new_post'),
+    path('notifications/', views.notifications, name='notifications'),
+    path('feed/updates/', views.feed_updates, name='feed_updates'),
+    path('feed/stream/', views.feed_stream, name='feed_stream'),
     path('<str:username>/', views.profile, name='profile'),
     path('<str:username>/<int:post_id>/', views.post_view, name='post'),
     path(
@@ -0,0 +1,196 @@
+"""Post view counting without a database write per page view.
+
+``record_view`` only touches the in-process ``ViewBuffer``: a counter and
+a HyperLogLog sketch of the viewers per post. Once ``VIEW_FLUSH_INTERVAL``
+seconds passed or ``VIEW_FLUSH_SIZE`` views piled up, the next view flushes
+the aggregated deltas in one transaction: posts with the same delta share
+one ``UPDATE``, sketches are merged into ``PostViewSketch`` and the unique
+viewer estimates copied to ``Post.unique_views``. The deltas are also fed
+to the trending scores.
+
+A crashed worker loses at most one interval of views; ``yatube/wsgi.py``
+flushes the buffer on a clean shutdown. A flush that fails puts the
+views back into the buffer; the request that triggered it only logs
+the error.
+"""
+import hashlib
+import logging
+import math
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+from .models import FeedEntry, Post, PostViewSketch
+from .ratelimit import client_ip
+from .trending import add_events
+
+# 2 ** 10 registers: 1 KiB per sketch, about 3% standard error.
+PRECISION = 10
+REGISTERS = 1 << PRECISION
+DEFAULT_FLUSH_INTERVAL = 10
+DEFAULT_FLUSH_SIZE = 1000
+
+logger = logging.getLogger(__name__)
+
+
+def viewer_hash(viewer):
+    return int.from_bytes(
+        hashlib.blake2b(viewer.encode(), digest_size=8).digest(),
+        'big',
+        )
+
+
+def hll_add(registers, value):
+    """Add a 64-bit hash to the ``bytearray`` of registers."""
+    index = value >> (64 - PRECISION)
+    rest = value & ((1 << (64 - PRECISION)) - 1)
+    rank = 64 - PRECISION - rest.bit_length() + 1
+    if rank > registers[index]:
+        registers[index] = rank
+
+
+def hll_merge(registers, other):
+    for index, rank in enumerate(other):
+        if rank > registers[index]:
+            registers[index] = rank
+
+
+def hll_count(registers):
+    """Estimate the number of distinct hashes added to ``registers``."""
+    alpha = 0.7213 / (1 + 1.079 / REGISTERS)
+    estimate = alpha * REGISTERS ** 2 / sum(2.0 ** -rank for rank in registers)
+    zeros = registers.count(0)
+    if estimate <= 2.5 * REGISTERS and zeros:
+        estimate = REGISTERS * math.log(REGISTERS / zeros)
+    return round(estimate)
+
+
+def request_viewer(request):
+    """Identify the viewer: the user, else the address and user agent."""
+    if request.user.is_authenticated:
+        return f'user:{request.user.pk}'
+    agent = request.META.get('HTTP_USER_AGENT', '')
+    return f'anon:{client_ip(request)}:{agent}'
+
+
+class ViewBuffer:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = defaultdict(int)
+        self.sketches = {}
+        self.pending = 0
+        self.last_flush = time.monotonic()
+
+    def add(self, post_id, viewer):
+        """Buffer one view; return True when a flush is due."""
+        with self.lock:
+            self.counts[post_id] += 1
+            sketch = self.sketches.get(post_id)
+            if sketch is None:
+                sketch = self.sketches[post_id] = bytearray(REGISTERS)
+            hll_add(sketch, viewer_hash(viewer))
+            self.pending += 1
+            interval = getattr(
+                settings,
+                'VIEW_FLUSH_INTERVAL',
+                DEFAULT_FLUSH_INTERVAL,
+                )
+            size = getattr(settings, 'VIEW_FLUSH_SIZE', DEFAULT_FLUSH_SIZE)
+            return (
+                self.pending >= size
+                or time.monotonic() - self.last_flush >= interval
+                )
+
+    def take(self):
+        with self.lock:
+            counts, sketches = self.counts, self.sketches
+            self.counts, self.sketches = defaultdict(int), {}
+            self.pending = 0
+            self.last_flush = time.monotonic()
+        return counts, sketches
+
+    def restore(self, counts, sketches):
+        """Put taken views back, merged with the ones buffered since."""
+        with self.lock:
+            for post_id, count in counts.items():
+                self.counts[post_id] += count
+                self.pending += count
+            for post_id, registers in sketches.items():
+                sketch = self.sketches.get(post_id)
+                if sketch is None:
+                    self.sketches[post_id] = registers
+                else:
+                    hll_merge(sketch, registers)
+
+    def flush(self):
+        """Write the buffered views; return the number of posts updated."""
+        counts, sketches = self.take()
+        if not counts:
+            return 0
+        try:
+            post_ids = self.write(counts, sketches)
+        except Exception:
+            self.restore(counts, sketches)
+            raise
+        now = time.time()
+        add_events(
+            (post_id, 'view', now, counts[post_id]) for post_id in post_ids
+            )
+        return len(post_ids)
+
+    @staticmethod
+    def write(counts, sketches):
+        """Store views and sketches; return the ids of existing posts."""
+        post_ids = set(
+            Post.all_objects.filter(pk__in=counts).values_list('pk', flat=True)
+            )
+        by_delta = defaultdict(list)
+        for post_id in post_ids:
+            by_delta[counts[post_id]].append(post_id)
+        with transaction.atomic():
+            for delta, ids in by_delta.items():
+                Post.all_objects.filter(pk__in=ids).update(
+                    views=F('views') + delta,
+                    )
+                FeedEntry.objects.filter(pk__in=ids).update(
+                    views=F('views') + delta,
+                    )
+            stored = PostViewSketch.objects.select_for_update().in_bulk(
+                list(post_ids),
+                )
+            created = []
+            for post_id in post_ids:
+                registers = sketches[post_id]
+                if post_id in stored:
+                    hll_merge(registers, stored[post_id].registers)
+                    stored[post_id].registers = bytes(registers)
+                else:
+                    created.append(PostViewSketch(
+                        post_id=post_id,
+                        registers=bytes(registers),
+                        ))
+            PostViewSketch.objects.bulk_create(created)
+            PostViewSketch.objects.bulk_update(stored.values(), ['registers'])
+            Post.all_objects.bulk_update(
+                [
+                    Post(pk=post_id, unique_views=hll_count(sketches[post_id]))
+                    for post_id in post_ids
+                    ],
+                ['unique_views'],
+                )
+        return post_ids
+
+
+view_buffer = ViewBuffer()
+
+
+def record_view(request, post):
+    if view_buffer.add(post.pk, request_viewer(request)):
+        try:
+            view_buffer.flush()
+        except Exception:
+            logger.exception('Could not flush post views')
@@ -1,18 +1,36 @@
+import json
+import time
+
 from django.contrib.auth.decorators import login_required
 from django.core.paginator import Paginator
+from django.db import transaction
+from django.http import Http404, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
-from django.views.decorators.cache import cache_page
+from django.template.loader import render_to_string
 from users.forms import User
+from yatube.cache import cache_page, get_or_compute
 
-from posts.models import Comment, Follow, Group, Post
+from posts.models import FeedEntry, Follow, Group, Notification, Post
 
+from .authors import author_header
+from .detail import post_detail
 from .forms import CommentForm, PostForm
+from .notifications import mark_all_read, notify_new_comment, notify_new_post
+from .ratelimit import close_slot, open_slot, ratelimit, too_many_requests
+from .revisions import record_revision
+from .storage import is_blob, release_image
+from .tasks import process_post_image
+from .trending import trending_posts
+from .viewcounts import record_view
+
 
+FEED_COUNT_TIMEOUT = 30
 
-@cache_page(20)
+
+@cache_page(20, tags=['feed:index'])
 def index(request):
     """Render the main page and 10 latest posts per page."""
-    post_list = Post.objects.order_by('-pub_date').all()
+    post_list = FeedEntry.objects.all()
     paginator = Paginator(post_list, 10)
 
     page_number = request.GET.get('page')
@@ -27,8 +45,14 @@ def index(request):
 def group_post(request, slug):
     """Render the group page and 10 posts per page."""
     group = get_object_or_404(Group, slug=slug)
-    post_list = group.posts.all()
+    post_list = FeedEntry.objects.filter(group=group)
     paginator = Paginator(post_list, 10)
+    paginator.count = get_or_compute(
+        f'count:group:{group.pk}',
+        post_list.count,
+        FEED_COUNT_TIMEOUT,
+        tags=[f'feed:group:{group.pk}'],
+        )
     page_number = request.GET.get('page')
     page = paginator.get_page(page_number)
     return render(
@@ -38,7 +62,21 @@ def group_post(request, slug):
         )
 
 
+def popular(request, slug=None):
+    """Render the latest trending snapshot, 10 posts per page."""
+    group = None if slug is None else get_object_or_404(Group, slug=slug)
+    paginator = Paginator(trending_posts(group), 10)
+    page_number = request.GET.get('page')
+    page = paginator.get_page(page_number)
+    return render(
+        request,
+        'popular.html',
+        {'group': group, 'page': page, 'paginator': paginator},
+        )
+
+
 @login_required
+@ratelimit('new_post')
 def new_post(request):
     """Render new post page.
 
@@ -48,22 +86,30 @@ def new_post(request):
     if form.is_valid():
         post = form.save(commit=False)
         post.author = request.user
-        post.save()
+        with transaction.atomic():
+            post.save()
+            notify_new_post(post)
+        if post.image:
+            process_post_image.delay(post.pk)
         return redirect('index')
     return render(request, 'new_post.html', {'form': form})
 
 
 def post_view(request, username, post_id):
     """Render post page."""
-    post = get_object_or_404(Post, pk=post_id, author__username=username)
+    detail = post_detail(username, post_id)
+    if detail is None:
+        raise Http404
+    post, header, сomments = detail
+    record_view(request, post)
     form = CommentForm()
-    сomments = Comment.objects.filter(post=post_id)
     return render(
         request,
         'post.html',
         {
             'post': post,
             'author': post.author,
+            'header': header,
             'сomments': сomments,
             'form': form,
             },
@@ -71,6 +117,7 @@ def post_view(request, username, post_id):
 
 
 @login_required
+@ratelimit('add_comment')
 def add_comment(request, username, post_id):
     """Adds text comment to post."""
     post = get_object_or_404(Post, author__username=username, pk=post_id)
@@ -78,7 +125,9 @@ def add_comment(request, username, post_id):
     if form.is_valid():
         form.instance.author = request.user
         form.instance.post = post
-        form.save()
+        with transaction.atomic():
+            comment = form.save()
+            notify_new_comment(comment)
         return redirect('post', username, post_id)
     return redirect('post', username, post_id)
 
@@ -88,26 +137,25 @@ def profile(request, username):
 
     Include athor block.
     """
-    author = get_object_or_404(
-        User.objects.prefetch_related('posts'),
-        username=username,
-        )
-    post_list = author.posts.all()
+    author = get_object_or_404(User, username=username)
+    header = author_header(author)
+    post_list = FeedEntry.objects.filter(author=author)
     paginator = Paginator(post_list, 10)
+    paginator.count = get_or_compute(
+        f'count:author:{author.pk}',
+        post_list.count,
+        FEED_COUNT_TIMEOUT,
+        tags=[f'user:{author.pk}'],
+        )
     page_number = request.GET.get('page')
     page = paginator.get_page(page_number)
-    following = None
-    if not request.user.is_anonymous or request.user.is_authenticated:
-        following = Follow.objects.filter(
-            user=request.user,
-            author=author)
     return render(
         request, 'profile.html',
         {
             'author': author,
+            'header': header,
             'page': page,
             'paginator': paginator,
-            'following': following,
             },
         )
 
@@ -126,13 +174,21 @@ def post_edit(request, username, post_id):
         pk=post_id,
         author__username=username,
         )
+    previous_text = post.text
+    previous_image = post.image.name
     form = PostForm(
         request.POST or None,
         files=request.FILES or None,
         instance=post,
         )
     if form.is_valid():
-        post = form.save()
+        with transaction.atomic():
+            post = form.save()
+            record_revision(post, previous_text)
+            if is_blob(previous_image) and post.image.name != previous_image:
+                transaction.on_commit(lambda: release_image(previous_image))
+        if post.image and post.image.name != previous_image:
+            process_post_image.delay(post.pk)
         return redirect('post', username, post_id)
     return render(request, 'new_post.html', {'form': form, 'post': post})
 
@@ -159,7 +215,9 @@ def server_error(request):
 @login_required
 def follow_index(request):
     """Render page with 10 following author posts per page."""
-    latest = Post.objects.filter(author__following__user=request.user)
+    latest = FeedEntry.objects.filter(
+        author__in=Follow.objects.filter(user=request.user).values('author'),
+        )
     paginator = Paginator(latest, 10)
     page_number = request.GET.get('page')
     page = paginator.get_page(page_number)
@@ -171,6 +229,25 @@ def follow_index(request):
 
 
 @login_required
+def notifications(request):
+    """Render notifications of the user, 10 per page, and mark them read."""
+    notification_list = Notification.objects.filter(
+        recipient=request.user,
+        ).select_related('event__actor', 'event__post__author')
+    paginator = Paginator(notification_list, 10)
+    page_number = request.GET.get('page')
+    page = paginator.get_page(page_number)
+    response = render(
+        request,
+        'notifications.html',
+        {'page': page, 'paginator': paginator},
+        )
+    mark_all_read(request.user)
+    return response
+
+
+@login_required
+@ratelimit('profile_follow', methods=('GET', 'POST'))
 def profile_follow(request, username):
     follower = request.user
     following = get_object_or_404(User, username=username)
@@ -186,3 +263,148 @@ def profile_unfollow(request, username):
     following = get_object_or_404(User, username=username)
     Follow.objects.get(user=follower, author=following).delete()
     return profile(request, username)
+
+
+FEED_UPDATES_LIMIT = 20
+FEED_POLL_INTERVAL = 2
+FEED_MAX_WAIT = 10
+FEED_STREAM_DURATION = 15
+# Requests of one client IP or user holding a worker at the same time.
+FEED_OPEN_LIMIT = 2
+
+
+def feed_posts(request, feed):
+    """Return the entries of ``index``, ``follow`` or ``group:<slug>``."""
+    if feed == 'index':
+        return FeedEntry.objects.all()
+    if feed == 'follow':
+        if not request.user.is_authenticated:
+            raise Http404
+        return FeedEntry.objects.filter(
+            author__in=Follow.objects.filter(user=request.user).values(
+                'author',
+                ),
+            )
+    if feed.startswith('group:'):
+        group = get_object_or_404(Group, slug=feed[len('group:'):])
+        return FeedEntry.objects.filter(group=group)
+    raise Http404
+
+
+def newer_post_ids(posts, after):
+    """Return ids of posts newer than ``after``, newest first.
+
+    For the index feed this is answered from the primary key index.
+    """
+    return list(
+        posts.filter(pk__gt=after).order_by('-pk').values_list(
+            'pk',
+            flat=True,
+            )[:FEED_UPDATES_LIMIT + 1]
+        )
+
+
+def feed_params(request):
+    try:
+        after = int(request.META.get(
+            'HTTP_LAST_EVENT_ID',
+            request.GET.get('after', 0),
+            ))
+        wait = min(float(request.GET.get('wait', 0)), FEED_MAX_WAIT)
+    except ValueError:
+        raise Http404
+    return request.GET.get('feed', 'index'), after, wait
+
+
+@ratelimit('feed_updates', methods=('GET',))
+def feed_updates(request):
+    """Return posts newer than ``after`` in a feed.
+
+    With ``count=1`` only the number of new posts is returned, otherwise
+    the rendered feed entries as well. ``wait=<seconds>`` holds the
+    request (long polling) until a new post appears or the time is up;
+    each client may hold only ``FEED_OPEN_LIMIT`` such requests.
+    """
+    feed, after, wait = feed_params(request)
+    posts = feed_posts(request, feed)
+    ids = newer_post_ids(posts, after)
+    if not ids and wait > 0:
+        slot = open_slot('feed', request, FEED_OPEN_LIMIT, FEED_MAX_WAIT * 2)
+        if slot is None:
+            return too_many_requests()
+        try:
+            deadline = time.monotonic() + wait
+            while not ids and time.monotonic() < deadline:
+                time.sleep(FEED_POLL_INTERVAL)
+                ids = newer_post_ids(posts, after)
+        finally:
+            close_slot(slot)
+    data = {
+        'count': min(len(ids), FEED_UPDATES_LIMIT),
+        'more': len(ids) > FEED_UPDATES_LIMIT,
+        'newest': ids[0] if ids else after,
+        }
+    if ids and not request.GET.get('count'):
+        entries = FeedEntry.objects.filter(pk__in=ids[:FEED_UPDATES_LIMIT])
+        data['html'] = ''.join(
+            render_to_string(
+                'includes/feed_entry.html',
+                {'post': entry},
+                request,
+                )
+            for entry in entries
+            )
+    return JsonResponse(data)
+
+
+@ratelimit('feed_updates', methods=('GET',))
+def feed_stream(request):
+    """Push the number of new posts in a feed as server-sent events.
+
+    Each response lives for ``FEED_STREAM_DURATION`` seconds; EventSource
+    reconnects by itself and sends the last event id back as ``after``.
+    Each client may keep only ``FEED_OPEN_LIMIT`` streams open.
+    """
+    feed, after, _ = feed_params(request)
+    posts = feed_posts(request, feed)
+    slot = open_slot(
+        'feed',
+        request,
+        FEED_OPEN_LIMIT,
+        FEED_STREAM_DURATION * 2,
+        )
+    if slot is None:
+        return too_many_requests()
+
+    def events(after):
+        deadline = time.monotonic() + FEED_STREAM_DURATION
+        yield f'retry: {FEED_POLL_INTERVAL * 1000}\n\n'
+        while time.monotonic() < deadline:
+            ids = newer_post_ids(posts, after)
+            if ids:
+                after = ids[0]
+                data = json.dumps({'count': len(ids), 'newest': after})
+                yield f'id: {after}\nevent: posts\ndata: {data}\n\n'
+            else:
+                yield ': keep-alive\n\n'
+            time.sleep(FEED_POLL_INTERVAL)
+
+    response = StreamingHttpResponse(
+        events(after),
+        content_type='text/event-stream',
+        )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    close = response.close
+
+    def close_stream():
+        # The server closes every response, also one it never iterated,
+        # e.g. when the client is gone before the first event.
+        nonlocal slot
+        if slot is not None:
+            close_slot(slot)
+            slot = None
+        close()
+
+    response.close = close_stream
+    return response
@@ -1,3 +1,44 @@
 from django.contrib import admin
+from django.contrib.auth.admin import UserAdmin
+from posts.deletion import soft_delete_user
 
-# Register your models here.
+from .models import DeletionRequest, OutgoingEmail, User
+
+
+class SoftDeleteUserAdmin(UserAdmin):
+    """User admin that queues users for the reaper instead of cascading."""
+
+    def delete_model(self, request, obj):
+        soft_delete_user(obj)
+
+    def delete_queryset(self, request, queryset):
+        for user in queryset:
+            soft_delete_user(user)
+
+
+class DeletionRequestAdmin(admin.ModelAdmin):
+    """Admin model for DeletionRequest class objects."""
+    list_display = ('pk', 'user', 'requested')
+    list_select_related = ('user',)
+    raw_id_fields = ('user',)
+
+
+class OutgoingEmailAdmin(admin.ModelAdmin):
+    """Admin model for OutgoingEmail class objects."""
+    list_display = (
+        'pk',
+        'recipients',
+        'created',
+        'attempts',
+        'sent',
+        'failed',
+        )
+    list_filter = ('failed',)
+    exclude = ('message',)
+    readonly_fields = ('last_error',)
+
+
+admin.site.unregister(User)
+admin.site.register(User, SoftDeleteUserAdmin)
+admin.site.register(DeletionRequest, DeletionRequestAdmin)
+admin.site.register(OutgoingEmail, OutgoingEmailAdmin)
@@ -1,11 +1,37 @@
+from django import forms
 from django.contrib.auth import get_user_model
 from django.contrib.auth.forms import UserCreationForm
+from django.urls import get_resolver
 
 User = get_user_model()
 
 
+def route_prefixes(resolver):
+    """Literal first path segments of ``resolver`` and its includes."""
+    prefixes = set()
+    for pattern in resolver.url_patterns:
+        head = str(pattern.pattern).lstrip('^').split('/')[0]
+        if not head:
+            if hasattr(pattern, 'url_patterns'):
+                prefixes |= route_prefixes(pattern)
+        elif '<' not in head and '(' not in head:
+            prefixes.add(head)
+    return prefixes
+
+
+def is_reserved(username):
+    """True when ``/<username>/...`` would collide with a site route."""
+    return username in route_prefixes(get_resolver())
+
+
 class CreationForm(UserCreationForm):
     """Class that creating form to sign up new user."""
     class Meta(UserCreationForm.Meta):
         model = User
         fields = ('first_name', 'last_name', 'username', 'email')
+
+    def clean_username(self):
+        username = self.cleaned_data['username']
+        if is_reserved(username):
+            raise forms.ValidationError('Это имя пользователя занято.')
+        return username
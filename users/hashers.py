@@ -0,0 +1,86 @@
+"""Password hashers for the hashing tiers configured in settings.
+
+Django 2.2 has no scrypt hasher, so it is provided here on top of
+``hashlib.scrypt``. Argon2 is preferred when ``argon2-cffi`` is installed.
+"""
+import base64
+import hashlib
+
+from django.contrib.auth.hashers import BasePasswordHasher, mask_hash
+from django.utils.crypto import constant_time_compare, get_random_string
+from django.utils.translation import gettext_noop as _
+
+
+class ScryptPasswordHasher(BasePasswordHasher):
+    """Memory-hard scrypt hasher tuned for about 50 ms and 16 MiB."""
+    algorithm = 'scrypt'
+    work_factor = 2 ** 14
+    block_size = 8
+    parallelism = 1
+    dklen = 64
+
+    def encode(self, password, salt, n=None, r=None, p=None):
+        assert password is not None
+        assert salt and '$' not in salt
+        n = n or self.work_factor
+        r = r or self.block_size
+        p = p or self.parallelism
+        digest = hashlib.scrypt(
+            password.encode(),
+            salt=salt.encode(),
+            n=n,
+            r=r,
+            p=p,
+            maxmem=256 * n * r,
+            dklen=self.dklen,
+            )
+        digest = base64.b64encode(digest).decode('ascii').strip()
+        return f'{self.algorithm}${n}${r}${p}${salt}${digest}'
+
+    def decode(self, encoded):
+        algorithm, n, r, p, salt, digest = encoded.split('$')
+        assert algorithm == self.algorithm
+        return {
+            'algorithm': algorithm,
+            'n': int(n),
+            'r': int(r),
+            'p': int(p),
+            'salt': salt,
+            'hash': digest,
+            }
+
+    def salt(self):
+        return get_random_string(22)
+
+    def verify(self, password, encoded):
+        decoded = self.decode(encoded)
+        encoded_2 = self.encode(
+            password,
+            decoded['salt'],
+            decoded['n'],
+            decoded['r'],
+            decoded['p'],
+            )
+        return constant_time_compare(encoded, encoded_2)
+
+    def safe_summary(self, encoded):
+        decoded = self.decode(encoded)
+        return {
+            _('algorithm'): decoded['algorithm'],
+            _('work factor'): decoded['n'],
+            _('block size'): decoded['r'],
+            _('parallelism'): decoded['p'],
+            _('salt'): mask_hash(decoded['salt']),
+            _('hash'): mask_hash(decoded['hash']),
+            }
+
+    def must_update(self, encoded):
+        decoded = self.decode(encoded)
+        return (decoded['n'], decoded['r'], decoded['p']) != (
+            self.work_factor,
+            self.block_size,
+            self.parallelism,
+            )
+
+    def harden_runtime(self, password, encoded):
+        pass
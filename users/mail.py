@@ -0,0 +1,170 @@
+"""Queued email delivery.
+
+``QueuedEmailBackend`` is the ``EMAIL_BACKEND`` used by the site: it only
+stores messages in ``OutgoingEmail``, so password reset and other auth
+flows never wait for a mail server. ``manage.py send_queued_mail`` sends
+them in batches, reusing one connection of ``EMAIL_DELIVERY_BACKEND`` per
+batch, and retries failures with exponential backoff.
+
+Messages are stored as the bytes that go over the wire, with the
+envelope sender and recipients beside them. A worker claims a row by
+moving its ``next_attempt`` ``CLAIM_TIMEOUT`` ahead, so two workers never
+send the same message, and a row claimed by a dead worker is due again
+once the claim runs out. Sent rows are kept ``EMAIL_KEEP_SENT`` days.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+from django.db import transaction
+from django.utils import timezone
+
+from .models import OutgoingEmail
+
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_RETRY_DELAY = 60
+DEFAULT_KEEP_SENT = 7
+CLAIM_TIMEOUT = timedelta(minutes=10)
+
+
+class QueuedEmailBackend(BaseEmailBackend):
+    """Email backend that persists messages for the delivery worker."""
+
+    def send_messages(self, email_messages):
+        now = timezone.now()
+        queued = [
+            OutgoingEmail(
+                message=message.message().as_bytes(),
+                sender=message.from_email,
+                recipients='\n'.join(message.recipients()),
+                next_attempt=now,
+                )
+            for message in email_messages
+            if message.recipients()
+            ]
+        OutgoingEmail.objects.bulk_create(queued)
+        return len(queued)
+
+
+class RawMessage:
+    """Stored message bytes with the interface backends read."""
+
+    def __init__(self, data):
+        self.data = data
+
+    def as_bytes(self, unixfrom=False, linesep='\n'):
+        lines = self.data.replace(b'\r\n', b'\n').split(b'\n')
+        return linesep.encode().join(lines)
+
+    def get_charset(self):
+        return None
+
+
+class StoredEmailMessage(EmailMessage):
+    """``EmailMessage`` that sends an ``OutgoingEmail`` unchanged."""
+
+    def __init__(self, email):
+        super().__init__(
+            from_email=email.sender,
+            to=email.recipients.split('\n'),
+            )
+        self.data = bytes(email.message)
+
+    def message(self):
+        return RawMessage(self.data)
+
+
+def retry_delay(attempts):
+    """Seconds to wait after ``attempts`` failed attempts."""
+    base = getattr(settings, 'EMAIL_RETRY_DELAY', DEFAULT_RETRY_DELAY)
+    return base * 2 ** (attempts - 1)
+
+
+def claim(batch_size, now):
+    """Claim up to ``batch_size`` due messages for this worker."""
+    due = OutgoingEmail.objects.filter(
+        sent=None,
+        failed=False,
+        next_attempt__lte=now,
+        )
+    claimed = []
+    for email in due.order_by('next_attempt')[:batch_size]:
+        # Rows another worker claimed meanwhile no longer match.
+        if due.filter(pk=email.pk).update(next_attempt=now + CLAIM_TIMEOUT):
+            claimed.append(email)
+    return claimed
+
+
+def record_failure(email, error, now):
+    max_attempts = getattr(
+        settings,
+        'EMAIL_MAX_ATTEMPTS',
+        DEFAULT_MAX_ATTEMPTS,
+        )
+    email.attempts += 1
+    email.last_error = repr(error)
+    email.failed = email.attempts >= max_attempts
+    email.next_attempt = now + timedelta(seconds=retry_delay(email.attempts))
+    email.save(update_fields=[
+        'attempts',
+        'last_error',
+        'failed',
+        'next_attempt',
+        ])
+
+
+def send_batch(batch_size=DEFAULT_BATCH_SIZE, connection=None):
+    """Send one batch of due messages; return ``(sent, failed)``."""
+    now = timezone.now()
+    batch = claim(batch_size, now)
+    if not batch:
+        return 0, 0
+    if connection is None:
+        connection = get_connection(
+            settings.EMAIL_DELIVERY_BACKEND,
+            fail_silently=False,
+            )
+    sent = failed = 0
+    pending = iter(batch)
+    try:
+        connection.open()
+        for email in pending:
+            try:
+                connection.send_messages([StoredEmailMessage(email)])
+            except Exception as error:
+                failed += 1
+                record_failure(email, error, now)
+                # The connection may be broken now, start a fresh one.
+                connection.close()
+                connection.open()
+            else:
+                sent += 1
+                email.attempts += 1
+                email.sent = timezone.now()
+                email.save(update_fields=['attempts', 'sent'])
+    except Exception as error:
+        # The server cannot be reached: the rest of the batch failed.
+        for email in pending:
+            failed += 1
+            record_failure(email, error, now)
+    finally:
+        connection.close()
+    return sent, failed
+
+
+def purge_sent(batch_size=DEFAULT_BATCH_SIZE * 10):
+    """Delete messages sent over ``EMAIL_KEEP_SENT`` days ago."""
+    days = getattr(settings, 'EMAIL_KEEP_SENT', DEFAULT_KEEP_SENT)
+    old = OutgoingEmail.objects.filter(
+        sent__lt=timezone.now() - timedelta(days=days),
+        )
+    total = 0
+    while True:
+        with transaction.atomic():
+            pks = list(old.values_list('pk', flat=True)[:batch_size])
+            if not pks:
+                return total
+            OutgoingEmail.objects.filter(pk__in=pks).delete()
+        total += len(pks)
@@ -0,0 +1,93 @@
+import csv
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+
+from users.forms import is_reserved
+
+User = get_user_model()
+
+FIELDS = ('username', 'email', 'password', 'first_name', 'last_name')
+
+
+class Command(BaseCommand):
+    help = (
+        'Create users from a CSV file with the columns '
+        'username,email,password[,first_name,last_name]. '
+        'Passwords are hashed in a process pool; existing and reserved '
+        'usernames are skipped.'
+        )
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_file')
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count(),
+            help='Size of the hashing process pool.',
+            )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Users hashed and inserted per batch.',
+            )
+
+    @staticmethod
+    def count_inserted(users):
+        """Count ``users`` that were inserted, not dropped as conflicts."""
+        # Salted hashes are unique, so a matching one is our own row.
+        passwords = {user.username: user.password for user in users}
+        stored = User.objects.filter(
+            username__in=list(passwords),
+            ).values_list('username', 'password')
+        return sum(
+            1 for username, password in stored
+            if passwords[username] == password
+            )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        created = 0
+        with open(options['csv_file'], newline='') as source, \
+                ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            rows = csv.DictReader(source, fieldnames=FIELDS, restval='')
+            while True:
+                batch = list(islice(rows, batch_size))
+                if not batch:
+                    break
+                existing = set(User.objects.filter(
+                    username__in=[row['username'] for row in batch],
+                    ).values_list('username', flat=True))
+                new_rows = []
+                for row in batch:
+                    if (row['username'] not in existing
+                            and not is_reserved(row['username'])):
+                        existing.add(row['username'])
+                        new_rows.append(row)
+                batch = new_rows
+                if not batch:
+                    continue
+                hashes = pool.map(
+                    make_password,
+                    [row['password'] for row in batch],
+                    chunksize=max(1, len(batch) // (options['workers'] * 4)),
+                    )
+                users = [
+                    User(
+                        username=row['username'],
+                        email=row['email'],
+                        first_name=row['first_name'],
+                        last_name=row['last_name'],
+                        password=password,
+                        )
+                    for row, password in zip(batch, hashes)
+                    ]
+                User.objects.bulk_create(users, ignore_conflicts=True)
+                created += self.count_inserted(users)
+                self.stdout.write(f'Created {created} users so far.')
+        self.stdout.write(f'Created {created} users.')
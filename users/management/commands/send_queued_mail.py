@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from users.mail import DEFAULT_BATCH_SIZE, purge_sent, send_batch
+
+
+class Command(BaseCommand):
+    help = 'Send queued email messages in batches over one connection.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help='Messages sent over one connection.',
+            )
+        parser.add_argument(
+            '--loop',
+            type=float,
+            default=0,
+            metavar='SECONDS',
+            help='Keep running, sleeping SECONDS when the queue is empty.',
+            )
+
+    def handle(self, *args, **options):
+        purged = purge_sent()
+        if purged:
+            self.stdout.write(f'Deleted {purged} old sent messages.')
+        while True:
+            sent, failed = send_batch(options['batch_size'])
+            if sent or failed:
+                self.stdout.write(f'Sent {sent} messages, {failed} failed.')
+                continue
+            if not options['loop']:
+                return
+            time.sleep(options['loop'])
@@ -0,0 +1,59 @@
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.utils.crypto import constant_time_compare
+from django.utils.functional import SimpleLazyObject
+
+USER_CACHE_TIMEOUT = 60
+
+
+def user_cache_key(user_id):
+    return f'auth:user:{user_id}'
+
+
+def get_cached_user(request):
+    """Return the session user, from the cache when possible.
+
+    Performs the same checks as ``django.contrib.auth.get_user``: the
+    backend must still be configured and the session hash must match the
+    current password, otherwise the session is flushed. Without a shared
+    cache (``SHARED_CACHE``) users are always read from the database.
+    """
+    if not getattr(settings, 'SHARED_CACHE', False):
+        return auth.get_user(request)
+    session = request.session
+    user_id = session.get(auth.SESSION_KEY)
+    backend_path = session.get(auth.BACKEND_SESSION_KEY)
+    if user_id is None or backend_path not in settings.AUTHENTICATION_BACKENDS:
+        return AnonymousUser()
+    key = user_cache_key(user_id)
+    user = cache.get(key)
+    if user is None:
+        user = auth.get_user(request)
+        if user.is_authenticated:
+            cache.set(
+                key,
+                user,
+                getattr(settings, 'USER_CACHE_TIMEOUT', USER_CACHE_TIMEOUT),
+                )
+        return user
+    session_hash = session.get(auth.HASH_SESSION_KEY)
+    if not (session_hash and constant_time_compare(
+            session_hash,
+            user.get_session_auth_hash())):
+        session.flush()
+        return AnonymousUser()
+    return user
+
+
+class CachedAuthenticationMiddleware(AuthenticationMiddleware):
+    """Authentication middleware reading users from a short-TTL cache.
+
+    Cached users are dropped whenever the user row is saved or deleted,
+    see users/signals.py, so a password change takes effect at once.
+    """
+
+    def process_request(self, request):
+        request.user = SimpleLazyObject(lambda: get_cached_user(request))
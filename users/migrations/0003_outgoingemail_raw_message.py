@@ -0,0 +1,41 @@
+# Generated by Django 2.2.6 on 2026-10-19 11:01
+
+import pickle
+
+from django.db import migrations, models
+
+
+def unpickle_messages(apps, schema_editor):
+    """Replace the pickled messages queued so far with their bytes."""
+    OutgoingEmail = apps.get_model('users', 'OutgoingEmail')
+    for email in OutgoingEmail.objects.iterator():
+        message = pickle.loads(email.message)
+        email.message = message.message().as_bytes()
+        email.sender = message.from_email
+        email.recipients = '\n'.join(message.recipients())
+        email.save(update_fields=['message', 'sender', 'recipients'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_outgoingemail'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outgoingemail',
+            name='sender',
+            field=models.TextField(blank=True, verbose_name='Отправитель'),
+        ),
+        migrations.RunPython(unpickle_messages, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='outgoingemail',
+            name='next_attempt',
+            field=models.DateTimeField(verbose_name='Следующая попытка'),
+        ),
+        migrations.AddIndex(
+            model_name='outgoingemail',
+            index=models.Index(condition=models.Q(('failed', False), ('sent', None)), fields=['next_attempt'], name='users_mail_pending_idx'),
+        ),
+    ]
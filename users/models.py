@@ -1,3 +1,76 @@
+from django.contrib.auth import get_user_model
 from django.db import models
 
-# Create your models here.
+User = get_user_model()
+
+
+class DeletionRequest(models.Model):
+    """Class for users waiting to be removed by the reaper.
+
+    The user is deactivated and their posts are hidden as soon as the
+    request is created; the rows themselves are deleted in batches later.
+    """
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        related_name='deletion_request',
+        verbose_name='Пользователь',
+        )
+    requested = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Дата запроса',
+        )
+
+    def __str__(self):
+        return f'user:{self.user}'
+
+
+class OutgoingEmail(models.Model):
+    """Class for queued email messages, see mail.py."""
+    message = models.BinaryField(
+        verbose_name='Письмо',
+        )
+    sender = models.TextField(
+        blank=True,
+        verbose_name='Отправитель',
+        )
+    recipients = models.TextField(
+        verbose_name='Получатели',
+        )
+    created = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Дата постановки в очередь',
+        )
+    next_attempt = models.DateTimeField(
+        verbose_name='Следующая попытка',
+        )
+    attempts = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Число попыток',
+        )
+    sent = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Дата отправки',
+        )
+    failed = models.BooleanField(
+        default=False,
+        verbose_name='Доставка прекращена',
+        )
+    last_error = models.TextField(
+        blank=True,
+        verbose_name='Последняя ошибка',
+        )
+
+    class Meta:
+        """Only messages waiting to be sent are indexed for the worker"""
+        indexes = (
+            models.Index(
+                fields=('next_attempt',),
+                name='users_mail_pending_idx',
+                condition=models.Q(sent=None, failed=False),
+                ),
+            )
+
+    def __str__(self):
+        return f'{self.recipients} attempts:{self.attempts}'
@@ -0,0 +1,22 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from yatube.cache import invalidate_on_commit
+
+from .middleware import user_cache_key
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def drop_cached_user(sender, instance, **kwargs):
+    """Forget the cached copy of a changed user, e.g. after a new password."""
+    key = user_cache_key(instance.pk)
+    cache.delete(key)
+    if connection.in_atomic_block:
+        # Requests between the save and the commit cache the old row.
+        transaction.on_commit(lambda: cache.delete(key))
+    invalidate_on_commit(f'user:{instance.pk}')
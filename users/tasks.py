@@ -0,0 +1,14 @@
+"""Background tasks of the users app, see yatube/taskqueue.py."""
+from yatube.taskqueue import task
+
+from .mail import purge_sent, send_batch
+
+
+@task(every=30, retries=0, concurrency=1)
+def send_queued_mail():
+    send_batch()
+
+
+@task(every=24 * 60 * 60, retries=0, concurrency=1)
+def purge_sent_mail():
+    purge_sent()
@@ -1,3 +1,271 @@
-from django.test import TestCase
+import socketserver
+import tempfile
+import threading
+from datetime import timedelta
+from io import StringIO
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.mail import get_connection
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .forms import CreationForm, is_reserved
+from .hashers import ScryptPasswordHasher
+from .mail import claim, purge_sent, send_batch
+from .management.commands.provision_users import (
+    Command as ProvisionCommand)
+from .middleware import user_cache_key
+from .models import OutgoingEmail
+from .validators import CommonPasswordValidator
+
+User = get_user_model()
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP to accept messages from smtplib."""
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        self.reply('220 localhost')
+        while True:
+            line = self.rfile.readline().decode().strip()
+            command = line[:4].upper()
+            if not line or command == 'QUIT':
+                self.reply('221 bye')
+                return
+            if command == 'DATA':
+                self.reply('354 go ahead')
+                data = []
+                for raw in iter(self.rfile.readline, b''):
+                    if raw.rstrip(b'\r\n') == b'.':
+                        break
+                    data.append(raw)
+                if self.server.fail:
+                    self.reply('451 try again later')
+                else:
+                    self.server.messages.append(b''.join(data))
+                    self.reply('250 queued')
+            else:
+                self.reply('250 ok')
+
+
+class LocalSMTPServer(socketserver.ThreadingTCPServer):
+    """SMTP stand-in collecting messages in ``messages``."""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), SMTPHandler)
+        self.messages = []
+        self.fail = False
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+@override_settings(
+    EMAIL_BACKEND='users.mail.QueuedEmailBackend',
+    EMAIL_RETRY_DELAY=0,
+    EMAIL_MAX_ATTEMPTS=2,
+    )
+class QueuedEmailTest(TestCase):
+    def setUp(self):
+        self.smtp = LocalSMTPServer()
+        self.addCleanup(self.smtp.stop)
+        User.objects.create_user(
+            username='sarah',
+            email='sarah@example.com',
+            password='12345',
+            )
+
+    def connection(self):
+        return get_connection(
+            'django.core.mail.backends.smtp.EmailBackend',
+            host='127.0.0.1',
+            port=self.smtp.server_address[1],
+            timeout=5,
+            )
+
+    def request_reset(self):
+        response = Client().post(
+            reverse('password_reset'),
+            {'email': 'sarah@example.com'},
+            )
+        self.assertEqual(response.status_code, 302)
+
+    def test_password_reset_queued_then_sent(self):
+        """Check that the reset mail waits in the queue for the worker."""
+        self.request_reset()
+        self.assertEqual(OutgoingEmail.objects.count(), 1)
+        self.assertEqual(self.smtp.messages, [])
+        self.assertEqual(send_batch(connection=self.connection()), (1, 0))
+        self.assertEqual(len(self.smtp.messages), 1)
+        self.assertIn(b'sarah@example.com', self.smtp.messages[0])
+        self.assertIsNotNone(OutgoingEmail.objects.get().sent)
+
+    def test_retry_with_backoff(self):
+        """Check that failed messages are retried, then given up."""
+        self.request_reset()
+        self.smtp.fail = True
+        self.assertEqual(send_batch(connection=self.connection()), (0, 1))
+        email = OutgoingEmail.objects.get()
+        self.assertEqual(email.attempts, 1)
+        self.assertFalse(email.failed)
+        self.assertEqual(send_batch(connection=self.connection()), (0, 1))
+        self.assertTrue(OutgoingEmail.objects.get().failed)
+        self.assertEqual(send_batch(connection=self.connection()), (0, 0))
+
+    def test_unreachable_server(self):
+        """Check that a refused connection counts as a failed attempt."""
+        self.request_reset()
+        connection = self.connection()
+        self.smtp.stop()
+        self.assertEqual(send_batch(connection=connection), (0, 1))
+        email = OutgoingEmail.objects.get()
+        self.assertEqual(email.attempts, 1)
+        self.assertIsNone(email.sent)
+        self.assertNotEqual(email.last_error, '')
+
+    def test_claimed_message_sent_once(self):
+        """Check that a message claimed by another worker is skipped."""
+        self.request_reset()
+        self.assertEqual(len(claim(10, timezone.now())), 1)
+        self.assertEqual(send_batch(connection=self.connection()), (0, 0))
+        self.assertEqual(self.smtp.messages, [])
+
+    def test_old_sent_messages_purged(self):
+        """Check that only messages sent long ago are deleted."""
+        self.request_reset()
+        self.request_reset()
+        send_batch(connection=self.connection())
+        old = OutgoingEmail.objects.first()
+        old.sent = timezone.now() - timedelta(days=30)
+        old.save()
+        self.assertEqual(purge_sent(), 1)
+        self.assertEqual(OutgoingEmail.objects.count(), 1)
+
+
+@override_settings(
+    SHARED_CACHE=True,
+    SESSION_ENGINE='django.contrib.sessions.backends.cached_db',
+    )
+class CachedAuthTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='sarah', password='1')
+        self.client = Client()
+        self.client.force_login(self.user)
+        self.url = reverse('new_post')
+
+    def auth_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return [
+            query['sql'] for query in queries
+            if 'auth_user' in query['sql'] or 'django_session' in query['sql']
+            ]
+
+    def test_no_session_or_user_queries_when_warm(self):
+        """Check that a warm request reads neither session nor user rows."""
+        self.auth_queries()
+        self.assertEqual(self.auth_queries(), [])
+
+    def test_password_change_invalidates(self):
+        """Check that changing the password logs the old session out."""
+        self.auth_queries()
+        self.user.set_password('2')
+        self.user.save()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 302)
+
+    @override_settings(
+        SHARED_CACHE=False,
+        SESSION_ENGINE='django.contrib.sessions.backends.db',
+        )
+    def test_process_cache_not_trusted(self):
+        """Check that users are not cached without a shared cache."""
+        self.client.force_login(self.user)
+        self.auth_queries()
+        self.assertNotEqual(self.auth_queries(), [])
+        self.assertIsNone(cache.get(user_cache_key(self.user.pk)))
+
+
+class SignupPipelineTest(TestCase):
+    def test_common_password_rejected(self):
+        """Check the compact common password list."""
+        validator = CommonPasswordValidator()
+        with self.assertRaises(ValidationError):
+            validator.validate('Password ')
+        validator.validate('vq8-Zt3!kw')
+        self.assertIs(
+            validator.fingerprints,
+            CommonPasswordValidator().fingerprints,
+            msg='The list is loaded once per process.',
+            )
+
+    def test_scrypt_hasher(self):
+        """Check that scrypt hashes verify and cheaper ones get upgraded."""
+        hasher = ScryptPasswordHasher()
+        encoded = hasher.encode('secret', hasher.salt(), n=2 ** 10)
+        self.assertTrue(hasher.verify('secret', encoded))
+        self.assertFalse(hasher.verify('wrong', encoded))
+        self.assertTrue(hasher.must_update(encoded))
+
+    def test_reserved_username_rejected(self):
+        """Check that names of site routes cannot be signed up."""
+        for username in ('popular', 'notifications', 'feed'):
+            form = CreationForm({
+                'username': username,
+                'email': f'{username}@example.com',
+                'password1': 'vq8-Zt3!kw',
+                'password2': 'vq8-Zt3!kw',
+                })
+            self.assertIn('username', form.errors, msg=username)
+        self.assertFalse(is_reserved('ann'))
+
+    def test_provision_users(self):
+        """Check bulk provisioning from CSV, skipping known usernames."""
+        User.objects.create_user(username='known', password='1')
+        with tempfile.NamedTemporaryFile('w', suffix='.csv') as source:
+            source.write(
+                'ann,ann@example.com,pw1,Ann,Lee\n'
+                'known,known@example.com,pw2\n'
+                'bob,bob@example.com,pw3\n'
+                'ann,again@example.com,pw4\n'
+                'popular,popular@example.com,pw5\n'
+                )
+            source.flush()
+            output = StringIO()
+            call_command(
+                'provision_users',
+                source.name,
+                workers=1,
+                stdout=output,
+                )
+        self.assertEqual(User.objects.count(), 3)
+        self.assertIn('Created 2 users.', output.getvalue())
+        self.assertTrue(User.objects.get(username='ann').check_password('pw1'))
+        self.assertEqual(User.objects.get(username='ann').last_name, 'Lee')
+
+    def test_provision_counts_only_inserted(self):
+        """Check that usernames taken meanwhile are not counted."""
+        User.objects.create_user(username='taken', password='1')
+        users = [
+            User(username=username, password=make_password('pw'))
+            for username in ('taken', 'fresh')
+            ]
+        User.objects.bulk_create(users, ignore_conflicts=True)
+        self.assertEqual(ProvisionCommand.count_inserted(users), 1)
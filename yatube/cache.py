@@ -0,0 +1,323 @@
+"""Cache helpers that keep expiring entries from stampeding the database.
+
+``get_or_compute`` stores values together with the moment they go stale
+and how long they took to compute, and combines three techniques:
+
+* probabilistic early expiration ("XFetch"): shortly before an entry goes
+  stale, a request may volunteer to refresh it, with a probability that
+  grows as expiry nears and as the value gets more expensive;
+* stale-while-revalidate: entries outlive their freshness by ``stale``
+  seconds, and while one request recomputes a stale value every other
+  request keeps getting the old one;
+* single-flight: a missing value is computed by the one request that
+  wins a lock in the shared cache; the others wait for its result.
+
+``CoalescingCacheMiddleware`` (and ``cache_page``) apply the same rules to
+whole responses, as a drop-in for Django's per-view cache.
+
+Entries can depend on tags such as ``post:42`` or ``feed:index``. The
+current version of every tag lives in the cache and is part of the keys
+of dependent entries, so ``invalidate(tag)`` makes all of them
+unreachable with one write; the orphaned entries simply expire. Other
+processes only see the write when the cache is shared between them
+(``SHARED_CACHE``); with the default LocMemCache their entries live out
+their timeout. posts/signals.py maps model changes to tags.
+"""
+import hashlib
+import math
+import random
+import time
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.middleware.cache import CacheMiddleware
+from django.utils.cache import (get_cache_key, get_max_age, has_vary_header,
+                                learn_cache_key, patch_response_headers)
+from django.utils.decorators import decorator_from_middleware_with_args
+
+DEFAULT_STALE = 60
+DEFAULT_WAIT = 2
+LOCK_TIMEOUT = 30
+POLL_INTERVAL = 0.05
+BETA = 1.0
+
+
+def tag_key(tag):
+    return f'tag:{tag}'
+
+
+def new_version():
+    # Not a counter: a tag evicted from the cache must not come back with
+    # a version that old entries were stored under.
+    return time.time_ns()
+
+
+def tag_versions(tags, backend=cache):
+    """Return the current versions of ``tags``, creating missing ones."""
+    keys = [tag_key(tag) for tag in tags]
+    versions = backend.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        for key in missing:
+            backend.add(key, new_version(), None)
+        versions.update(backend.get_many(missing))
+    return [versions.get(key) for key in keys]
+
+
+def versioned_key(key, tags, backend=cache):
+    """Return ``key`` qualified by the versions of the tags it depends on."""
+    if not tags:
+        return key
+    versions = ','.join(map(str, tag_versions(tags, backend)))
+    return f'{key}@{hashlib.md5(versions.encode()).hexdigest()}'
+
+
+def invalidate(*tags, backend=cache):
+    """Make every entry depending on any of ``tags`` stale, in O(1)."""
+    backend.set_many({tag_key(tag): new_version() for tag in tags}, None)
+
+
+def invalidate_on_commit(*tags, backend=cache):
+    """Invalidate ``tags`` now and again when the transaction commits.
+
+    A request that reads between the first write and the commit may
+    cache the old rows under the new versions; the second write makes
+    those entries unreachable as well.
+    """
+    invalidate(*tags, backend=backend)
+    if connection.in_atomic_block:
+        transaction.on_commit(lambda: invalidate(*tags, backend=backend))
+
+
+def lock_key(key):
+    return f'lock:{key}'
+
+
+def acquire(key, backend=cache):
+    return backend.add(lock_key(key), 1, LOCK_TIMEOUT)
+
+
+def release(key, backend=cache):
+    backend.delete(lock_key(key))
+
+
+def should_refresh(fresh_until, delta, now=None, beta=BETA):
+    """True when the entry is stale or is picked for early refresh."""
+    now = time.time() if now is None else now
+    return now - delta * beta * math.log(1 - random.random()) >= fresh_until
+
+
+def wait_for(key, wait, backend=cache):
+    """Poll the cache for ``key`` until it appears or ``wait`` runs out."""
+    deadline = time.monotonic() + wait
+    while time.monotonic() < deadline:
+        time.sleep(POLL_INTERVAL)
+        entry = backend.get(key)
+        if entry is not None:
+            return entry
+    return None
+
+
+def claim(key, entry, backend=cache):
+    """Decide who computes ``key``.
+
+    Return ``(True, None)`` when the caller holds the lock and must
+    compute, otherwise ``(False, entry)`` with the entry to serve, which
+    is ``None`` when waiting for another computation timed out.
+    """
+    if entry is not None:
+        if should_refresh(entry[1], entry[2]) and acquire(key, backend):
+            return True, None
+        return False, entry
+    if acquire(key, backend):
+        return True, None
+    return False, None
+
+
+def get_or_compute(key, compute, timeout, stale=DEFAULT_STALE,
+                   wait=DEFAULT_WAIT, tags=()):
+    """Return the cached value of ``key``, computing it at most once.
+
+    ``timeout`` may be a function of the computed value.
+    """
+    key = versioned_key(key, tags)
+    entry = cache.get(key)
+    owner, entry = claim(key, entry)
+    if not owner:
+        if entry is None:
+            entry = wait_for(key, wait)
+        if entry is not None:
+            return entry[0]
+        # The lock holder is slow or gone; do not keep the caller waiting.
+        return compute()
+    try:
+        started = time.monotonic()
+        value = compute()
+        if callable(timeout):
+            timeout = timeout(value)
+        cache.set(
+            key,
+            (value, time.time() + timeout, time.monotonic() - started),
+            timeout + stale,
+            )
+    finally:
+        release(key)
+    return value
+
+
+class CoalescingCacheMiddleware(CacheMiddleware):
+    """Per-view response cache with stale-while-revalidate and single-flight.
+
+    Entries are kept ``stale`` seconds past their timeout; a stale or
+    early-expiring page is re-rendered by one request while the others
+    are served the stored copy.
+    """
+
+    def __init__(self, get_response=None, cache_timeout=None,
+                 stale=DEFAULT_STALE, wait=DEFAULT_WAIT, tags=(), **kwargs):
+        super().__init__(get_response, cache_timeout, **kwargs)
+        self.stale = stale
+        self.wait = wait
+        self.tags = tags
+
+    def request_prefix(self, request):
+        """Key prefix for ``request``, fixed when the request comes in."""
+        prefix = getattr(request, '_cache_prefix', None)
+        if prefix is None:
+            prefix = request._cache_prefix = versioned_key(
+                self.key_prefix,
+                self.tags,
+                self.cache,
+                )
+        return prefix
+
+    @staticmethod
+    def flight_key(request, prefix):
+        """Lock key for a page whose Vary headers are not known yet."""
+        url = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+        return f'{prefix}.flight.{url}'
+
+    def wait_for_key(self, request, prefix, flight, deadline):
+        """Poll until the in-flight render is stored, up to ``deadline``.
+
+        Return the request's own key once the headers are learned and
+        the flight lock is gone: the same variant then finds the stored
+        page, a different one (another Vary value) goes on to claim it.
+        """
+        while time.monotonic() < deadline:
+            time.sleep(POLL_INTERVAL)
+            key = get_cache_key(request, prefix, 'GET', cache=self.cache)
+            if key is not None and (
+                    self.cache.get(lock_key(flight)) is None
+                    or self.cache.get(key) is not None):
+                return key
+        return None
+
+    def process_request(self, request):
+        request._cache_update_cache = False
+        if request.method not in ('GET', 'HEAD'):
+            return None
+        prefix = self.request_prefix(request)
+        deadline = time.monotonic() + self.wait
+        key = get_cache_key(request, prefix, 'GET', cache=self.cache)
+        if key is None:
+            # After a tag bump no headers are learned for the new prefix
+            # yet; one request renders while the others wait for it.
+            request._cache_update_cache = True
+            flight = self.flight_key(request, prefix)
+            if acquire(flight, self.cache):
+                request._cache_lock = flight
+                request._cache_started = time.monotonic()
+                return None
+            key = self.wait_for_key(request, prefix, flight, deadline)
+            if key is None:
+                return None
+        entry = self.cache.get(key)
+        if entry is None and request.method == 'HEAD':
+            entry = self.cache.get(
+                get_cache_key(request, prefix, 'HEAD', self.cache),
+                )
+        owner, entry = claim(key, entry, self.cache)
+        if not owner:
+            if entry is None:
+                entry = wait_for(
+                    key,
+                    deadline - time.monotonic(),
+                    self.cache,
+                    )
+            if entry is not None:
+                return entry[0]
+        else:
+            request._cache_lock = key
+            request._cache_started = time.monotonic()
+        request._cache_update_cache = True
+        return None
+
+    def release_lock(self, request):
+        key = getattr(request, '_cache_lock', None)
+        if key is not None:
+            del request._cache_lock
+            release(key, self.cache)
+
+    def process_response(self, request, response):
+        if not self.update_cache(request, response):
+            self.release_lock(request)
+        return response
+
+    def process_exception(self, request, exception):
+        self.release_lock(request)
+
+    def update_cache(self, request, response):
+        """Mirror UpdateCacheMiddleware; True if the store is deferred."""
+        if not self._should_update_cache(request, response):
+            return False
+        if response.streaming or response.status_code not in (200, 304):
+            return False
+        if (not request.COOKIES and response.cookies
+                and has_vary_header(response, 'Cookie')):
+            return False
+        if 'private' in response.get('Cache-Control', ()):
+            return False
+        timeout = get_max_age(response)
+        if timeout is None:
+            timeout = self.cache_timeout
+        elif timeout == 0:
+            return False
+        patch_response_headers(response, timeout)
+        if not timeout or response.status_code != 200:
+            return False
+        key = learn_cache_key(
+            request,
+            response,
+            timeout + self.stale,
+            self.request_prefix(request),
+            cache=self.cache,
+            )
+        started = getattr(request, '_cache_started', time.monotonic())
+
+        def store(response):
+            entry = (
+                response,
+                time.time() + timeout,
+                time.monotonic() - started,
+                )
+            self.cache.set(key, entry, timeout + self.stale)
+            self.release_lock(request)
+
+        if hasattr(response, 'render') and callable(response.render):
+            response.add_post_render_callback(store)
+            return True
+        store(response)
+        return True
+
+
+def cache_page(timeout, *, stale=DEFAULT_STALE, wait=DEFAULT_WAIT,
+               tags=(), key_prefix=None):
+    """Like ``django.views.decorators.cache.cache_page``, stampede-proof."""
+    return decorator_from_middleware_with_args(CoalescingCacheMiddleware)(
+        cache_timeout=timeout,
+        stale=stale,
+        wait=wait,
+        tags=tags,
+        key_prefix=key_prefix,
+        )
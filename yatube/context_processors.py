@@ -1,8 +1,77 @@
 import datetime as dt
 
+from django.utils.functional import cached_property
+from posts.models import Follow, Group
+from posts.notifications import unread_count
+
+from .cache import get_or_compute
+
+GROUPS_CACHE_KEY = 'shared:groups'
+GROUPS_CACHE_TIMEOUT = 60 * 5
+FOLLOW_IDS_CACHE_TIMEOUT = 60 * 5
+
 
 def year(request):
     """Добавляет переменную с текущим годом."""
-    year = dt.datetime.today().year
-    return { 'year': year,
-    }
+    return {'year': dt.date.today().year}
+
+
+class SharedContext:
+    """Data needed by several includes of one page.
+
+    Every attribute is computed only when a template first touches it and
+    is then reused by all the includes (and all the renders) of the same
+    request.
+    """
+
+    def __init__(self, request):
+        self.request = request
+
+    @classmethod
+    def for_request(cls, request):
+        """Return the instance memoized on ``request``."""
+        shared = getattr(request, '_shared_context', None)
+        if shared is None:
+            shared = request._shared_context = cls(request)
+        return shared
+
+    @cached_property
+    def follow_ids(self):
+        """Ids of the authors the current user follows."""
+        user = self.request.user
+        if not user.is_authenticated:
+            return frozenset()
+        return get_or_compute(
+            f'follow_ids:{user.pk}',
+            lambda: frozenset(
+                Follow.objects.filter(user=user).values_list(
+                    'author_id',
+                    flat=True,
+                    )
+                ),
+            FOLLOW_IDS_CACHE_TIMEOUT,
+            tags=[f'follow:{user.pk}'],
+            )
+
+    @cached_property
+    def unread_notifications(self):
+        """Number of unread notifications of the current user."""
+        user = self.request.user
+        if not user.is_authenticated:
+            return 0
+        return unread_count(user)
+
+    @cached_property
+    def groups(self):
+        """All groups as ``(slug, title)`` pairs, shared through the cache."""
+        return get_or_compute(
+            GROUPS_CACHE_KEY,
+            lambda: list(Group.objects.values_list('slug', 'title')),
+            GROUPS_CACHE_TIMEOUT,
+            tags=['groups'],
+            )
+
+
+def shared(request):
+    """Добавляет ленивые общие данные для шаблонов запроса."""
+    return {'shared': SharedContext.for_request(request)}
@@ -0,0 +1,157 @@
+"""Flatpages served from process memory.
+
+All flatpages of the current site are loaded, and pre-rendered for
+anonymous visitors, on the first request a worker serves (or by the
+warm-up). Anonymous requests then get the stored HTML with a strong ETag
+and no database or template work at all; authenticated requests render
+the template from the in-memory page, because the navigation bar shows
+the user.
+
+Saving or deleting a flatpage (for example in the admin) invalidates the
+``flatpages`` cache tag and reloads the pages of that worker at once.
+With a shared cache (``SHARED_CACHE``) other workers look at the tag at
+most every ``FLATPAGES_CHECK_INTERVAL`` seconds and reload when it
+changed. Without one they cannot see the tag, so they do not poll and
+keep their pages until they restart.
+"""
+import hashlib
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.auth.views import redirect_to_login
+from django.contrib.flatpages.models import FlatPage
+from django.db import connection, transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.http import Http404, HttpRequest, HttpResponse
+from django.shortcuts import redirect
+from django.template.loader import render_to_string
+from django.utils.cache import get_conditional_response
+from django.utils.safestring import mark_safe
+
+from .cache import invalidate_on_commit, tag_versions
+
+DEFAULT_TEMPLATE = 'flatpages/default.html'
+TAG = 'flatpages'
+DEFAULT_CHECK_INTERVAL = 5
+
+
+def check_interval():
+    """Seconds until the next look at the tag; never without a shared cache."""
+    if not getattr(settings, 'SHARED_CACHE', False):
+        return math.inf
+    return getattr(
+        settings,
+        'FLATPAGES_CHECK_INTERVAL',
+        DEFAULT_CHECK_INTERVAL,
+        )
+
+
+class FlatPageCache:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+        self.pages = {}
+        self.next_check = 0
+
+    @staticmethod
+    def current_version():
+        return tag_versions([TAG])[0]
+
+    def invalidate(self):
+        """Reload here on the next request, elsewhere on the next check."""
+        invalidate_on_commit(TAG)
+        self.next_check = 0
+        if connection.in_atomic_block:
+            # A request before the commit reloads the old rows.
+            transaction.on_commit(self.reset)
+
+    def reset(self):
+        self.next_check = 0
+
+    @staticmethod
+    def render(flatpage, request):
+        # Same as django.contrib.flatpages.views.render_flatpage.
+        flatpage.title = mark_safe(flatpage.title)
+        flatpage.content = mark_safe(flatpage.content)
+        return render_to_string(
+            flatpage.template_name or DEFAULT_TEMPLATE,
+            {'flatpage': flatpage},
+            request,
+            )
+
+    @staticmethod
+    def anonymous_request(url):
+        request = HttpRequest()
+        request.path = request.path_info = url
+        request.method = 'GET'
+        request.META['SERVER_NAME'] = 'localhost'
+        request.user = AnonymousUser()
+        return request
+
+    def load(self):
+        """Load and pre-render all flatpages of the site."""
+        version = self.current_version()
+        pages = {}
+        for flatpage in FlatPage.objects.filter(sites=settings.SITE_ID):
+            html = self.render(flatpage, self.anonymous_request(flatpage.url))
+            etag = '"%s"' % hashlib.sha1(html.encode()).hexdigest()
+            pages[flatpage.url] = (flatpage, html, etag)
+        with self.lock:
+            self.pages = pages
+            self.version = version
+            self.next_check = time.monotonic() + check_interval()
+
+    def is_stale(self):
+        if time.monotonic() < self.next_check:
+            return False
+        if self.next_check == 0:
+            # Never loaded, or invalidated in this worker.
+            return True
+        if self.version != self.current_version():
+            return True
+        self.next_check = time.monotonic() + check_interval()
+        return False
+
+    def get(self, url):
+        """Return ``(flatpage, anonymous_html, etag)`` or ``None``."""
+        if self.is_stale():
+            self.load()
+        return self.pages.get(url)
+
+
+flatpage_cache = FlatPageCache()
+
+
+def flatpage(request, url):
+    """Drop-in replacement for ``django.contrib.flatpages.views.flatpage``."""
+    if not url.startswith('/'):
+        url = '/' + url
+    cached = flatpage_cache.get(url)
+    if cached is None and not url.endswith('/') and settings.APPEND_SLASH:
+        if flatpage_cache.get(url + '/') is not None:
+            return redirect(request.path + '/', permanent=True)
+    if cached is None:
+        raise Http404
+    page, html, etag = cached
+    authenticated = request.user.is_authenticated
+    if page.registration_required and not authenticated:
+        return redirect_to_login(request.path)
+    if authenticated:
+        html = FlatPageCache.render(page, request)
+        etag = '"%s"' % hashlib.sha1(html.encode()).hexdigest()
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(html)
+    response['ETag'] = etag
+    return response
+
+
+@receiver(post_save, sender=FlatPage)
+@receiver(post_delete, sender=FlatPage)
+@receiver(m2m_changed, sender=FlatPage.sites.through)
+def invalidate_flatpages(sender, **kwargs):
+    flatpage_cache.invalidate()
@@ -0,0 +1,80 @@
+"""Import cost of a cold worker, read from ``python -X importtime``.
+
+``profile_imports`` imports a module (``yatube.wsgi`` by default) in a
+fresh interpreter and parses the timings Python writes to stderr.
+``by_owner`` attributes the self time of every module to the installed
+app that contains it, or to its top-level package, so the sums add up
+to the whole boot. See ``manage.py importprofile``.
+"""
+import os
+import subprocess
+import sys
+from collections import namedtuple
+
+from django.apps import apps
+
+DEFAULT_TARGET = 'yatube.wsgi'
+
+ImportTime = namedtuple('ImportTime', 'module self_us cumulative_us depth')
+
+
+def parse(output):
+    """Parse ``-X importtime`` lines into ``ImportTime`` tuples."""
+    entries = []
+    for line in output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        if not self_us.strip().isdigit():
+            continue  # The header line.
+        module = name.strip()
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        entries.append(
+            ImportTime(module, int(self_us), int(cumulative_us), depth),
+            )
+    return entries
+
+
+def profile_imports(target=DEFAULT_TARGET):
+    """Import ``target`` in a new interpreter; return its import times."""
+    # Without the warm-up the profile shows the imports, not requests.
+    env = dict(os.environ, YATUBE_WARM_UP='0')
+    env.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {target}'],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+        )
+    return parse(result.stderr)
+
+
+def owner(module, app_names):
+    """Return the installed app of ``module``, else its top package."""
+    for name in app_names:
+        if module == name or module.startswith(name + '.'):
+            return name
+    return module.split('.')[0]
+
+
+def by_owner(entries):
+    """Return ``[(owner, self_us, modules), ...]``, slowest first."""
+    # Longest names first, so django.contrib.auth wins over django.
+    app_names = sorted(
+        (config.name for config in apps.get_app_configs()),
+        key=len,
+        reverse=True,
+        )
+    totals = {}
+    for entry in entries:
+        name = owner(entry.module, app_names)
+        self_us, modules = totals.get(name, (0, 0))
+        totals[name] = (self_us + entry.self_us, modules + 1)
+    return sorted(
+        ((name, self_us, modules)
+         for name, (self_us, modules) in totals.items()),
+        key=lambda row: row[1],
+        reverse=True,
+        )
@@ -11,6 +11,8 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 
 import os
+import sys
+from importlib.util import find_spec
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -54,7 +56,7 @@ MIDDLEWARE = [
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'users.middleware.CachedAuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -70,6 +72,7 @@ TEMPLATES = [
         'OPTIONS': {
             'context_processors': [
                 'yatube.context_processors.year',
+                'yatube.context_processors.shared',
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
@@ -89,6 +92,8 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        # Keep connections between requests, opened by yatube/warmup.py.
+        'CONN_MAX_AGE': int(os.environ.get('YATUBE_CONN_MAX_AGE', 60)),
     }
 }
 
@@ -104,7 +109,7 @@ AUTH_PASSWORD_VALIDATORS = [
         'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator',
     },
     {
-        'NAME': 'django.contrib.auth.password_validation.CommonPasswordValidator',
+        'NAME': 'users.validators.CommonPasswordValidator',
     },
     {
         'NAME': 'django.contrib.auth.password_validation.NumericPasswordValidator',
@@ -112,6 +117,34 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Password hashing tiers: 'strong' for production (Argon2 when argon2-cffi
+# is installed, scrypt otherwise), 'fast' for tests and fixtures.
+# The remaining hashers only verify (and upgrade) existing hashes.
+
+TESTING = sys.argv[1:2] == ['test'] or 'pytest' in sys.modules
+
+PASSWORD_HASHING_TIER = os.environ.get(
+    'YATUBE_PASSWORD_TIER',
+    'fast' if TESTING else 'strong',
+)
+
+PASSWORD_HASHER_TIERS = {
+    'strong': [
+        'django.contrib.auth.hashers.Argon2PasswordHasher'
+        if find_spec('argon2') else 'users.hashers.ScryptPasswordHasher',
+    ],
+    'fast': [
+        'django.contrib.auth.hashers.MD5PasswordHasher',
+    ],
+}
+
+PASSWORD_HASHERS = PASSWORD_HASHER_TIERS[PASSWORD_HASHING_TIER] + [
+    'users.hashers.ScryptPasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+]
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/2.2/topics/i18n/
 
@@ -127,6 +160,15 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'static')
+# Tests run with DEBUG off and without collectstatic, so without a manifest.
+STATICFILES_STORAGE = (
+    'django.contrib.staticfiles.storage.StaticFilesStorage' if TESTING
+    else 'yatube.static.CompressedManifestStaticFilesStorage'
+)
+
+# Serve STATIC_ROOT and MEDIA_ROOT from the WSGI application itself,
+# see yatube/static.py.
+SERVE_STATIC_FILES = True
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media') 
@@ -134,14 +176,114 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 LOGIN_URL = '/auth/login/'
 LOGIN_REDIRECT_URL = 'index' 
 
-EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
+# Mail is queued in the database and sent by `manage.py send_queued_mail`
+# through EMAIL_DELIVERY_BACKEND, see users/mail.py.
+EMAIL_BACKEND = 'users.mail.QueuedEmailBackend'
+
+EMAIL_DELIVERY_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
+
+EMAIL_MAX_ATTEMPTS = 5
+
+EMAIL_RETRY_DELAY = 60  # Seconds, doubled after every failed attempt.
+
+EMAIL_KEEP_SENT = 7  # Days before sent messages are deleted.
 
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
+# A cache shared by every worker process, e.g.
+# YATUBE_MEMCACHED=127.0.0.1:11211. Without one each process has its own
+# LocMemCache, which must never hold sessions or users: a logout or a
+# password change would not reach the other processes.
+MEMCACHED_LOCATION = os.environ.get('YATUBE_MEMCACHED')
+
+SHARED_CACHE = bool(MEMCACHED_LOCATION)
+
 SITE_ID = 1 
 
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+if SHARED_CACHE:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+            'LOCATION': MEMCACHED_LOCATION.split(','),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
     }
-} 
\ No newline at end of file
+
+# With a shared cache sessions are read from it and written through to
+# the database; otherwise they are read from the database.
+if SHARED_CACHE:
+    SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+else:
+    SESSION_ENGINE = 'django.contrib.sessions.backends.db'
+
+# Seconds an authenticated user object is kept in the shared cache,
+# see users/middleware.py.
+USER_CACHE_TIMEOUT = 60
+
+# Seconds between checks for flatpages edited in another worker, only
+# with SHARED_CACHE; see yatube/flatpages.py.
+FLATPAGES_CHECK_INTERVAL = 5
+
+# Token bucket limits for write views, see posts/ratelimit.py; the
+# default rates live there, RATELIMIT_RATES overrides single scopes.
+RATELIMIT_ENABLED = True
+
+# Reverse proxies in front of the app that append to X-Forwarded-For.
+# 0 trusts REMOTE_ADDR only; client supplied headers are never trusted.
+TRUSTED_PROXY_HOPS = int(os.environ.get('YATUBE_TRUSTED_PROXY_HOPS', 0))
+
+# Backend storage holding the content-addressed post images,
+# see posts/storage.py.
+POST_IMAGE_BACKEND = 'django.core.files.storage.FileSystemStorage'
+
+POST_IMAGE_BACKEND_OPTIONS = {}
+
+# Responsive post image renditions, see posts/renditions.py.
+THUMBNAIL_BACKEND = 'posts.renditions.RenditionBackend'
+
+POST_IMAGE_RENDITION_FORMATS = ('AVIF', 'WEBP', 'JPEG')
+
+# Trending posts, see posts/trending.py.
+# Seconds for an event to lose half of its weight.
+TRENDING_HALF_LIFE = 6 * 60 * 60
+
+TRENDING_WEIGHTS = {'comment': 3.0, 'view': 1.0}
+
+TRENDING_TOP_K = 50
+
+# Buffered post view counting, see posts/viewcounts.py.
+VIEW_FLUSH_INTERVAL = 10  # Seconds, also the most views lost on a crash.
+
+VIEW_FLUSH_SIZE = 1000
+
+# Background tasks, see yatube/taskqueue.py and ``manage.py runworker``.
+TASK_QUEUE_PATH = os.path.join(BASE_DIR, 'tasks.sqlite3')
+
+TASKS_SYNC = TESTING  # Run tasks inline instead of queueing them.
+
+# Worker warm-up before the first request, see yatube/warmup.py. Off by
+# default with DEBUG: runserver and its autoreloader would each run it,
+# again after every reload; YATUBE_WARM_UP=1 turns it on anyway.
+WARM_UP_ON_BOOT = (
+    os.environ.get('YATUBE_WARM_UP', '0' if DEBUG else '1') == '1'
+    and not TESTING
+)
+
+# Host of the primed page cache entries, the first allowed host if empty.
+WARM_UP_HOST = os.environ.get('YATUBE_WARM_UP_HOST', '')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'yatube.warmup': {'handlers': ['console'], 'level': 'INFO'},
+    },
+}
@@ -0,0 +1,205 @@
+"""Production static and media file serving.
+
+``CompressedManifestStaticFilesStorage`` gives collected files hashed
+names and writes ``.gz`` (and, when the ``brotli`` package is installed,
+``.br``) copies next to them. ``StaticFilesApplication`` wraps the Django
+WSGI application and serves ``STATIC_ROOT`` and ``MEDIA_ROOT`` itself,
+picking the precompressed variant the client accepts and handing the file
+to the server's ``wsgi.file_wrapper`` (sendfile in gunicorn and uWSGI).
+Files whose names change with their content are sent with far-future
+immutable cache headers.
+"""
+import gzip
+import mimetypes
+import os
+import re
+from email.utils import formatdate, parsedate_to_datetime
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+try:
+    import brotli
+except ImportError:  # Optional: only .gz variants are written without it.
+    brotli = None
+
+COMPRESSIBLE_TYPES = (
+    'text/',
+    'application/javascript',
+    'application/json',
+    'image/svg+xml',
+    )
+MIN_COMPRESS_SIZE = 256
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'public, max-age=60'
+CHUNK_SIZE = 64 * 1024
+
+# Manifest storage inserts a 12 character md5 prefix before the extension.
+HASHED_NAME = re.compile(r'\.[0-9a-f]{12}\.[^/]+$')
+# Content-addressed post images and sorl thumbnails never change either.
+IMMUTABLE_MEDIA = re.compile(r'^(blobs|cache)/')
+
+
+def accepted_encodings(header):
+    """Map the codings of an Accept-Encoding header to their q-values."""
+    codings = {}
+    for item in header.split(','):
+        coding, _, params = item.partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        codings[coding] = quality
+    return codings
+
+
+def is_compressible(name):
+    content_type = mimetypes.guess_type(name)[0] or ''
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """Manifest storage that also writes precompressed variants.
+
+    As with ``ManifestStaticFilesStorage``, a file missing from the
+    manifest raises ``ValueError`` unless ``DEBUG`` is on.
+    """
+
+    def post_process(self, paths, dry_run=False, **options):
+        for name, hashed_name, processed in super().post_process(
+                paths, dry_run, **options):
+            if not dry_run and processed and hashed_name and is_compressible(
+                    hashed_name):
+                self.compress(hashed_name)
+            yield name, hashed_name, processed
+
+    def compress(self, name):
+        path = self.path(name)
+        with open(path, 'rb') as source:
+            data = source.read()
+        if len(data) < MIN_COMPRESS_SIZE:
+            return
+        with open(path + '.gz', 'wb') as target:
+            target.write(gzip.compress(data, compresslevel=9))
+        if brotli is not None:
+            with open(path + '.br', 'wb') as target:
+                target.write(brotli.compress(data))
+
+
+class StaticFilesApplication:
+    """WSGI middleware serving files below ``STATIC_URL`` and ``MEDIA_URL``.
+
+    Everything else is passed to the wrapped application.
+    """
+    encodings = (('br', '.br'), ('gzip', '.gz'))
+
+    def __init__(self, application, mounts=None):
+        self.application = application
+        if mounts is None:
+            mounts = [
+                (settings.STATIC_URL, settings.STATIC_ROOT, HASHED_NAME),
+                (settings.MEDIA_URL, settings.MEDIA_ROOT, IMMUTABLE_MEDIA),
+                ]
+        self.mounts = [
+            (prefix, os.path.realpath(root), immutable)
+            for prefix, root, immutable in mounts
+            if prefix and root
+            ]
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        for prefix, root, immutable in self.mounts:
+            if path.startswith(prefix):
+                name = path[len(prefix):]
+                filename = self.resolve(root, name)
+                if filename is not None:
+                    return self.serve(
+                        environ,
+                        start_response,
+                        filename,
+                        immutable.search(name) is not None,
+                        )
+        return self.application(environ, start_response)
+
+    @staticmethod
+    def resolve(root, name):
+        """Return the file for ``name`` inside ``root``, or ``None``."""
+        filename = os.path.realpath(os.path.join(root, name))
+        if not filename.startswith(root + os.sep):
+            return None
+        if not os.path.isfile(filename):
+            return None
+        return filename
+
+    def pick_variant(self, environ, filename):
+        accepted = accepted_encodings(environ.get('HTTP_ACCEPT_ENCODING', ''))
+        for encoding, suffix in self.encodings:
+            quality = accepted.get(encoding, accepted.get('*', 0))
+            if quality > 0 and os.path.isfile(filename + suffix):
+                return filename + suffix, encoding
+        return filename, None
+
+    def serve(self, environ, start_response, filename, immutable):
+        method = environ.get('REQUEST_METHOD')
+        if method not in ('GET', 'HEAD'):
+            start_response('405 Method Not Allowed', [('Allow', 'GET, HEAD')])
+            return [b'']
+        variant, encoding = self.pick_variant(environ, filename)
+        stat = os.stat(variant)
+        etag = '"%x-%x%s"' % (
+            int(stat.st_mtime),
+            stat.st_size,
+            '-' + encoding if encoding else '',
+            )
+        content_type = mimetypes.guess_type(filename)[0]
+        headers = [
+            ('Content-Type', content_type or 'application/octet-stream'),
+            ('Cache-Control', IMMUTABLE if immutable else REVALIDATE),
+            ('ETag', etag),
+            ('Last-Modified', formatdate(stat.st_mtime, usegmt=True)),
+            ('Vary', 'Accept-Encoding'),
+            ]
+        if encoding:
+            headers.append(('Content-Encoding', encoding))
+        if self.not_modified(environ, etag, stat.st_mtime):
+            start_response('304 Not Modified', headers)
+            return [b'']
+        headers.append(('Content-Length', str(stat.st_size)))
+        start_response('200 OK', headers)
+        if method == 'HEAD':
+            return [b'']
+        file = open(variant, 'rb')
+        file_wrapper = environ.get('wsgi.file_wrapper')
+        if file_wrapper is not None:
+            return file_wrapper(file, CHUNK_SIZE)
+        return self.iter_file(file)
+
+    @staticmethod
+    def iter_file(file):
+        with file:
+            while True:
+                chunk = file.read(CHUNK_SIZE)
+                if not chunk:
+                    return
+                yield chunk
+
+    @staticmethod
+    def not_modified(environ, etag, mtime):
+        if_none_match = environ.get('HTTP_IF_NONE_MATCH')
+        if if_none_match is not None:
+            return etag in if_none_match
+        if_modified_since = environ.get('HTTP_IF_MODIFIED_SINCE')
+        if if_modified_since:
+            try:
+                since = parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+            return int(mtime) <= since
+        return False
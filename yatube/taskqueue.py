@@ -0,0 +1,473 @@
+"""Background tasks.
+
+Functions decorated with ``@task()`` keep working as plain functions;
+``fn.delay(*args, **kwargs)`` stores a call in the queue instead, and
+``manage.py runworker`` executes it in a worker process. Arguments must
+be JSON serializable, so pass ids rather than model instances.
+
+The queue is a separate SQLite file (``TASK_QUEUE_PATH``), so workers
+never lock the site database. Workers claim tasks inside ``BEGIN
+IMMEDIATE`` transactions and hold them for a lease: a task whose worker
+died runs again once its lease expires. Failed tasks are retried with
+exponential backoff and kept with their traceback once out of attempts.
+``@task(concurrency=N)`` bounds how many copies of a task run at once,
+``@task(every=SECONDS)`` also runs it periodically. Per task counters of
+successes, failures, retries and run time are kept in the queue file.
+
+Inside a transaction of the site database ``delay`` enqueues the call
+when the transaction commits, so a worker never looks for rows that are
+not visible yet and a rollback queues nothing. With ``TASKS_SYNC`` on
+(the default under tests) ``delay`` runs the task right away in the
+calling process.
+"""
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import sqlite3
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import (close_old_connections, connection, connections,
+                       transaction)
+from django.utils.module_loading import autodiscover_modules
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RETRIES = 3
+DEFAULT_RETRY_DELAY = 10
+DEFAULT_LEASE = 5 * 60
+POLL_INTERVAL = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS task (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    run_at REAL NOT NULL,
+    locked_until REAL,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS task_due ON task (status, run_at);
+CREATE TABLE IF NOT EXISTS schedule (
+    name TEXT PRIMARY KEY,
+    next_run REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS metric (
+    name TEXT PRIMARY KEY,
+    succeeded INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    retried INTEGER NOT NULL DEFAULT 0,
+    runtime REAL NOT NULL DEFAULT 0
+);
+"""
+
+registry = {}
+
+
+class SQLiteQueue:
+    """Task queue in a SQLite file, safe to share between processes."""
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+
+    @property
+    def db(self):
+        # One connection per thread and process; never reuse across fork.
+        db = getattr(self.local, 'db', None)
+        if db is None or self.local.pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.executescript(SCHEMA)
+            self.local.db, self.local.pid = db, os.getpid()
+        return db
+
+    @contextmanager
+    def transaction(self):
+        db = self.db
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            yield db
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+
+    def enqueue(self, name, payload, max_attempts, delay=0):
+        cursor = self.db.execute(
+            'INSERT INTO task (name, payload, max_attempts, run_at) '
+            'VALUES (?, ?, ?, ?)',
+            (name, payload, max_attempts, time.time() + delay),
+            )
+        return cursor.lastrowid
+
+    def claim(self, limits=None, lease=DEFAULT_LEASE):
+        """Lock the next due task; return ``(id, name, payload, attempts,
+        max_attempts)`` or ``None``.
+
+        Tasks listed in ``limits`` are skipped while that many copies of
+        them are running.
+        """
+        now = time.time()
+        with self.transaction() as db:
+            expired = db.execute(
+                "SELECT name, attempts >= max_attempts FROM task "
+                "WHERE status = 'running' AND locked_until < ?",
+                (now,),
+                ).fetchall()
+            db.execute(
+                "UPDATE task SET status = CASE WHEN attempts >= max_attempts "
+                "THEN 'failed' ELSE 'pending' END, "
+                "last_error = 'Lease expired' "
+                "WHERE status = 'running' AND locked_until < ?",
+                (now,),
+                )
+            for name, exhausted in expired:
+                self.count(name, 'failed' if exhausted else 'retried', 0)
+            running = dict(db.execute(
+                "SELECT name, COUNT(*) FROM task WHERE status = 'running' "
+                "GROUP BY name",
+                ))
+            saturated = [
+                name for name, limit in (limits or {}).items()
+                if running.get(name, 0) >= limit
+                ]
+            row = db.execute(
+                "SELECT id, name, payload, attempts, max_attempts FROM task "
+                "WHERE status = 'pending' AND run_at <= ? "
+                "AND name NOT IN (%s) ORDER BY run_at, id LIMIT 1"
+                % ', '.join('?' * len(saturated)),
+                (now, *saturated),
+                ).fetchone()
+            if row is None:
+                return None
+            db.execute(
+                "UPDATE task SET status = 'running', attempts = attempts + 1, "
+                "locked_until = ? WHERE id = ?",
+                (now + lease, row[0]),
+                )
+        task_id, name, payload, attempts, max_attempts = row
+        return task_id, name, payload, attempts + 1, max_attempts
+
+    def count(self, name, column, runtime):
+        self.db.execute(
+            'INSERT OR IGNORE INTO metric (name) VALUES (?)',
+            (name,),
+            )
+        self.db.execute(
+            f'UPDATE metric SET {column} = {column} + 1, '
+            f'runtime = runtime + ? WHERE name = ?',
+            (runtime, name),
+            )
+
+    def complete(self, task_id, name, runtime):
+        with self.transaction() as db:
+            db.execute('DELETE FROM task WHERE id = ?', (task_id,))
+            self.count(name, 'succeeded', runtime)
+
+    def fail(self, task_id, name, error, runtime, retry_at=None):
+        """Record a failure; retry at ``retry_at`` or give up."""
+        with self.transaction() as db:
+            if retry_at is None:
+                db.execute(
+                    "UPDATE task SET status = 'failed', last_error = ? "
+                    "WHERE id = ?",
+                    (error, task_id),
+                    )
+                self.count(name, 'failed', runtime)
+            else:
+                db.execute(
+                    "UPDATE task SET status = 'pending', last_error = ?, "
+                    "run_at = ? WHERE id = ?",
+                    (error, retry_at, task_id),
+                    )
+                self.count(name, 'retried', runtime)
+
+    def enqueue_periodic(self, tasks):
+        """Enqueue every periodic task that is due; return their names.
+
+        A due task is skipped while an earlier run is still queued.
+        """
+        now = time.time()
+        due = []
+        with self.transaction() as db:
+            for task in tasks:
+                row = db.execute(
+                    'SELECT next_run FROM schedule WHERE name = ?',
+                    (task.name,),
+                    ).fetchone()
+                if row is not None and row[0] > now:
+                    continue
+                db.execute(
+                    'INSERT OR REPLACE INTO schedule (name, next_run) '
+                    'VALUES (?, ?)',
+                    (task.name, now + task.every),
+                    )
+                # A run that is still pending or running covers this one;
+                # slow or stuck runs must not pile up copies.
+                cursor = db.execute(
+                    "INSERT INTO task (name, payload, max_attempts, run_at) "
+                    "SELECT ?, ?, ?, ? WHERE NOT EXISTS (SELECT 1 FROM task "
+                    "WHERE name = ? AND status IN ('pending', 'running'))",
+                    (
+                        task.name,
+                        task.encode((), {}),
+                        task.retries + 1,
+                        now,
+                        task.name,
+                        ),
+                    )
+                if cursor.rowcount:
+                    due.append(task.name)
+        return due
+
+    def stats(self):
+        """Return ``{'queue': {status: n}, 'tasks': {name: metrics}}``."""
+        db = self.db
+        queue = dict(db.execute(
+            'SELECT status, COUNT(*) FROM task GROUP BY status',
+            ))
+        columns = ('succeeded', 'failed', 'retried', 'runtime')
+        tasks = {
+            row[0]: dict(zip(columns, row[1:]))
+            for row in db.execute(
+                'SELECT name, succeeded, failed, retried, runtime '
+                'FROM metric ORDER BY name',
+                )
+            }
+        return {'queue': queue, 'tasks': tasks}
+
+
+_queue = None
+
+
+def get_queue():
+    global _queue
+    if _queue is None:
+        _queue = SQLiteQueue(settings.TASK_QUEUE_PATH)
+    return _queue
+
+
+def reset_queue(*, setting, **kwargs):
+    global _queue
+    if setting == 'TASK_QUEUE_PATH':
+        _queue = None
+
+
+setting_changed.connect(reset_queue)
+
+
+class Task:
+    def __init__(self, func, name, retries, retry_delay, concurrency, every):
+        self.func = func
+        self.name = name
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.concurrency = concurrency
+        self.every = every
+        self.__doc__ = func.__doc__
+        self.__wrapped__ = func
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def __repr__(self):
+        return f'<Task {self.name}>'
+
+    @staticmethod
+    def encode(args, kwargs):
+        return json.dumps({'args': list(args), 'kwargs': kwargs})
+
+    def delay(self, *args, **kwargs):
+        """Queue a call; run it at once in ``TASKS_SYNC`` mode.
+
+        Return the task id, or ``None`` while the call waits for the
+        current transaction to commit.
+        """
+        payload = self.encode(args, kwargs)
+        if getattr(settings, 'TASKS_SYNC', False):
+            return self.run(payload)
+        if connection.in_atomic_block:
+            transaction.on_commit(lambda: get_queue().enqueue(
+                self.name,
+                payload,
+                self.retries + 1,
+                ))
+            return None
+        return get_queue().enqueue(self.name, payload, self.retries + 1)
+
+    def run(self, payload):
+        data = json.loads(payload)
+        return self.func(*data['args'], **data['kwargs'])
+
+    def backoff(self, attempts):
+        return self.retry_delay * 2 ** (attempts - 1)
+
+
+def task(name=None, *, retries=DEFAULT_RETRIES,
+         retry_delay=DEFAULT_RETRY_DELAY, concurrency=None, every=None):
+    """Register the decorated function as a background task."""
+    def decorator(func):
+        task_name = name or f'{func.__module__}.{func.__qualname__}'
+        registry[task_name] = Task(
+            func,
+            task_name,
+            retries,
+            retry_delay,
+            concurrency,
+            every,
+            )
+        return registry[task_name]
+    return decorator
+
+
+def discover():
+    """Import the ``tasks`` module of every installed app."""
+    autodiscover_modules('tasks')
+
+
+def concurrency_limits():
+    return {
+        name: task.concurrency
+        for name, task in registry.items()
+        if task.concurrency
+        }
+
+
+def execute(queue, job):
+    """Run one claimed task; return True on success."""
+    task_id, name, payload, attempts, max_attempts = job
+    task = registry.get(name)
+    started = time.monotonic()
+    try:
+        close_old_connections()
+        if task is None:
+            raise LookupError(f'Unknown task {name}')
+        task.run(payload)
+    except Exception:
+        logger.exception('Task %s #%s failed', name, task_id)
+        retry_at = None
+        if task is not None and attempts < max_attempts:
+            retry_at = time.time() + task.backoff(attempts)
+        queue.fail(
+            task_id,
+            name,
+            traceback.format_exc(),
+            time.monotonic() - started,
+            retry_at,
+            )
+        return False
+    finally:
+        close_old_connections()
+    queue.complete(task_id, name, time.monotonic() - started)
+    return True
+
+
+class Worker:
+    """Claims and runs tasks until stopped, or until idle in burst mode."""
+
+    def __init__(self, queue, burst=False, scheduler=True):
+        self.queue = queue
+        self.burst = burst
+        self.scheduler = scheduler
+        self.stopping = False
+
+    def stop(self, *args):
+        self.stopping = True
+
+    def run(self):
+        limits = concurrency_limits()
+        periodic = [task for task in registry.values() if task.every]
+        processed = 0
+        while not self.stopping:
+            if self.scheduler and periodic and not self.burst:
+                self.queue.enqueue_periodic(periodic)
+            job = self.queue.claim(limits)
+            if job is None:
+                if self.burst:
+                    break
+                time.sleep(POLL_INTERVAL)
+                continue
+            execute(self.queue, job)
+            processed += 1
+        return processed
+
+
+@contextmanager
+def signal_handlers(handler, *signals):
+    """Install ``handler`` for ``signals``, restoring the old ones after."""
+    previous = {number: signal.signal(number, handler) for number in signals}
+    try:
+        yield
+    finally:
+        for number, old in previous.items():
+            signal.signal(number, old)
+
+
+def worker_process(burst):
+    worker = Worker(get_queue(), burst=burst, scheduler=False)
+    # SIGTERM lets the current task finish; Ctrl+C is handled by the parent.
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    worker.run()
+
+
+def run_workers(processes=1, burst=False):
+    """Run ``processes`` worker processes and the periodic scheduler.
+
+    With one process everything runs in the current process. Otherwise
+    the current process only schedules periodic tasks and restarts
+    workers that died.
+    """
+    discover()
+    queue = get_queue()
+    if processes <= 1:
+        worker = Worker(queue, burst=burst)
+        with signal_handlers(worker.stop, signal.SIGTERM):
+            return worker.run()
+    # Forked children must not share the parent's database connections.
+    connections.close_all()
+    stopping = threading.Event()
+    with signal_handlers(
+            lambda *args: stopping.set(),
+            signal.SIGTERM,
+            signal.SIGINT):
+        supervise(queue, processes, burst, stopping)
+    return None
+
+
+def supervise(queue, processes, burst, stopping):
+    """Keep ``processes`` workers running and enqueue periodic tasks."""
+    children = {}
+    periodic = [task for task in registry.values() if task.every]
+    while not stopping.is_set():
+        for slot in range(processes):
+            child = children.get(slot)
+            # In burst mode every worker runs once, until the queue is empty.
+            if child is None or not (child.is_alive() or burst):
+                if child is not None:
+                    logger.warning('Worker %s exited, restarting', child.pid)
+                child = children[slot] = multiprocessing.Process(
+                    target=worker_process,
+                    args=(burst,),
+                    daemon=True,
+                    )
+                child.start()
+        if burst and not any(child.is_alive() for child in children.values()):
+            break
+        if periodic and not burst:
+            queue.enqueue_periodic(periodic)
+        time.sleep(POLL_INTERVAL)
+    for child in children.values():
+        child.terminate()
+    for child in children.values():
+        child.join()
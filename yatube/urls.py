@@ -1,21 +1,21 @@
 from django.conf.urls import handler404, handler500
 from django.contrib import admin
-from django.contrib.auth import views
-from django.contrib.flatpages import views
 from django.urls import include, path
 from django.conf import settings
 from django.conf.urls.static import static
 
+from .flatpages import flatpage
+
 
 handler404 = "posts.views.page_not_found" # noqa
 handler500 = "posts.views.server_error" # noqa
 
 urlpatterns = [
-    path('about-us/', views.flatpage, {'url': '/about-us/'}, name='about'),
-    path('terms/', views.flatpage, {'url': '/terms/'}, name='terms'),
-    path('about-author/', views.flatpage, {'url': '/about-author/'}, name='about-author'),
-    path('about-spec/', views.flatpage, {'url': '/about-spec/'}, name='about-spec'),
-    path('about/', include('django.contrib.flatpages.urls')),
+    path('about-us/', flatpage, {'url': '/about-us/'}, name='about'),
+    path('terms/', flatpage, {'url': '/terms/'}, name='terms'),
+    path('about-author/', flatpage, {'url': '/about-author/'}, name='about-author'),
+    path('about-spec/', flatpage, {'url': '/about-spec/'}, name='about-spec'),
+    path('about/<path:url>', flatpage),
     path('admin/', admin.site.urls),
     path('auth/', include('users.urls')),
     path('auth/', include('django.contrib.auth.urls')),
@@ -0,0 +1,171 @@
+"""Worker warm-up, run by ``yatube/wsgi.py`` before the first request.
+
+Each step pays one of the costs the first requests of a fresh worker
+would otherwise pay: compiling templates (kept by the cached template
+loader when ``DEBUG`` is off), populating the URL resolver, opening the
+persistent database connections (``CONN_MAX_AGE``) and priming the index
+page, group list and flatpage caches. A failing step is logged and the
+next one runs; the worker still starts.
+
+With ``gunicorn --preload`` the module is imported once in the master,
+so the ``database`` step should also be run in the ``post_fork`` hook:
+``warm_up(steps=['database'])``.
+"""
+import logging
+import os
+import sys
+import time
+from io import BytesIO
+
+from django.conf import settings
+from django.db import connections
+from django.template import engines
+from django.template.utils import get_app_template_dirs
+from django.urls import get_resolver
+
+logger = logging.getLogger(__name__)
+
+WARM_UP_PATHS = ('/',)
+
+
+def template_names():
+    """Names of all ``.html`` templates of the project and the apps."""
+    dirs = list(get_app_template_dirs('templates'))
+    for engine in settings.TEMPLATES:
+        dirs.extend(engine.get('DIRS', []))
+    names = set()
+    for directory in dirs:
+        for root, _, files in os.walk(directory):
+            for name in files:
+                if name.endswith('.html'):
+                    path = os.path.join(root, name)
+                    names.add(os.path.relpath(path, directory))
+    return sorted(names)
+
+
+def load_templates(application):
+    loaded = 0
+    for name in template_names():
+        for engine in engines.all():
+            try:
+                engine.get_template(name)
+            except Exception:
+                # Admin templates of apps that are not installed and such.
+                continue
+            loaded += 1
+    return f'{loaded} templates'
+
+
+def resolve_urls(application):
+    resolver = get_resolver()
+    resolver.reverse('index')
+    return f'{len(resolver.url_patterns)} root patterns'
+
+
+def open_connections(application):
+    for connection in connections.all():
+        connection.ensure_connection()
+    return f'{len(connections.all())} connections'
+
+
+def warm_up_host():
+    """``WARM_UP_HOST``, else the first plain host of ``ALLOWED_HOSTS``.
+
+    Cached pages are keyed by host, so this should be the public one.
+    """
+    host = getattr(settings, 'WARM_UP_HOST', None)
+    if host:
+        return host
+    return next(
+        (host for host in settings.ALLOWED_HOSTS
+         if not host.startswith(('*', '.'))),
+        'localhost',
+        )
+
+
+def request_environ(path):
+    host = warm_up_host()
+    return {
+        'REQUEST_METHOD': 'GET',
+        'PATH_INFO': path,
+        'QUERY_STRING': '',
+        'SERVER_NAME': host.strip('[]'),
+        'HTTP_HOST': host,
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': BytesIO(),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': False,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+        }
+
+
+def prime_pages(application):
+    """Request the hot pages as an anonymous visitor would."""
+    statuses = []
+
+    def start_response(status, headers, exc_info=None):
+        statuses.append(status.split()[0])
+
+    for path in WARM_UP_PATHS:
+        response = application(request_environ(path), start_response)
+        try:
+            for _ in response:
+                pass
+        finally:
+            if hasattr(response, 'close'):
+                response.close()
+    return ', '.join(
+        f'{path} {status}' for path, status in zip(WARM_UP_PATHS, statuses)
+        )
+
+
+def prime_groups(application):
+    from yatube.context_processors import SharedContext
+
+    return f'{len(SharedContext(None).groups)} groups'
+
+
+def prime_flatpages(application):
+    from yatube.flatpages import flatpage_cache
+
+    flatpage_cache.load()
+    return f'{len(flatpage_cache.pages)} flatpages'
+
+
+STEPS = (
+    ('templates', load_templates),
+    ('urls', resolve_urls),
+    ('database', open_connections),
+    ('pages', prime_pages),
+    ('groups', prime_groups),
+    ('flatpages', prime_flatpages),
+    )
+
+
+def warm_up(application=None, steps=None):
+    """Run the warm-up steps; return ``[(step, seconds, result), ...]``.
+
+    ``result`` is a short summary, or ``None`` when the step failed.
+    The ``pages`` step needs the WSGI ``application`` and is skipped
+    without one.
+    """
+    timings = []
+    for name, step in STEPS:
+        if steps is not None and name not in steps:
+            continue
+        if application is None and step is prime_pages:
+            continue
+        started = time.perf_counter()
+        try:
+            result = step(application)
+        except Exception:
+            logger.exception('Warm-up step %s failed', name)
+            result = None
+        seconds = time.perf_counter() - started
+        logger.info('Warm-up %s: %.1f ms, %s', name, seconds * 1000, result)
+        timings.append((name, seconds, result))
+    return timings
@@ -7,10 +7,25 @@ For more information on this file, see
 https://docs.djangoproject.com/en/2.2/howto/deployment/wsgi/
 """
 
+import atexit
 import os
 
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
 
 application = get_wsgi_application()
+
+from posts.viewcounts import view_buffer  # noqa: E402
+
+# Keep buffered post views when the worker is stopped cleanly.
+atexit.register(view_buffer.flush)
+
+if settings.SERVE_STATIC_FILES:
+    from yatube.static import StaticFilesApplication
+    application = StaticFilesApplication(application)
+
+if settings.WARM_UP_ON_BOOT:
+    from yatube.warmup import warm_up
+    warm_up(application)